@@ -1,16 +1,66 @@
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify, abort, g
+from flask import (
+    Flask, Response, make_response, render_template, request, redirect, send_from_directory, url_for,
+    session, jsonify, abort, g
+)
 from functools import wraps
-from datetime import datetime, timedelta
+import click
+from datetime import date, datetime, timedelta
+import io
+import json
+import mimetypes
 import uuid
+import base64
 import random
 import string
-import sqlite3
 import os
+import time
+import sqlite3
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from assets import ASSET_DIST, AssetManifest, build_assets, fetch_vendor
+from data_versions import changes_since, data_version, parse_since, versioned_etag
+from db_pool import ConnectionPool
+from event_buffer import EventBuffer
+from exports import EXPORTS, EXPORT_FORMATS, stream_export
+from inventory_import import ImportFormatError, import_inventory_csv
+from inventory_stream import InventoryHub, StreamUnavailable
+from kpis import LOW_STOCK_MAX, LOW_STOCK_MIN, KpiCache, dashboard_kpis, recount_kpis, set_low_stock_threshold
+from labels import (
+    LABEL_FORMATS, LABEL_LAYOUTS, LabelCache, LabelRendererUnavailable,
+    build_label_geometries, render_sheet_pdf, render_sheet_svg
+)
+from metrics import InstrumentedConnection, RequestMetrics, SqlTally, current_sql, set_slow_query_log
+from migrations import SCHEMA_VERSION, get_schema_version, migrate
+from receipt_archive import ARCHIVE_AFTER_DAYS, ARCHIVE_PERIODS, ArchiveError, ReceiptArchive
+from receipt_render import (
+    RECEIPT_FORMATS, ReceiptCache, ReceiptRendererUnavailable,
+    prerender_receipt, receipt_etag, render_receipt
+)
+import server
+from rollups import REPORT_RANGES, record_sales, rebuild_rollups, sales_series, top_products
+from sku_cache import SkuCache, lookup_skus
+from slow_queries import SlowQueryLog
+from stock_ledger import (
+    MANUAL_MOVEMENT_KINDS, MOVEMENTS_PAGE_SIZE, StockError, StockSnapshotter, apply_movement, list_movements,
+    parse_stock_at, reconcile_stock, record_movements, stock_at, take_snapshot
+)
 
 app = Flask(__name__)
 app.secret_key = "dev-secret-change-me"
 
-DB_PATH = os.path.join(os.path.dirname(__file__), "farmasys.db")
+DB_PATH = os.environ.get("FARMASYS_DB", os.path.join(os.path.dirname(__file__), "farmasys.db"))
+DB_WRITE_POOL_SIZE = int(os.environ.get("FARMASYS_DB_WRITE_POOL_SIZE", 4))
+DB_READ_POOL_SIZE = int(os.environ.get("FARMASYS_DB_READ_POOL_SIZE", 8))
+DB_BUSY_TIMEOUT_MS = int(os.environ.get("FARMASYS_DB_BUSY_TIMEOUT_MS", 5000))
+CACHE_DIR = os.environ.get("FARMASYS_CACHE_DIR", os.path.join(os.path.dirname(__file__), "cache"))
+ARCHIVE_DIR = os.environ.get("FARMASYS_ARCHIVE_DIR", os.path.join(os.path.dirname(DB_PATH), "archive"))
+ARCHIVE_AFTER = int(os.environ.get("FARMASYS_ARCHIVE_AFTER_DAYS", ARCHIVE_AFTER_DAYS))
+LABEL_MAX_PRODUCTS = 20000
+LOG_DIR = os.environ.get("FARMASYS_LOG_DIR", os.path.join(os.path.dirname(__file__), "logs"))
+SLOW_QUERY_MS = float(os.environ.get("FARMASYS_SLOW_QUERY_MS", 100))
+RECEIPT_CACHE_MAX_BYTES = int(os.environ.get("FARMASYS_RECEIPT_CACHE_MAX_BYTES", 64 * 1024 * 1024))
 
 SEED_INVENTORY = [
     {"id": "1", "name": "Paracetamol 500mg", "sku": "750100010001", "stock": 120, "price": 5.50, "expiry": "2026-01-15", "category": "Analgésico"},
@@ -84,72 +134,172 @@ SEED_USERS = [
 ]
 
 
+_pools = {}
+_pools_lock = threading.Lock()
+sku_cache = SkuCache()
+kpi_cache = KpiCache()
+label_cache = LabelCache(os.path.join(CACHE_DIR, "labels"))
+receipt_cache = ReceiptCache(os.path.join(CACHE_DIR, "receipts"), RECEIPT_CACHE_MAX_BYTES)
+receipt_archive = ReceiptArchive(ARCHIVE_DIR)
+receipt_renderer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="receipt-render")
+request_metrics = RequestMetrics()
+event_buffer = EventBuffer(lambda: get_pool())
+stock_snapshots = StockSnapshotter(lambda: get_pool())
+# Un suscriptor por hilo reservado del servidor; FarmasysServer ajusta el
+# máximo a su stream_slots (ver server.SERVER_STREAM_SLOTS)
+inventory_hub = InventoryHub(lambda: get_pool(readonly=True), server.SERVER_STREAM_SLOTS)
+slow_query_log = SlowQueryLog(os.path.join(LOG_DIR, "slow_queries.log"), SLOW_QUERY_MS)
+set_slow_query_log(slow_query_log)
+asset_manifest = AssetManifest(os.path.join(app.static_folder, ASSET_DIST))
+
+
+def get_pool(readonly=False):
+    key = "ro" if readonly else "rw"
+    pool = _pools.get(key)
+    if pool is None:
+        init_db()
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = ConnectionPool(
+                    DB_PATH,
+                    size=DB_READ_POOL_SIZE if readonly else DB_WRITE_POOL_SIZE,
+                    readonly=readonly,
+                    busy_timeout_ms=DB_BUSY_TIMEOUT_MS,
+                    factory=InstrumentedConnection
+                )
+                _pools[key] = pool
+    return pool
+
+
+def close_pools():
+    # Lo pendiente del buffer de eventos se escribe antes de cerrar las conexiones
+    event_buffer.flush()
+    with _pools_lock:
+        # Primero los lectores: la última conexión en cerrarse (rw) hace el checkpoint del WAL
+        for key in ("ro", "rw"):
+            if key in _pools:
+                _pools[key].close()
+        _pools.clear()
+    # Si cambia DB_PATH (pruebas, benchmarks) el esquema se vuelve a verificar
+    global _schema_ready
+    _schema_ready = False
+
+
+atexit.register(close_pools)
+
+
 def get_db():
     if "db" not in g:
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
-        conn.execute("PRAGMA foreign_keys = ON")
-        g.db = conn
+        g.db = get_pool().acquire()
     return g.db
 
 
+# Conexión de solo lectura para vistas y APIs que no escriben; en WAL no
+# compiten con las escrituras de las cajas.
+def get_read_db():
+    if "read_db" not in g:
+        g.read_db = get_pool(readonly=True).acquire()
+    return g.read_db
+
+
 @app.teardown_appcontext
 def close_db(exception):
     conn = g.pop("db", None)
     if conn is not None:
-        conn.close()
+        get_pool().release(conn)
+    conn = g.pop("read_db", None)
+    if conn is not None:
+        get_pool(readonly=True).release(conn)
 
 
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    g.sql_tally = SqlTally(request.endpoint)
+    g.sql_tally_token = current_sql.set(g.sql_tally)
+
+
+@app.after_request
+def record_request_metrics(response):
+    if "request_started" in g:
+        endpoint = request.url_rule.endpoint if request.url_rule else "not_found"
+        request_metrics.record(
+            endpoint, request.method, response.status_code,
+            time.perf_counter() - g.request_started, g.sql_tally
+        )
+        current_sql.reset(g.pop("sql_tally_token"))
+    return response
+
+
+def runtime_stats():
+    return {
+        "pools": {mode: pool.stats() for mode, pool in list(_pools.items())},
+        "caches": {
+            "sku": sku_cache.stats(),
+            "kpi": kpi_cache.stats(),
+            "labels": label_cache.stats(),
+            "receipts": receipt_cache.stats(),
+        },
+        "slow_queries": slow_query_log.stats(),
+        "events": event_buffer.stats(),
+        "stock_snapshots": stock_snapshots.stats(),
+        "stream": inventory_hub.stats(),
+        "assets": asset_manifest.stats(),
+    }
+
+
+def warm_up():
+    # Deja listo lo que necesita la primera petición: esquema, conexiones de
+    # ambos pools, contadores del dashboard y las plantillas más usadas.
+    started = time.perf_counter()
+    for readonly in (False, True):
+        pool = get_pool(readonly=readonly)
+        conn = pool.acquire()
+        try:
+            if readonly:
+                kpi_cache.get(conn)
+        finally:
+            pool.release(conn)
+    # Foto del stock si la última tiene más de un día
+    stock_snapshots.maybe_take(wait=True)
+    if not asset_manifest.built:
+        # Sin red no se descargan librerías: solo se arma static/dist con lo que haya
+        build_assets(app.static_folder)
+    for name in ("base.html", "login.html", "dashboard.html", "sales.html"):
+        app.jinja_env.get_template(name)
+    return time.perf_counter() - started
+
+
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+
+# Se llama antes de abrir el primer pool, no al importar la app. Con el esquema
+# al día (PRAGMA user_version) solo cuesta una consulta: no hay DDL ni seed.
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA foreign_keys = ON")
-    conn.executescript(
-        """
-        CREATE TABLE IF NOT EXISTS users (
-            id TEXT PRIMARY KEY,
-            full_name TEXT NOT NULL,
-            username TEXT NOT NULL UNIQUE,
-            email TEXT NOT NULL UNIQUE,
-            role TEXT NOT NULL,
-            status TEXT NOT NULL,
-            password TEXT NOT NULL,
-            last_login TEXT,
-            can_manage_users INTEGER NOT NULL DEFAULT 0,
-            can_manage_inventory INTEGER NOT NULL DEFAULT 0,
-            can_view_reports INTEGER NOT NULL DEFAULT 0,
-            can_export_data INTEGER NOT NULL DEFAULT 0,
-            created_at TEXT NOT NULL
-        );
-        CREATE TABLE IF NOT EXISTS inventory (
-            id TEXT PRIMARY KEY,
-            name TEXT NOT NULL,
-            sku TEXT NOT NULL UNIQUE,
-            stock INTEGER NOT NULL DEFAULT 0,
-            price REAL NOT NULL DEFAULT 0,
-            expiry TEXT,
-            category TEXT
-        );
-        CREATE TABLE IF NOT EXISTS receipts (
-            id TEXT PRIMARY KEY,
-            datetime TEXT NOT NULL,
-            customer TEXT,
-            payment_method TEXT,
-            subtotal REAL NOT NULL DEFAULT 0,
-            iva REAL NOT NULL DEFAULT 0,
-            total REAL NOT NULL DEFAULT 0
-        );
-        CREATE TABLE IF NOT EXISTS receipt_items (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            receipt_id TEXT NOT NULL,
-            name TEXT NOT NULL,
-            qty INTEGER NOT NULL,
-            price REAL NOT NULL,
-            subtotal REAL NOT NULL,
-            FOREIGN KEY (receipt_id) REFERENCES receipts(id) ON DELETE CASCADE
-        );
-        """
-    )
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if _schema_ready:
+            return
+        conn = sqlite3.connect(DB_PATH, timeout=DB_BUSY_TIMEOUT_MS / 1000)
+        try:
+            conn.row_factory = sqlite3.Row
+            if get_schema_version(conn) < SCHEMA_VERSION:
+                conn.execute("PRAGMA journal_mode = WAL")
+                conn.execute("PRAGMA foreign_keys = ON")
+                _init_schema(conn)
+        finally:
+            conn.close()
+        _schema_ready = True
+
+
+def _init_schema(conn):
+    # Los datos de ejemplo solo se cargan en una base recién creada
+    if 1 not in migrate(conn):
+        return
 
     users_count = conn.execute("SELECT COUNT(*) AS c FROM users").fetchone()["c"]
     if users_count == 0:
@@ -187,31 +337,417 @@ def init_db():
                 for p in SEED_INVENTORY
             ]
         )
+        record_movements(conn, [(p["id"], int(p["stock"])) for p in SEED_INVENTORY], "initial")
 
     conn.commit()
-    conn.close()
 
 
-def get_receipts_with_items(conn):
-    receipts = [dict(r) for r in conn.execute("SELECT * FROM receipts ORDER BY datetime DESC").fetchall()]
-    if not receipts:
-        return []
+RECEIPTS_PAGE_SIZE = 25
+RECEIPTS_MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(*parts):
+    raw = "|".join(str(p) for p in parts).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
 
-    receipt_ids = [r["id"] for r in receipts]
-    placeholders = ",".join("?" for _ in receipt_ids)
-    items_rows = conn.execute(
-        f"SELECT receipt_id, name, qty, price, subtotal FROM receipt_items WHERE receipt_id IN ({placeholders}) ORDER BY id",
-        receipt_ids
-    ).fetchall()
 
+def decode_cursor(cursor, size=2):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+    except (ValueError, UnicodeError):
+        return None
+    parts = raw.rsplit("|", size - 1)
+    if len(parts) != size or not all(parts):
+        return None
+    return tuple(parts)
+
+
+# Paginación por clave (datetime, id): cada página cuesta lo mismo sin importar
+# cuántos recibos haya antes, y solo se cargan los items de la página actual.
+# Con `archive`, los recibos archivados que caen en la página se suman desde
+# los archivos cuyo rango de fechas la alcanza; los demás ni se abren.
+def get_receipts_with_items(conn, limit=RECEIPTS_PAGE_SIZE, cursor=None, date_from=None, date_to=None,
+                            payment_method=None, customer=None, archive=None):
+    where = []
+    params = []
+    upper = None
+    if cursor:
+        where.append("(datetime, id) < (?, ?)")
+        params.extend(cursor)
+        upper = cursor[0]
+    if date_from:
+        where.append("datetime >= ?")
+        params.append(date_from)
+    if date_to:
+        date_upper = (date.fromisoformat(date_to) + timedelta(days=1)).isoformat()
+        where.append("datetime < ?")
+        params.append(date_upper)
+        upper = min(upper, date_upper) if upper else date_upper
+    if payment_method:
+        where.append("payment_method = ?")
+        params.append(payment_method)
+    if customer:
+        where.append("customer LIKE ?")
+        params.append(f"%{customer}%")
+
+    sql = "SELECT * FROM {schema}.receipts"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY datetime DESC, id DESC LIMIT ?"
+    params.append(limit + 1)
+
+    receipts = [dict(r, _schema="main") for r in conn.execute(sql.format(schema="main"), params).fetchall()]
+    attached = {}
+    if archive is not None:
+        # Del archivo más reciente al más viejo; con la página llena, los que
+        # terminan antes de su último recibo ya no pueden aportar nada
+        for a in archive.archives_in_range(conn, date_from, upper):
+            if len(receipts) > limit and a["last_datetime"] < receipts[limit]["datetime"]:
+                break
+            schema = archive.attach(conn, a)
+            attached[schema] = a
+            receipts += [dict(r, _schema=schema) for r in conn.execute(sql.format(schema=schema), params).fetchall()]
+            receipts = sorted(receipts, key=lambda r: (r["datetime"], r["id"]), reverse=True)[:limit + 1]
+
+    next_cursor = None
+    if len(receipts) > limit:
+        receipts = receipts[:limit]
+        next_cursor = encode_cursor(receipts[-1]["datetime"], receipts[-1]["id"])
+    if not receipts:
+        return [], None
+
+    ids_by_schema = {}
+    for r in receipts:
+        ids_by_schema.setdefault(r.pop("_schema"), []).append(r["id"])
     items_by_receipt = {}
-    for it in items_rows:
-        items_by_receipt.setdefault(it["receipt_id"], []).append(dict(it))
+    for schema, receipt_ids in ids_by_schema.items():
+        if schema != "main":
+            # Pudo haberse soltado para adjuntar otro archivo
+            schema = archive.attach(conn, attached[schema])
+        placeholders = ",".join("?" for _ in receipt_ids)
+        items_rows = conn.execute(
+            f"SELECT receipt_id, name, qty, price, subtotal FROM {schema}.receipt_items "
+            f"WHERE receipt_id IN ({placeholders}) ORDER BY id",
+            receipt_ids
+        ).fetchall()
+        for it in items_rows:
+            items_by_receipt.setdefault(it["receipt_id"], []).append(dict(it))
 
     for r in receipts:
         r["items"] = items_by_receipt.get(r["id"], [])
 
-    return receipts
+    return receipts, next_cursor
+
+# ------------------ Búsqueda de inventario ------------------
+INVENTORY_PAGE_SIZE = 50
+INVENTORY_MAX_PAGE_SIZE = 200
+
+
+def fts_query(q):
+    # Cada palabra se busca como prefijo ("amox" encuentra "Amoxicilina") y
+    # todas deben aparecer. Las comillas se escapan para no romper la sintaxis FTS5.
+    terms = [t.replace('"', '""') for t in q.split()]
+    return " ".join(f'"{t}"*' for t in terms if t)
+
+
+def search_inventory(conn, q=None, category=None, low_stock=False, limit=INVENTORY_PAGE_SIZE, cursor=None):
+    where = []
+    params = []
+    match = fts_query(q) if q else ""
+    if match:
+        where.append("rowid IN (SELECT rowid FROM inventory_fts WHERE inventory_fts MATCH ?)")
+        params.append(match)
+    if category:
+        where.append("category = ?")
+        params.append(category)
+    if low_stock:
+        where.append("stock <= (SELECT low_stock_threshold FROM kpi_counters WHERE id = 1)")
+    if cursor:
+        where.append("(name, id) > (?, ?)")
+        params.extend(cursor)
+
+    sql = "SELECT * FROM inventory"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY name, id LIMIT ?"
+    params.append(limit + 1)
+
+    items = [dict(r) for r in conn.execute(sql, params).fetchall()]
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(items[-1]["name"], items[-1]["id"])
+    return items, next_cursor
+
+
+def rebuild_search_index(conn):
+    conn.execute("INSERT INTO inventory_fts(inventory_fts) VALUES ('rebuild')")
+    conn.commit()
+
+
+# ------------------ Checkout ------------------
+CHECKOUT_MAX_ATTEMPTS = 5
+CHECKOUT_BACKOFF_BASE = 0.02
+CHECKOUT_BACKOFF_MAX = 0.5
+CHECKOUT_BATCH_MAX_CARTS = 1000
+CHECKOUT_BATCH_CHUNK = 100
+
+
+class CheckoutError(Exception):
+    pass
+
+
+def is_lock_error(exc):
+    msg = str(exc).lower()
+    return "locked" in msg or "busy" in msg
+
+
+def with_lock_retry(fn, *args):
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            return fn(*args)
+        except sqlite3.OperationalError as e:
+            if not is_lock_error(e) or attempt >= CHECKOUT_MAX_ATTEMPTS:
+                raise
+            delay = min(CHECKOUT_BACKOFF_MAX, CHECKOUT_BACKOFF_BASE * (2 ** (attempt - 1)))
+            time.sleep(delay * (0.5 + random.random() / 2))
+
+
+def parse_cart_items(items):
+    if not items:
+        raise CheckoutError("El carrito está vacío")
+
+    qty_by_id = {}
+    for it in items:
+        pid = str(it.get("id", "")).strip()
+        if not pid:
+            continue
+        try:
+            qty = int(it.get("qty", 0))
+        except (TypeError, ValueError):
+            raise CheckoutError("Cantidad inválida")
+        if qty <= 0:
+            raise CheckoutError("Cantidad inválida")
+        qty_by_id[pid] = qty_by_id.get(pid, 0) + qty
+
+    if not qty_by_id:
+        raise CheckoutError("El carrito está vacío")
+    return qty_by_id
+
+
+def price_cart(products_by_id, qty_by_id):
+    receipt_items = []
+    subtotal = 0.0
+    for pid, qty in qty_by_id.items():
+        product = products_by_id[pid]
+        price = float(product["price"])
+        line_total = round(price * qty, 2)
+        subtotal += line_total
+        receipt_items.append({
+            "product_id": pid,
+            "sku": product["sku"],
+            "name": product["name"],
+            "category": product["category"],
+            "qty": qty,
+            "price": price,
+            "subtotal": line_total
+        })
+    iva = round(subtotal * 0.16, 2)
+    total = round(subtotal + iva, 2)
+    return receipt_items, subtotal, iva, total
+
+
+def fetch_products(conn, pids):
+    placeholders = ",".join("?" for _ in pids)
+    rows = conn.execute(
+        f"SELECT id, name, sku, stock, price, category FROM inventory WHERE id IN ({placeholders})",
+        list(pids)
+    ).fetchall()
+    return {p["id"]: p for p in rows}
+
+
+def insert_receipts(conn, sales):
+    conn.executemany(
+        """
+        INSERT INTO receipts (id, datetime, sale_date, customer, payment_method, subtotal, iva, total)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        [
+            (
+                sale["receipt_id"], sale["datetime"], sale["sale_date"], sale["customer"],
+                sale["payment_method"], sale["subtotal"], sale["iva"], sale["total"]
+            )
+            for sale in sales
+        ]
+    )
+    conn.executemany(
+        """
+        INSERT INTO receipt_items (receipt_id, product_id, sku, name, qty, price, subtotal)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+        [
+            (sale["receipt_id"], it["product_id"], it["sku"], it["name"], it["qty"], it["price"], it["subtotal"])
+            for sale in sales
+            for it in sale["items"]
+        ]
+    )
+    record_sales(conn, sales)
+
+
+def _checkout_once(conn, qty_by_id, customer, payment_method):
+    # BEGIN IMMEDIATE toma el bloqueo de escritura antes de leer el stock, así
+    # dos cajas no pueden validar a la vez las mismas últimas unidades.
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        products_by_id = fetch_products(conn, qty_by_id)
+        if len(products_by_id) != len(qty_by_id):
+            raise CheckoutError("Producto no encontrado")
+
+        for pid, qty in qty_by_id.items():
+            res = conn.execute(
+                "UPDATE inventory SET stock = stock - ? WHERE id = ? AND stock >= ?",
+                (qty, pid, qty)
+            )
+            if res.rowcount != 1:
+                product = products_by_id[pid]
+                raise CheckoutError(
+                    f"Stock insuficiente de {product['name']}. Disponible: {product['stock']}"
+                )
+
+        receipt_items, subtotal, iva, total = price_cart(products_by_id, qty_by_id)
+        now = datetime.now()
+        sale = {
+            "receipt_id": str(uuid.uuid4()),
+            "datetime": now.isoformat(),
+            "sale_date": now.date().isoformat(),
+            "customer": customer,
+            "payment_method": payment_method,
+            "subtotal": subtotal,
+            "iva": iva,
+            "total": total,
+            "items": receipt_items
+        }
+        insert_receipts(conn, [sale])
+        record_movements(conn, [(pid, -qty) for pid, qty in qty_by_id.items()], "sale", ref=sale["receipt_id"])
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    return sale
+
+
+def run_checkout(conn, qty_by_id, customer="", payment_method="cash"):
+    sale = with_lock_retry(_checkout_once, conn, qty_by_id, customer, payment_method)
+    sku_cache.invalidate_ids(qty_by_id)
+    inventory_hub.notify()
+    stock_snapshots.maybe_take()
+    return sale
+
+
+def _checkout_chunk_once(conn, carts):
+    results = {}
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        keys = [c["key"] for c in carts]
+        placeholders = ",".join("?" for _ in keys)
+        seen = {
+            r["key"]: r for r in conn.execute(
+                f"SELECT key, receipt_id, total FROM checkout_idempotency WHERE key IN ({placeholders})",
+                keys
+            ).fetchall()
+        }
+
+        pids = {pid for c in carts for pid in c["qty_by_id"]}
+        products_by_id = fetch_products(conn, pids)
+        stock = {pid: p["stock"] for pid, p in products_by_id.items()}
+
+        sales = []
+        decrements = {}
+        for cart in carts:
+            key = cart["key"]
+            if key in seen:
+                prev = seen[key]
+                results[key] = {
+                    "ok": True, "duplicate": True,
+                    "receipt_id": prev["receipt_id"], "total": prev["total"]
+                }
+                continue
+
+            qty_by_id = cart["qty_by_id"]
+            missing = [pid for pid in qty_by_id if pid not in products_by_id]
+            if missing:
+                results[key] = {"ok": False, "error": "Producto no encontrado"}
+                continue
+            short = next((pid for pid, qty in qty_by_id.items() if stock[pid] < qty), None)
+            if short is not None:
+                results[key] = {
+                    "ok": False,
+                    "error": f"Stock insuficiente de {products_by_id[short]['name']}. Disponible: {stock[short]}"
+                }
+                continue
+
+            for pid, qty in qty_by_id.items():
+                stock[pid] -= qty
+                decrements[pid] = decrements.get(pid, 0) + qty
+
+            receipt_items, subtotal, iva, total = price_cart(products_by_id, qty_by_id)
+            sale_dt = cart["datetime"]
+            sale = {
+                "key": key,
+                "receipt_id": str(uuid.uuid4()),
+                "datetime": sale_dt.isoformat(),
+                "sale_date": sale_dt.date().isoformat(),
+                "customer": cart["customer"],
+                "payment_method": cart["payment_method"],
+                "subtotal": subtotal,
+                "iva": iva,
+                "total": total,
+                "items": receipt_items
+            }
+            sales.append(sale)
+            seen[key] = {"receipt_id": sale["receipt_id"], "total": total}
+            results[key] = {"ok": True, "duplicate": False, "receipt_id": sale["receipt_id"], "total": total}
+
+        if decrements:
+            res = conn.executemany(
+                "UPDATE inventory SET stock = stock - ? WHERE id = ? AND stock >= ?",
+                [(qty, pid, qty) for pid, qty in decrements.items()]
+            )
+            if res.rowcount != len(decrements):
+                raise RuntimeError("El stock cambió durante la sincronización del lote")
+
+        if sales:
+            insert_receipts(conn, sales)
+            for sale in sales:
+                record_movements(
+                    conn, [(it["product_id"], -it["qty"]) for it in sale["items"]], "sale", ref=sale["receipt_id"]
+                )
+            created_at = datetime.now().isoformat()
+            conn.executemany(
+                "INSERT INTO checkout_idempotency (key, receipt_id, total, created_at) VALUES (?, ?, ?, ?)",
+                [(sale["key"], sale["receipt_id"], sale["total"], created_at) for sale in sales]
+            )
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return results
+
+
+def run_checkout_batch(conn, carts):
+    results = {}
+    for start in range(0, len(carts), CHECKOUT_BATCH_CHUNK):
+        chunk = carts[start:start + CHECKOUT_BATCH_CHUNK]
+        results.update(with_lock_retry(_checkout_chunk_once, conn, chunk))
+        sku_cache.invalidate_ids({pid for cart in chunk for pid in cart["qty_by_id"]})
+    inventory_hub.notify()
+    stock_snapshots.maybe_take()
+    return results
 
 # ------------------ Auth ------------------
 def login_required(f):
@@ -222,6 +758,9 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def current_username():
+    return session.get("user", {}).get("username")
+
 def admin_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -233,6 +772,23 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def permission_required(flag, message="No tiene permiso para esta acción"):
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            user = session.get("user", {})
+            if not user:
+                return redirect(url_for("login", next=request.path))
+            row = get_read_db().execute(
+                f"SELECT {flag} FROM users WHERE username = ? AND status = 'active'",
+                (user.get("username"),)
+            ).fetchone()
+            if not row or not row[flag]:
+                return jsonify({"ok": False, "error": message}), 403
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
 @app.route("/login", methods=["GET", "POST"])
 def login():
     error = None
@@ -240,8 +796,7 @@ def login():
         username = request.form.get("username", "").strip()
         password = request.form.get("password", "").strip()
         
-        conn = get_db()
-        row = conn.execute(
+        row = get_read_db().execute(
             "SELECT * FROM users WHERE username = ? AND status = 'active'",
             (username,)
         ).fetchone()
@@ -253,11 +808,8 @@ def login():
                 "email": row["email"],
                 "role": row["role"]
             }
-            conn.execute(
-                "UPDATE users SET last_login = ? WHERE id = ?",
-                (datetime.now().isoformat(), row["id"])
-            )
-            conn.commit()
+            event_buffer.record_login(row["id"])
+            event_buffer.audit("login", row["username"], "user", row["id"])
             return redirect(url_for("dashboard"))
 
         error = "Credenciales inválidas. Usa admin / 123 para probar."
@@ -272,101 +824,69 @@ def logout():
 @app.route("/")
 @login_required
 def dashboard():
-    conn = get_db()
-    total_items = conn.execute("SELECT COALESCE(SUM(stock), 0) AS total FROM inventory").fetchone()["total"]
-    low_stock = conn.execute("SELECT COUNT(*) AS c FROM inventory WHERE stock <= 10").fetchone()["c"]
-    today = datetime.now().date().isoformat()
-    today_sales = conn.execute(
-        "SELECT COALESCE(SUM(total), 0) AS total FROM receipts WHERE substr(datetime, 1, 10) = ?",
-        (today,)
-    ).fetchone()["total"]
-    receipts_count = conn.execute("SELECT COUNT(*) AS c FROM receipts").fetchone()["c"]
-    return render_template(
-        "dashboard.html",
-        total_items=total_items,
-        low_stock=low_stock,
-        today_sales=today_sales,
-        receipts_count=receipts_count
-    )
+    kpis = dashboard_kpis(kpi_cache.get(get_read_db()))
+    return render_template("dashboard.html", **kpis)
 
 @app.route("/inventory")
 @login_required
 def inventory():
-    return render_template("inventory.html")
+    kpis = kpi_cache.get(get_read_db())
+    return render_template("inventory.html", low_stock_threshold=kpis["low_stock_threshold"])
 
 @app.route("/sales")
 @login_required
 def sales():
-    conn = get_db()
-    products = [dict(p) for p in conn.execute("SELECT * FROM inventory ORDER BY name").fetchall()]
-    return render_template("sales.html", products=products)
+    return render_template("sales.html")
 
 @app.route("/receipts")
 @login_required
 def receipts():
-    conn = get_db()
-    receipts_list = get_receipts_with_items(conn)
-    return render_template("receipts.html", receipts=receipts_list)
+    return render_template("receipts.html")
 
 @app.route("/reports")
 @login_required
 def reports():
-    conn = get_db()
+    conn = get_read_db()
 
-    last7 = {}
-    for i in range(6, -1, -1):
-        d = (datetime.now().date() - timedelta(days=i)).isoformat()
-        last7.setdefault(d, 0)
+    days = request.args.get("days", 7, type=int)
+    if days not in REPORT_RANGES:
+        days = 7
+    category = request.args.get("category", "").strip() or None
 
-    start_date = (datetime.now().date() - timedelta(days=6)).isoformat()
-    rows = conn.execute(
-        """
-        SELECT substr(datetime, 1, 10) AS d, SUM(total) AS total
-        FROM receipts
-        WHERE datetime >= ?
-        GROUP BY d
-        """,
-        (start_date,)
-    ).fetchall()
-
-    for row in rows:
-        last7[row["d"]] = row["total"] or 0
-
-    labels = list(sorted(last7.keys()))
-    values = [last7[k] for k in labels]
-
-    top_rows = conn.execute(
-        """
-        SELECT name, SUM(qty) AS qty
-        FROM receipt_items
-        GROUP BY name
-        ORDER BY qty DESC
-        LIMIT 5
-        """
-    ).fetchall()
+    labels, values = sales_series(conn, days, category)
+    top_rows = top_products(conn, days, category)
 
     top_labels = [r["name"] for r in top_rows]
     top_values = [r["qty"] for r in top_rows]
 
+    categories = [
+        r["category"] for r in conn.execute(
+            "SELECT DISTINCT category FROM inventory WHERE category IS NOT NULL AND category != '' ORDER BY category"
+        ).fetchall()
+    ]
+
     return render_template(
         "reports.html",
         labels=labels,
         values=values,
         top_labels=top_labels,
-        top_values=top_values
+        top_values=top_values,
+        days=days,
+        ranges=REPORT_RANGES,
+        category=category or "",
+        categories=categories
     )
 
 @app.route("/settings")
 @login_required
 def settings():
-    return render_template("settings.html")
+    kpis = kpi_cache.get(get_read_db())
+    return render_template("settings.html", low_stock_threshold=kpis["low_stock_threshold"])
 
 @app.route("/barcodes")
 @login_required
 def barcodes():
-    conn = get_db()
-    products = [dict(p) for p in conn.execute("SELECT * FROM inventory ORDER BY name").fetchall()]
-    return render_template("barcodes.html", products=products)
+    return render_template("barcodes.html")
 
 # ------------------ Gestión de Usuarios ------------------
 @app.route("/users")
@@ -380,18 +900,51 @@ def users():
 @login_required
 @admin_required
 def api_get_users():
-    conn = get_db()
-    rows = conn.execute("SELECT * FROM users ORDER BY created_at DESC").fetchall()
-    safe_users = []
-    for row in rows:
-        user = dict(row)
-        user.pop("password", None)
-        user["can_manage_users"] = bool(user["can_manage_users"])
-        user["can_manage_inventory"] = bool(user["can_manage_inventory"])
-        user["can_view_reports"] = bool(user["can_view_reports"])
-        user["can_export_data"] = bool(user["can_export_data"])
-        safe_users.append(user)
-    return jsonify(safe_users)
+    conn = get_read_db()
+    since = None
+    if "since" in request.args:
+        try:
+            since = parse_since(request.args["since"])
+        except ValueError as e:
+            return jsonify({"ok": False, "error": str(e)}), 400
+
+    version = data_version(conn, "users")
+    if since is not None and since > version:
+        return jsonify({"ok": False, "error": "La versión pedida es posterior a la actual; recargue la lista completa"}), 409
+
+    def build():
+        if since is not None:
+            users, deleted = changes_since(conn, "users", since)
+            return jsonify({
+                "ok": True, "version": version, "since": since,
+                "items": [safe_user(u) for u in users], "deleted": deleted
+            })
+        rows = conn.execute("SELECT * FROM users ORDER BY created_at DESC").fetchall()
+        return jsonify([safe_user(dict(row)) for row in rows])
+
+    return versioned_response(versioned_etag("users", version, since), version, build)
+
+
+def safe_user(user):
+    user.pop("password", None)
+    user["can_manage_users"] = bool(user["can_manage_users"])
+    user["can_manage_inventory"] = bool(user["can_manage_inventory"])
+    user["can_view_reports"] = bool(user["can_view_reports"])
+    user["can_export_data"] = bool(user["can_export_data"])
+    return user
+
+
+def versioned_response(etag, version, build):
+    # Si el cliente ya tiene esta versión se responde 304 sin leer las filas.
+    # no-cache: el navegador guarda la respuesta pero la revalida en cada fetch().
+    if request.if_none_match.contains(etag):
+        resp = Response(status=304)
+    else:
+        resp = make_response(build())
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "private, no-cache"
+    resp.headers["X-Data-Version"] = str(version)
+    return resp
 
 @app.post("/api/users")
 @login_required
@@ -460,6 +1013,8 @@ def api_add_user():
         )
     )
     conn.commit()
+    event_buffer.audit("user_created", current_username(), "user", new_user["id"],
+                       username=username, role=role)
 
     safe_user = new_user.copy()
     safe_user.pop("password", None)
@@ -519,6 +1074,8 @@ def api_update_user(user_id):
         )
     )
     conn.commit()
+    event_buffer.audit("user_updated", current_username(), "user", user_id,
+                       fields=sorted(k for k in data if k != "password"), password_changed=bool(new_password))
 
     updated = conn.execute("SELECT * FROM users WHERE id = ?", (user_id,)).fetchone()
     safe_user = dict(updated)
@@ -540,6 +1097,8 @@ def api_delete_user(user_id):
     conn = get_db()
     res = conn.execute("DELETE FROM users WHERE id = ?", (user_id,))
     conn.commit()
+    if res.rowcount:
+        event_buffer.audit("user_deleted", current_username(), "user", user_id)
     return jsonify({"ok": True, "deleted": res.rowcount})
 
 @app.put("/api/users/<user_id>/toggle-status")
@@ -557,6 +1116,7 @@ def api_toggle_user_status(user_id):
     new_status = "active" if user["status"] == "inactive" else "inactive"
     conn.execute("UPDATE users SET status = ? WHERE id = ?", (new_status, user_id))
     conn.commit()
+    event_buffer.audit("user_toggled", current_username(), "user", user_id, status=new_status)
 
     updated = conn.execute("SELECT * FROM users WHERE id = ?", (user_id,)).fetchone()
     safe_user = dict(updated)
@@ -580,6 +1140,7 @@ def api_reset_password(user_id):
     new_password = ''.join(random.choices(string.ascii_letters + string.digits, k=8))
     conn.execute("UPDATE users SET password = ? WHERE id = ?", (new_password, user_id))
     conn.commit()
+    event_buffer.audit("password_reset", current_username(), "user", user_id)
 
     email = request.json.get("email", user["email"]) if request.json else user["email"]
 
@@ -589,13 +1150,152 @@ def api_reset_password(user_id):
         "debug_password": new_password
     })
 
+AUDIT_PAGE_SIZE = 50
+
+@app.get("/api/audit")
+@login_required
+@admin_required
+def api_audit_log():
+    limit = min(max(request.args.get("limit", AUDIT_PAGE_SIZE, type=int), 1), 500)
+    where = []
+    params = []
+    for arg in ("action", "actor", "target_type", "target_id"):
+        value = request.args.get(arg, "").strip()
+        if value:
+            where.append(f"{arg} = ?")
+            params.append(value)
+    before = request.args.get("before", type=int)
+    if before:
+        where.append("id < ?")
+        params.append(before)
+
+    sql = "SELECT * FROM audit_log"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY id DESC LIMIT ?"
+    params.append(limit)
+
+    events = [dict(r) for r in get_read_db().execute(sql, params).fetchall()]
+    for e in events:
+        e["details"] = json.loads(e["details"]) if e["details"] else {}
+    return jsonify({
+        "ok": True,
+        "events": events,
+        "next_before": events[-1]["id"] if len(events) == limit else None,
+        "pending": event_buffer.stats()["pending"]
+    })
+
 # ------------------ API-ish endpoints for demo CRUD ------------------
 @app.get("/api/inventory")
 @login_required
 def api_get_inventory():
-    conn = get_db()
-    rows = conn.execute("SELECT * FROM inventory ORDER BY name").fetchall()
-    return jsonify([dict(r) for r in rows])
+    try:
+        limit = int(request.args.get("limit", INVENTORY_PAGE_SIZE))
+    except ValueError:
+        return jsonify({"ok": False, "error": "Límite inválido"}), 400
+    limit = max(1, min(limit, INVENTORY_MAX_PAGE_SIZE))
+
+    cursor = None
+    raw_cursor = request.args.get("cursor", "").strip()
+    if raw_cursor:
+        cursor = decode_cursor(raw_cursor)
+        if cursor is None:
+            return jsonify({"ok": False, "error": "Cursor inválido"}), 400
+
+    q = request.args.get("q", "").strip() or None
+    category = request.args.get("category", "").strip() or None
+    low_stock = request.args.get("low_stock", "").lower() in ("1", "true", "yes")
+    since = None
+    if "since" in request.args:
+        # El delta es de toda la tabla; los filtros se aplican en el cliente
+        if q or category or low_stock or cursor:
+            return jsonify({"ok": False, "error": "since no se combina con filtros ni cursor"}), 400
+        try:
+            since = parse_since(request.args["since"])
+        except ValueError as e:
+            return jsonify({"ok": False, "error": str(e)}), 400
+
+    conn = get_read_db()
+    version = data_version(conn, "inventory")
+    if since is not None and since > version:
+        return jsonify({"ok": False, "error": "La versión pedida es posterior a la actual; recargue la lista completa"}), 409
+    etag_parts = [version, since]
+    if low_stock:
+        # El umbral de stock bajo cambia el resultado sin tocar inventory
+        threshold = conn.execute("SELECT low_stock_threshold FROM kpi_counters WHERE id = 1").fetchone()[0]
+        etag_parts.append(f"t{threshold}")
+
+    def build():
+        if since is not None:
+            items, deleted = changes_since(conn, "inventory", since)
+            return jsonify({"ok": True, "version": version, "since": since, "items": items, "deleted": deleted})
+        items, next_cursor = search_inventory(
+            conn, q=q, category=category, low_stock=low_stock, limit=limit, cursor=cursor
+        )
+        return jsonify({"ok": True, "items": items, "next_cursor": next_cursor, "version": version})
+
+    return versioned_response(versioned_etag("inventory", *etag_parts), version, build)
+
+# Búsqueda exacta por código para el escáner: se resuelve desde la caché en
+# memoria y solo consulta la base (índice único de sku) cuando no está.
+@app.get("/api/inventory/by-sku/<path:sku>")
+@login_required
+def api_get_product_by_sku(sku):
+    sku = sku.strip()
+    item = lookup_skus(get_read_db, sku_cache, [sku]).get(sku)
+    if item is None:
+        return jsonify({"ok": False, "error": "Producto no encontrado"}), 404
+    return jsonify({"ok": True, "item": item})
+
+@app.post("/api/inventory/by-sku")
+@login_required
+def api_get_products_by_sku():
+    data = request.json or {}
+    skus = data.get("skus")
+    if not isinstance(skus, list) or not skus:
+        return jsonify({"ok": False, "error": "Debe indicar al menos un SKU"}), 400
+    if len(skus) > INVENTORY_MAX_PAGE_SIZE:
+        return jsonify({"ok": False, "error": f"Máximo {INVENTORY_MAX_PAGE_SIZE} SKU por consulta"}), 400
+
+    skus = list(dict.fromkeys(str(s).strip() for s in skus if str(s).strip()))
+    found = lookup_skus(get_read_db, sku_cache, skus)
+    return jsonify({
+        "ok": True,
+        "items": found,
+        "missing": [s for s in skus if s not in found]
+    })
+
+@app.get("/api/inventory/categories")
+@login_required
+def api_get_inventory_categories():
+    conn = get_read_db()
+    rows = conn.execute(
+        "SELECT DISTINCT category FROM inventory WHERE category IS NOT NULL AND category != '' ORDER BY category"
+    ).fetchall()
+    return jsonify([r["category"] for r in rows])
+
+# Cambios de stock y precio en vivo (Server-Sent Events) para las pantallas de
+# venta e inventario. El cursor es la "version" de /api/inventory; al
+# reconectar, EventSource lo manda solo en Last-Event-ID. El stream no retiene
+# conexiones de los pools: solo lee el hilo vigía de inventory_hub.
+@app.get("/api/inventory/stream")
+@login_required
+def api_inventory_stream():
+    raw = request.headers.get("Last-Event-ID") or request.args.get("cursor")
+    cursor = None
+    if raw:
+        try:
+            cursor = parse_since(raw)
+        except ValueError as e:
+            return jsonify({"ok": False, "error": str(e)}), 400
+    try:
+        events = inventory_hub.subscribe(cursor)
+    except StreamUnavailable as e:
+        return jsonify({"ok": False, "error": str(e)}), 503, {"Retry-After": "10"}
+    return Response(events, mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
 
 @app.post("/api/inventory")
 @login_required
@@ -628,173 +1328,509 @@ def api_add_product():
             item["expiry"], item["category"]
         )
     )
+    record_movements(conn, [(item["id"], item["stock"])], "initial", actor=current_username())
     conn.commit()
+    inventory_hub.notify()
+    event_buffer.audit("product_created", current_username(), "product", item["id"],
+                       sku=item["sku"], stock=item["stock"])
 
     return jsonify({"ok": True, "item": item})
 
+@app.post("/api/inventory/import")
+@login_required
+@permission_required("can_manage_inventory", "No tiene permiso para modificar el inventario")
+def api_import_inventory():
+    upload = request.files.get("file")
+    raw = upload.stream if upload else request.stream
+    text_stream = io.TextIOWrapper(raw, encoding="utf-8-sig", newline="")
+
+    conn = get_db()
+    try:
+        report = import_inventory_csv(conn, text_stream, actor=current_username())
+    except ImportFormatError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    except UnicodeDecodeError:
+        return jsonify({"ok": False, "error": "El archivo debe estar en UTF-8"}), 400
+    finally:
+        sku_cache.invalidate_all()
+        inventory_hub.notify()
+
+    event_buffer.audit("inventory_imported", current_username(), "inventory", None,
+                       rows=report["rows"], inserted=report["inserted"], updated=report["updated"])
+    return jsonify({"ok": True, **report})
+
 @app.put("/api/inventory/<pid>")
 @login_required
 def api_update_product(pid):
     data = request.json or {}
-    conn = get_db()
-
-    existing = conn.execute("SELECT * FROM inventory WHERE id = ?", (pid,)).fetchone()
-    if not existing:
-        abort(404)
+    # El stock se edita con "stock_delta", que se suma al valor vigente y no pisa
+    # las ventas hechas mientras el formulario estaba abierto. "stock" (absoluto)
+    # se sigue aceptando; en ambos casos el libro registra la diferencia.
+    try:
+        stock_delta = int(data["stock_delta"]) if "stock_delta" in data else None
+    except (TypeError, ValueError):
+        return jsonify({"ok": False, "error": "stock_delta inválido"}), 400
+    reason = data.get("stock_reason", "adjustment")
+    if reason not in MANUAL_MOVEMENT_KINDS:
+        return jsonify({"ok": False, "error": f"stock_reason debe ser uno de: {', '.join(MANUAL_MOVEMENT_KINDS)}"}), 400
 
-    new_sku = data.get("sku", existing["sku"]).strip()
-    if new_sku != existing["sku"] and conn.execute(
-        "SELECT 1 FROM inventory WHERE sku = ? AND id != ?",
-        (new_sku, pid)
-    ).fetchone():
-        return jsonify({"ok": False, "error": "El SKU ya existe"}), 400
+    conn = get_db()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        existing = conn.execute("SELECT * FROM inventory WHERE id = ?", (pid,)).fetchone()
+        if not existing:
+            abort(404)
+
+        error = None
+        new_sku = data.get("sku", existing["sku"]).strip()
+        if stock_delta is not None:
+            new_stock = existing["stock"] + stock_delta
+        else:
+            new_stock = int(data.get("stock", existing["stock"]))
+        if new_sku != existing["sku"] and conn.execute(
+            "SELECT 1 FROM inventory WHERE sku = ? AND id != ?",
+            (new_sku, pid)
+        ).fetchone():
+            error = "El SKU ya existe"
+        elif new_stock < 0:
+            error = f"El stock no puede quedar negativo. Disponible: {existing['stock']}"
+        if error:
+            conn.rollback()
+            return jsonify({"ok": False, "error": error}), 400
 
-    conn.execute(
-        """
-        UPDATE inventory
-        SET name = ?, sku = ?, stock = ?, price = ?, expiry = ?, category = ?
-        WHERE id = ?
-        """,
-        (
-            data.get("name", existing["name"]),
-            new_sku,
-            int(data.get("stock", existing["stock"])),
-            float(data.get("price", existing["price"])),
-            data.get("expiry", existing["expiry"]),
-            data.get("category", existing["category"]),
-            pid
+        conn.execute(
+            """
+            UPDATE inventory
+            SET name = ?, sku = ?, stock = ?, price = ?, expiry = ?, category = ?
+            WHERE id = ?
+            """,
+            (
+                data.get("name", existing["name"]),
+                new_sku,
+                new_stock,
+                float(data.get("price", existing["price"])),
+                data.get("expiry", existing["expiry"]),
+                data.get("category", existing["category"]),
+                pid
+            )
         )
-    )
-    conn.commit()
+        record_movements(
+            conn, [(pid, new_stock - existing["stock"])], reason,
+            actor=current_username(), note=data.get("stock_note")
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    sku_cache.invalidate_ids([pid])
+    inventory_hub.notify()
 
     updated = conn.execute("SELECT * FROM inventory WHERE id = ?", (pid,)).fetchone()
+    changes = {
+        k: [existing[k], updated[k]] for k in ("name", "sku", "stock", "price", "expiry", "category")
+        if existing[k] != updated[k]
+    }
+    if "stock" in changes:
+        event_buffer.audit("stock_changed", current_username(), "product", pid,
+                           old=existing["stock"], new=updated["stock"])
+    if changes.keys() - {"stock"}:
+        event_buffer.audit("product_updated", current_username(), "product", pid,
+                           changes={k: v for k, v in changes.items() if k != "stock"})
     return jsonify({"ok": True, "item": dict(updated)})
 
 @app.delete("/api/inventory/<pid>")
 @login_required
 def api_delete_product(pid):
     conn = get_db()
-    res = conn.execute("DELETE FROM inventory WHERE id = ?", (pid,))
-    conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute("SELECT stock FROM inventory WHERE id = ?", (pid,)).fetchone()
+        res = conn.execute("DELETE FROM inventory WHERE id = ?", (pid,))
+        if row is not None:
+            # El saldo del producto queda en 0 en el libro
+            record_movements(
+                conn, [(pid, -row["stock"])], "adjustment", actor=current_username(), note="Producto eliminado"
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    sku_cache.invalidate_ids([pid])
+    inventory_hub.notify()
+    if res.rowcount:
+        event_buffer.audit("product_deleted", current_username(), "product", pid)
     return jsonify({"ok": True, "deleted": res.rowcount})
 
+@app.post("/api/inventory/<pid>/movements")
+@login_required
+@permission_required("can_manage_inventory", "No tiene permiso para modificar el inventario")
+def api_add_stock_movement(pid):
+    data = request.json or {}
+    try:
+        qty = int(data.get("qty"))
+    except (TypeError, ValueError):
+        return jsonify({"ok": False, "error": "Cantidad inválida"}), 400
+    note = (data.get("note") or "").strip() or None
+
+    conn = get_db()
+    try:
+        stock = apply_movement(conn, pid, qty, data.get("kind", "adjustment"), current_username(), note)
+    except StockError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    if stock is None:
+        return jsonify({"ok": False, "error": "Producto no encontrado"}), 404
+
+    sku_cache.invalidate_ids([pid])
+    inventory_hub.notify()
+    event_buffer.audit("stock_changed", current_username(), "product", pid,
+                       old=stock - qty, new=stock, kind=data.get("kind", "adjustment"))
+    return jsonify({"ok": True, "stock": stock})
+
+@app.get("/api/inventory/<pid>/movements")
+@login_required
+def api_stock_movements(pid):
+    limit = min(max(request.args.get("limit", MOVEMENTS_PAGE_SIZE, type=int), 1), 500)
+    items = list_movements(get_read_db(), pid, request.args.get("before", type=int), limit)
+    return jsonify({
+        "ok": True,
+        "items": items,
+        "next_before": items[-1]["id"] if len(items) == limit else None
+    })
+
+@app.get("/api/inventory/stock-at")
+@login_required
+def api_stock_at():
+    try:
+        at = parse_stock_at(request.args.get("at"))
+    except StockError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    ids = request.args.getlist("id") or None
+
+    conn = get_read_db()
+    snapshot, stock = stock_at(conn, at, ids)
+    if snapshot is None:
+        return jsonify({"ok": False, "error": "No hay registro de stock para esa fecha"}), 404
+    if ids is None:
+        ids = [pid for pid, qty in stock.items() if qty]
+        names = dict(conn.execute("SELECT id, name FROM inventory").fetchall())
+    else:
+        names = dict(conn.execute(
+            f"SELECT id, name FROM inventory WHERE id IN ({','.join('?' for _ in ids)})", ids
+        ).fetchall())
+    return jsonify({
+        "ok": True,
+        "at": at,
+        "snapshot_at": snapshot["taken_at"],
+        "items": [{"id": pid, "name": names.get(pid), "stock": stock.get(pid, 0)} for pid in ids]
+    })
+
 @app.post("/api/checkout")
 @login_required
 def api_checkout():
     data = request.json or {}
-    items = data.get("items", [])
 
-    if not items:
-        return jsonify({"ok": False, "error": "El carrito está vacío"}), 400
+    try:
+        qty_by_id = parse_cart_items(data.get("items", []))
+    except CheckoutError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
 
-    qty_by_id = {}
-    for it in items:
-        pid = str(it.get("id", "")).strip()
-        if not pid:
+    conn = get_db()
+    try:
+        result = run_checkout(conn, qty_by_id, data.get("customer", ""), data.get("payment_method", "cash"))
+    except CheckoutError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    except sqlite3.OperationalError as e:
+        if not is_lock_error(e):
+            raise
+        return jsonify({"ok": False, "error": "La base de datos está ocupada, intente de nuevo"}), 503
+
+    schedule_receipt_render(result)
+    return jsonify({
+        "ok": True,
+        "receipt_id": result["receipt_id"],
+        "total": result["total"],
+        "message": "Venta procesada exitosamente"
+    })
+
+# Sincronización de ventas encoladas por terminales que trabajaron sin conexión.
+# Cada carrito trae una idempotency_key generada por la terminal: reenviar el
+# mismo lote devuelve los recibos ya creados sin volver a descontar stock.
+@app.post("/api/checkout/batch")
+@login_required
+def api_checkout_batch():
+    data = request.json or {}
+    raw_carts = data.get("carts")
+    if not isinstance(raw_carts, list) or not raw_carts:
+        return jsonify({"ok": False, "error": "No hay ventas para sincronizar"}), 400
+    if len(raw_carts) > CHECKOUT_BATCH_MAX_CARTS:
+        return jsonify({
+            "ok": False,
+            "error": f"Máximo {CHECKOUT_BATCH_MAX_CARTS} ventas por lote"
+        }), 400
+
+    results = [None] * len(raw_carts)
+    keys = []
+    carts = []
+    positions = {}
+    for i, raw in enumerate(raw_carts):
+        raw = raw if isinstance(raw, dict) else {}
+        key = str(raw.get("idempotency_key", "")).strip()
+        keys.append(key)
+        if not key:
+            results[i] = {"ok": False, "error": "Falta idempotency_key"}
+            continue
+        positions.setdefault(key, []).append(i)
+        if len(positions[key]) > 1:
             continue
         try:
-            qty = int(it.get("qty", 0))
+            qty_by_id = parse_cart_items(raw.get("items", []))
+            sale_dt = datetime.fromisoformat(raw["datetime"]) if raw.get("datetime") else datetime.now()
+        except CheckoutError as e:
+            results[i] = {"ok": False, "error": str(e)}
+            continue
         except (TypeError, ValueError):
-            return jsonify({"ok": False, "error": "Cantidad inválida"}), 400
-        if qty <= 0:
-            return jsonify({"ok": False, "error": "Cantidad inválida"}), 400
-        qty_by_id[pid] = qty_by_id.get(pid, 0) + qty
-
-    if not qty_by_id:
-        return jsonify({"ok": False, "error": "El carrito está vacío"}), 400
+            results[i] = {"ok": False, "error": "Fecha inválida"}
+            continue
+        carts.append({
+            "key": key,
+            "qty_by_id": qty_by_id,
+            "customer": raw.get("customer", ""),
+            "payment_method": raw.get("payment_method", "cash"),
+            "datetime": sale_dt
+        })
 
     conn = get_db()
-    placeholders = ",".join("?" for _ in qty_by_id)
-    products = conn.execute(
-        f"SELECT id, name, stock, price FROM inventory WHERE id IN ({placeholders})",
-        list(qty_by_id.keys())
-    ).fetchall()
+    try:
+        applied = run_checkout_batch(conn, carts) if carts else {}
+    except sqlite3.OperationalError as e:
+        if not is_lock_error(e):
+            raise
+        return jsonify({"ok": False, "error": "La base de datos está ocupada, intente de nuevo"}), 503
+
+    for key, idxs in positions.items():
+        first = idxs[0]
+        if results[first] is None:
+            results[first] = applied[key]
+        for i in idxs[1:]:
+            results[i] = dict(results[first], duplicate=results[first]["ok"])
+    for i, key in enumerate(keys):
+        results[i]["idempotency_key"] = key
 
-    if len(products) != len(qty_by_id):
-        return jsonify({"ok": False, "error": "Producto no encontrado"}), 400
+    return jsonify({
+        "ok": True,
+        "applied": sum(1 for r in results if r["ok"] and not r.get("duplicate")),
+        "results": results
+    })
 
-    products_by_id = {p["id"]: p for p in products}
+@app.get("/api/receipts")
+@login_required
+def api_get_receipts():
+    try:
+        limit = int(request.args.get("limit", RECEIPTS_PAGE_SIZE))
+    except ValueError:
+        return jsonify({"ok": False, "error": "Límite inválido"}), 400
+    limit = max(1, min(limit, RECEIPTS_MAX_PAGE_SIZE))
+
+    cursor = None
+    raw_cursor = request.args.get("cursor", "").strip()
+    if raw_cursor:
+        cursor = decode_cursor(raw_cursor)
+        if cursor is None:
+            return jsonify({"ok": False, "error": "Cursor inválido"}), 400
+
+    date_from = request.args.get("from", "").strip() or None
+    date_to = request.args.get("to", "").strip() or None
+    try:
+        for d in (date_from, date_to):
+            if d:
+                date.fromisoformat(d)
+    except ValueError:
+        return jsonify({"ok": False, "error": "Fecha inválida, use AAAA-MM-DD"}), 400
+
+    conn = get_read_db()
+    receipts_page, next_cursor = get_receipts_with_items(
+        conn,
+        limit=limit,
+        cursor=cursor,
+        date_from=date_from,
+        date_to=date_to,
+        payment_method=request.args.get("payment_method", "").strip() or None,
+        customer=request.args.get("customer", "").strip() or None,
+        archive=receipt_archive
+    )
+    return jsonify({"ok": True, "receipts": receipts_page, "next_cursor": next_cursor})
 
-    for pid, qty in qty_by_id.items():
-        product = products_by_id[pid]
-        if product["stock"] < qty:
-            return jsonify({
-                "ok": False,
-                "error": f"Stock insuficiente de {product['name']}. Disponible: {product['stock']}"
-            }), 400
+# ------------------ Indicadores y configuración ------------------
+@app.get("/api/kpis")
+@login_required
+def api_kpis():
+    return jsonify({"ok": True, **dashboard_kpis(kpi_cache.get(get_read_db()))})
 
-    receipt_items = []
-    subtotal = 0.0
-    for pid, qty in qty_by_id.items():
-        product = products_by_id[pid]
-        price = float(product["price"])
-        line_total = round(price * qty, 2)
-        subtotal += line_total
-        receipt_items.append({
-            "name": product["name"],
-            "qty": qty,
-            "price": price,
-            "subtotal": line_total
-        })
+@app.put("/api/settings/low-stock-threshold")
+@login_required
+@permission_required("can_manage_inventory", "No tiene permiso para cambiar el umbral de stock bajo")
+def api_set_low_stock_threshold():
+    data = request.json or {}
+    try:
+        threshold = int(data.get("low_stock_threshold"))
+    except (TypeError, ValueError):
+        return jsonify({"ok": False, "error": "El umbral debe ser un número entero"}), 400
+    if not LOW_STOCK_MIN <= threshold <= LOW_STOCK_MAX:
+        return jsonify({"ok": False, "error": f"El umbral debe estar entre {LOW_STOCK_MIN} y {LOW_STOCK_MAX}"}), 400
 
-    iva = round(subtotal * 0.16, 2)
-    total = round(subtotal + iva, 2)
-    rid = str(uuid.uuid4())
+    set_low_stock_threshold(get_db(), threshold)
+    return jsonify({"ok": True, **dashboard_kpis(kpi_cache.get(get_db()))})
 
-    try:
-        conn.execute("BEGIN")
-        for pid, qty in qty_by_id.items():
-            conn.execute(
-                "UPDATE inventory SET stock = stock - ? WHERE id = ?",
-                (qty, pid)
-            )
+# ------------------ Métricas ------------------
+@app.get("/metrics")
+@admin_required
+def metrics():
+    stats = runtime_stats()
+    return Response(
+        request_metrics.prometheus(stats["pools"], stats["caches"]),
+        mimetype="text/plain; version=0.0.4"
+    )
 
-        conn.execute(
-            """
-            INSERT INTO receipts (id, datetime, customer, payment_method, subtotal, iva, total)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                rid,
-                datetime.now().isoformat(),
-                data.get("customer", ""),
-                data.get("payment_method", "cash"),
-                subtotal,
-                iva,
-                total
-            )
-        )
+@app.get("/api/metrics")
+@admin_required
+def api_metrics():
+    return jsonify({"ok": True, **request_metrics.snapshot(), **runtime_stats()})
 
-        conn.executemany(
-            """
-            INSERT INTO receipt_items (receipt_id, name, qty, price, subtotal)
-            VALUES (?, ?, ?, ?, ?)
-            """,
-            [
-                (rid, it["name"], it["qty"], it["price"], it["subtotal"])
-                for it in receipt_items
-            ]
-        )
+SLOW_QUERY_ORDERS = ("total_ms", "max_ms", "avg_ms", "count")
 
-        conn.commit()
-    except Exception:
-        conn.rollback()
-        raise
+@app.get("/admin/slow-queries")
+@login_required
+@admin_required
+def slow_queries():
+    order = request.args.get("order", "total_ms")
+    if order not in SLOW_QUERY_ORDERS:
+        order = "total_ms"
+    limit = min(max(request.args.get("limit", 20, type=int), 1), 100)
+    return render_template(
+        "slow_queries.html",
+        queries=slow_query_log.top(limit, order),
+        stats=slow_query_log.stats(),
+        order=order,
+        limit=limit
+    )
 
-    return jsonify({
-        "ok": True,
-        "receipt_id": rid,
-        "total": total,
-        "message": "Venta procesada exitosamente"
-    })
+@app.get("/api/metrics/slow-queries")
+@admin_required
+def api_slow_queries():
+    order = request.args.get("order", "total_ms")
+    if order not in SLOW_QUERY_ORDERS:
+        return jsonify({"ok": False, "error": f"Orden inválido, use: {', '.join(SLOW_QUERY_ORDERS)}"}), 400
+    limit = min(max(request.args.get("limit", 20, type=int), 1), 100)
+    return jsonify({"ok": True, **slow_query_log.stats(), "queries": slow_query_log.top(limit, order)})
+
+# ------------------ Exportación ------------------
+@app.get("/api/export/<name>")
+@login_required
+@permission_required("can_export_data", "No tiene permiso para exportar datos")
+def api_export(name):
+    if name not in EXPORTS:
+        abort(404)
 
-@app.get("/receipt/<rid>")
+    fmt = request.args.get("format", "csv").strip().lower()
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"ok": False, "error": "Formato inválido, use csv o ndjson"}), 400
+
+    date_from = request.args.get("from", "").strip() or None
+    date_to = request.args.get("to", "").strip() or None
+    try:
+        for d in (date_from, date_to):
+            if d:
+                date.fromisoformat(d)
+    except ValueError:
+        return jsonify({"ok": False, "error": "Fecha inválida, use AAAA-MM-DD"}), 400
+
+    compress = request.args.get("gzip", "").lower() in ("1", "true", "yes")
+    filename = f"{name}.{fmt}" + (".gz" if compress else "")
+    if compress:
+        mimetype = "application/gzip"
+    elif fmt == "csv":
+        mimetype = "text/csv"
+    else:
+        mimetype = "application/x-ndjson"
+
+    return Response(
+        stream_export(get_pool(readonly=True), name, fmt, date_from, date_to, compress, receipt_archive),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+# ------------------ Etiquetas ------------------
+@app.route("/api/labels", methods=["GET", "POST"])
 @login_required
-def view_receipt(rid):
-    conn = get_db()
+def api_labels():
+    if request.method == "POST":
+        data = request.json or {}
+        for field in ("skus", "categories"):
+            if not isinstance(data.get(field) or [], list):
+                return jsonify({"ok": False, "error": f"{field} debe ser una lista"}), 400
+        skus = [str(s).strip() for s in data.get("skus") or [] if str(s).strip()]
+        categories = [str(c).strip() for c in data.get("categories") or [] if str(c).strip()]
+        q = str(data.get("q") or "").strip()
+        layout = data.get("layout", "a4-3x8")
+        fmt = data.get("format", "pdf")
+    else:
+        skus = [s.strip() for s in request.args.getlist("sku") if s.strip()]
+        categories = [c.strip() for c in request.args.getlist("category") if c.strip()]
+        q = request.args.get("q", "").strip()
+        layout = request.args.get("layout", "a4-3x8")
+        fmt = request.args.get("format", "pdf")
+
+    if layout not in LABEL_LAYOUTS:
+        return jsonify({"ok": False, "error": f"Formato de hoja inválido, use: {', '.join(LABEL_LAYOUTS)}"}), 400
+    if fmt not in LABEL_FORMATS:
+        return jsonify({"ok": False, "error": "Formato inválido, use pdf o svg"}), 400
+
+    where = []
+    params = []
+    if skus:
+        where.append(f"sku IN ({','.join('?' for _ in skus)})")
+        params.extend(skus)
+    if categories:
+        where.append(f"category IN ({','.join('?' for _ in categories)})")
+        params.extend(categories)
+    # SKU y categorías suman productos; la búsqueda (la misma del inventario) los acota
+    if where:
+        where = ["(" + " OR ".join(where) + ")"]
+    match = fts_query(q) if q else ""
+    if match:
+        where.append("rowid IN (SELECT rowid FROM inventory_fts WHERE inventory_fts MATCH ?)")
+        params.append(match)
+    sql = "SELECT sku, name, price FROM inventory"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY name, id LIMIT ?"
+    params.append(LABEL_MAX_PRODUCTS + 1)
+
+    products = [dict(r) for r in get_read_db().execute(sql, params).fetchall()]
+    if not products:
+        return jsonify({"ok": False, "error": "No hay productos para imprimir"}), 404
+    if len(products) > LABEL_MAX_PRODUCTS:
+        return jsonify({"ok": False, "error": f"Máximo {LABEL_MAX_PRODUCTS} etiquetas por hoja"}), 400
+
+    try:
+        geometries = build_label_geometries(products, layout, label_cache)
+        if fmt == "svg":
+            return Response(render_sheet_svg(layout, geometries), mimetype="image/svg+xml")
+        out = io.BytesIO()
+        render_sheet_pdf(layout, geometries, out)
+    except LabelRendererUnavailable as e:
+        return jsonify({"ok": False, "error": f"No se pueden generar etiquetas: {e}"}), 503
+
+    return Response(
+        out.getvalue(),
+        mimetype="application/pdf",
+        headers={"Content-Disposition": f"inline; filename=etiquetas-{layout}.pdf"}
+    )
+
+def load_receipt(conn, rid):
     receipt = conn.execute("SELECT * FROM receipts WHERE id = ?", (rid,)).fetchone()
     if not receipt:
-        abort(404)
+        return receipt_archive.load_receipt(conn, rid)
 
     items = conn.execute(
         "SELECT name, qty, price, subtotal FROM receipt_items WHERE receipt_id = ? ORDER BY id",
@@ -803,7 +1839,267 @@ def view_receipt(rid):
 
     receipt_dict = dict(receipt)
     receipt_dict["items"] = [dict(it) for it in items]
-    return render_template("receipt_print.html", r=receipt_dict)
+    return receipt_dict
+
+
+def _prerender_receipt(receipt):
+    try:
+        prerender_receipt(receipt_cache, receipt)
+    except Exception:
+        app.logger.exception("No se pudo pre-generar el recibo %s", receipt["id"])
+
+
+def schedule_receipt_render(sale):
+    receipt = {
+        "id": sale["receipt_id"],
+        "datetime": sale["datetime"],
+        "customer": sale["customer"],
+        "payment_method": sale["payment_method"],
+        "subtotal": sale["subtotal"],
+        "iva": sale["iva"],
+        "total": sale["total"],
+        "items": [
+            {"name": it["name"], "qty": it["qty"], "price": it["price"], "subtotal": it["subtotal"]}
+            for it in sale["items"]
+        ],
+    }
+    receipt_renderer.submit(_prerender_receipt, receipt)
+
+
+def receipt_exists(conn, rid):
+    return conn.execute(
+        "SELECT 1 FROM receipts WHERE id = ? UNION ALL SELECT 1 FROM receipt_archive_index WHERE receipt_id = ?",
+        (rid, rid)
+    ).fetchone() is not None
+
+
+def immutable_response(resp, etag):
+    # El PDF y el ESC/POS no cambian: el ETag depende solo del ID, del formato
+    # y de la versión del renderizador.
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "private, max-age=31536000, immutable"
+    return resp
+
+
+@app.get("/receipt/<rid>")
+@login_required
+def view_receipt(rid):
+    receipt = load_receipt(get_read_db(), rid)
+    if not receipt:
+        abort(404)
+    # La página depende de la plantilla y de los assets: el ETag sale del HTML
+    # generado y el navegador revalida cada vez, así le llegan los cambios
+    resp = make_response(render_template("receipt_print.html", r=receipt))
+    resp.add_etag()
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp.make_conditional(request)
+
+@app.get("/receipt/<rid>/<fmt>")
+@login_required
+def receipt_download(rid, fmt):
+    if fmt not in RECEIPT_FORMATS:
+        abort(404)
+    if not receipt_exists(get_read_db(), rid):
+        abort(404)
+    etag = receipt_etag(rid, fmt)
+    if request.if_none_match.contains(etag):
+        return immutable_response(Response(status=304), etag)
+
+    data = receipt_cache.get(rid, fmt)
+    if data is None:
+        receipt = load_receipt(get_read_db(), rid)
+        if not receipt:
+            abort(404)
+        try:
+            data = render_receipt(receipt, fmt)
+        except ReceiptRendererUnavailable as e:
+            return jsonify({"ok": False, "error": f"No se puede generar el recibo: {e}"}), 503
+        receipt_cache.put(rid, fmt, data)
+
+    extension = "pdf" if fmt == "pdf" else "bin"
+    disposition = "inline" if fmt == "pdf" else "attachment"
+    resp = Response(
+        data,
+        mimetype=RECEIPT_FORMATS[fmt],
+        headers={"Content-Disposition": f"{disposition}; filename=recibo-{rid[:8]}.{extension}"}
+    )
+    return immutable_response(resp, etag)
+
+@app.template_global()
+def asset_url(name):
+    url = asset_manifest.url_for(name)
+    if url is None:
+        return url_for("static", filename=name)
+    if "://" in url:
+        return url
+    return url_for("asset", filename=url)
+
+
+@app.get("/assets/<path:filename>")
+def asset(filename):
+    # Solo se sirven archivos del manifest: el hash en el nombre permite cachearlos para siempre
+    entry = asset_manifest.resolve(filename)
+    if entry is None:
+        abort(404)
+    encoding = next((e for e in ("br", "gzip") if entry[e] and request.accept_encodings[e]), None)
+    resp = send_from_directory(
+        asset_manifest.out_dir, filename + {"br": ".br", "gzip": ".gz"}.get(encoding, ""),
+        mimetype=mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    )
+    if encoding:
+        resp.headers["Content-Encoding"] = encoding
+    resp.vary.add("Accept-Encoding")
+    resp.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return resp
+
+# ------------------ CLI ------------------
+@app.cli.command("rebuild-rollups")
+def rebuild_rollups_command():
+    """Regenera daily_sales y daily_product_sales desde los recibos, incluidos los archivados."""
+    pool = get_pool()
+    conn = pool.acquire()
+    try:
+        archived = receipt_archive.stage_rollups(conn)
+        days = rebuild_rollups(conn, archived=archived > 0)
+    finally:
+        pool.release(conn)
+    print(f"Resúmenes regenerados: {days} días con ventas")
+
+@app.cli.command("archive-receipts")
+@click.option("--older-than", "older_than", type=int, default=ARCHIVE_AFTER, show_default=True,
+              help="Antigüedad en días de los recibos a archivar.")
+@click.option("--period", type=click.Choice(ARCHIVE_PERIODS), default="year", show_default=True,
+              help="Un archivo por año o por mes.")
+@click.option("--vacuum", is_flag=True, help="Compacta la base principal al terminar.")
+def archive_receipts_command(older_than, period, vacuum):
+    """Mueve los recibos viejos a bases por período en el directorio de archivo."""
+    pool = get_pool()
+    conn = pool.acquire()
+    started = time.perf_counter()
+    try:
+        moved = receipt_archive.archive(conn, older_than, period)
+        if vacuum:
+            conn.execute("VACUUM")
+            rebuild_search_index(conn)
+    except ArchiveError as e:
+        raise click.ClickException(str(e))
+    finally:
+        pool.release(conn)
+    for m in moved:
+        print(f"  {m['period']}: {m['receipts']} recibos -> {os.path.join(ARCHIVE_DIR, m['file'])}")
+    print(f"{sum(m['receipts'] for m in moved)} recibos archivados en {time.perf_counter() - started:.1f}s")
+
+@app.cli.command("rebuild-search-index")
+def rebuild_search_index_command():
+    """Reconstruye el índice de búsqueda del inventario (necesario tras un VACUUM)."""
+    pool = get_pool()
+    conn = pool.acquire()
+    try:
+        rebuild_search_index(conn)
+    finally:
+        pool.release(conn)
+    print("Índice de búsqueda reconstruido")
+
+@app.cli.command("recount-kpis")
+def recount_kpis_command():
+    """Recalcula los contadores del dashboard (kpi_counters) desde cero."""
+    pool = get_pool()
+    conn = pool.acquire()
+    try:
+        kpis = recount_kpis(conn)
+    finally:
+        pool.release(conn)
+    print(f"Contadores recalculados: {kpis['total_stock']} unidades, {kpis['receipts_count']} recibos")
+
+@app.cli.command("snapshot-stock")
+def snapshot_stock_command():
+    """Guarda una foto del stock actual (la app toma una por día sola)."""
+    pool = get_pool()
+    conn = pool.acquire()
+    try:
+        snapshot = take_snapshot(conn)
+    finally:
+        pool.release(conn)
+    print(f"Foto {snapshot['id']} de {snapshot['products']} productos hasta el movimiento {snapshot['last_movement_id']}")
+    if snapshot["pruned"]:
+        print(f"{snapshot['pruned']} fotos diarias viejas eliminadas (se conserva la primera de cada mes)")
+
+@app.cli.command("reconcile-stock")
+def reconcile_stock_command():
+    """Compara inventory.stock con el libro de movimientos."""
+    pool = get_pool()
+    conn = pool.acquire()
+    try:
+        snapshot, mismatches = reconcile_stock(conn)
+    finally:
+        pool.release(conn)
+    if snapshot is None:
+        raise click.ClickException("No hay fotos de stock; corra las migraciones")
+    for m in mismatches:
+        print(f"  {m['name'] or '(eliminado)'} [{m['id']}]: stock {m['stock']}, libro {m['ledger']}")
+    if mismatches:
+        raise click.ClickException(f"{len(mismatches)} productos no coinciden con el libro")
+    print(f"Stock conciliado con el libro (foto del {snapshot['taken_at']})")
+
+@app.cli.command("import-inventory")
+@click.argument("csv_path", type=click.Path(exists=True, dir_okay=False))
+def import_inventory_command(csv_path):
+    """Carga o actualiza productos por SKU desde un CSV."""
+    pool = get_pool()
+    conn = pool.acquire()
+    started = time.perf_counter()
+    try:
+        with open(csv_path, encoding="utf-8-sig", newline="") as fh:
+            report = import_inventory_csv(conn, fh)
+    except ImportFormatError as e:
+        raise click.ClickException(str(e))
+    finally:
+        pool.release(conn)
+
+    print(
+        f"{report['rows']} filas en {time.perf_counter() - started:.1f}s: "
+        f"{report['inserted']} nuevas, {report['updated']} actualizadas, {report['failed']} con errores"
+    )
+    for err in report["errors"]:
+        print(f"  fila {err['row']} ({err['sku']}): {err['error']}")
+
+@app.cli.command("build-assets")
+@click.option("--fetch", is_flag=True, help="Descargar primero las librerías que falten en static/vendor.")
+@click.option("--force", is_flag=True, help="Con --fetch, volver a descargar aunque ya existan.")
+def build_assets_command(fetch, force):
+    """Genera static/dist con nombres por contenido y variantes gzip/brotli."""
+    if fetch:
+        print("Descargando librerías a static/vendor...")
+        _, failed = fetch_vendor(app.static_folder, force=force)
+        if failed:
+            print(f"{len(failed)} archivos no se pudieron descargar; esas librerías seguirán saliendo de la CDN")
+    started = time.perf_counter()
+    manifest, vendored = build_assets(app.static_folder)
+    compressed = sum(1 for e in manifest.values() if e["gzip"] or e["br"])
+    print(
+        f"{len(manifest)} archivos en {time.perf_counter() - started:.1f}s ({compressed} comprimidos); "
+        f"librerías locales: {', '.join(vendored) or 'ninguna'}"
+    )
+
+@app.cli.command("serve")
+@click.option("--host", default=server.SERVER_HOST, show_default=True)
+@click.option("--port", default=server.SERVER_PORT, show_default=True)
+@click.option("--threads", default=server.SERVER_THREADS, show_default=True)
+@click.option("--connection-limit", default=server.SERVER_CONNECTION_LIMIT, show_default=True)
+@click.option("--channel-timeout", default=server.SERVER_CHANNEL_TIMEOUT, show_default=True,
+              help="Segundos sin actividad antes de cerrar una conexión (incluye keep-alive).")
+@click.option("--backlog", default=server.SERVER_BACKLOG, show_default=True)
+@click.option("--shutdown-timeout", default=server.SERVER_SHUTDOWN_TIMEOUT, show_default=True,
+              help="Segundos de espera para las peticiones en curso al apagar.")
+@click.option("--stream-slots", default=server.SERVER_STREAM_SLOTS, show_default=True,
+              help="Hilos extra para los streams en vivo; cada pantalla abierta ocupa uno (0 los desactiva).")
+def serve_command(**options):
+    """Sirve la app con waitress (modo producción, multihilo)."""
+    try:
+        server.serve(app, on_start=warm_up, on_drain=inventory_hub.close, on_shutdown=close_pools,
+                     stream_hub=inventory_hub, **options)
+    except server.ServerUnavailable as e:
+        raise click.ClickException(str(e))
 
 # ------------------ Error handlers ------------------
 @app.errorhandler(403)
@@ -814,9 +2110,7 @@ def forbidden(e):
 def not_found(e):
     return render_template("404.html"), 404
 
-# Initialize database on startup
-with app.app_context():
-    init_db()
-
 if __name__ == "__main__":
-    app.run(host='127.0.0.1', port=5000, debug=True, use_reloader=False)
\ No newline at end of file
+    # Para desarrollo con recarga: flask --app app run --debug
+    server.main(wsgi_app=app, on_start=warm_up, on_drain=inventory_hub.close, on_shutdown=close_pools,
+                stream_hub=inventory_hub)
\ No newline at end of file
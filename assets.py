@@ -0,0 +1,274 @@
+import gzip
+import hashlib
+import json
+import os
+import posixpath
+import re
+import tempfile
+import threading
+import urllib.request
+
+try:
+    import brotli
+except ImportError:  # sin brotli solo se generan variantes .gz
+    brotli = None
+
+# Archivos estáticos con nombre por contenido. build_assets() copia static/css,
+# static/js y static/vendor a static/dist con el hash del contenido en el nombre
+# (sales.css -> sales.3f2a9c01be.css), genera variantes .gz y .br y escribe un
+# manifest.json con la correspondencia. Como el nombre cambia si cambia el
+# contenido, /assets/ los sirve con Cache-Control immutable. Las librerías de
+# terceros se descargan una sola vez a static/vendor con fetch_vendor(); hasta
+# entonces asset_url() sigue apuntando a la CDN para no dejar la página sin ellas.
+
+ASSET_SOURCES = ("css", "js", "vendor")
+ASSET_DIST = "dist"
+ASSET_HASH_LENGTH = 10
+ASSET_COMPRESSIBLE = (".css", ".js", ".json", ".map", ".svg", ".ttf", ".txt")
+ASSET_MIN_COMPRESS_BYTES = 512
+
+_FONTSOURCE = "https://cdn.jsdelivr.net/npm/@fontsource/poppins@5.0.8/files"
+_FONT_AWESOME = "https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0"
+POPPINS_WEIGHTS = (300, 400, 500, 600, 700)
+
+# Cada librería: su archivo de entrada (el que se enlaza en las plantillas), la
+# URL de la CDN mientras no esté en static/vendor y los archivos a descargar.
+VENDOR_LIBS = {
+    "alpine": {
+        "entry": "vendor/alpine/cdn.min.js",
+        "cdn": "https://cdn.jsdelivr.net/npm/alpinejs@3.13.5/dist/cdn.min.js",
+        "files": {"vendor/alpine/cdn.min.js": "https://cdn.jsdelivr.net/npm/alpinejs@3.13.5/dist/cdn.min.js"},
+    },
+    "chartjs": {
+        "entry": "vendor/chartjs/chart.umd.min.js",
+        "cdn": "https://cdn.jsdelivr.net/npm/chart.js@4.4.0/dist/chart.umd.min.js",
+        "files": {"vendor/chartjs/chart.umd.min.js": "https://cdn.jsdelivr.net/npm/chart.js@4.4.0/dist/chart.umd.min.js"},
+    },
+    "fontawesome": {
+        "entry": "vendor/fontawesome/css/all.min.css",
+        "cdn": f"{_FONT_AWESOME}/css/all.min.css",
+        "files": {
+            "vendor/fontawesome/css/all.min.css": f"{_FONT_AWESOME}/css/all.min.css",
+            **{
+                f"vendor/fontawesome/webfonts/{font}.{ext}": f"{_FONT_AWESOME}/webfonts/{font}.{ext}"
+                for font in ("fa-brands-400", "fa-regular-400", "fa-solid-900", "fa-v4compatibility")
+                for ext in ("woff2", "ttf")
+            },
+        },
+    },
+    "poppins": {
+        "entry": "vendor/poppins/poppins.css",
+        "cdn": "https://fonts.googleapis.com/css2?family=Poppins:wght@300;400;500;600;700&display=swap",
+        "files": {
+            # La hoja de estilos se genera localmente (ver _poppins_css)
+            "vendor/poppins/poppins.css": None,
+            **{
+                f"vendor/poppins/poppins-latin-{w}-normal.woff2": f"{_FONTSOURCE}/poppins-latin-{w}-normal.woff2"
+                for w in POPPINS_WEIGHTS
+            },
+        },
+    },
+    "html5-qrcode": {
+        "entry": "vendor/html5-qrcode/html5-qrcode.min.js",
+        "cdn": "https://cdn.jsdelivr.net/npm/html5-qrcode@2.3.8/html5-qrcode.min.js",
+        "files": {
+            "vendor/html5-qrcode/html5-qrcode.min.js": "https://cdn.jsdelivr.net/npm/html5-qrcode@2.3.8/html5-qrcode.min.js",
+        },
+    },
+    "sweetalert2": {
+        "entry": "vendor/sweetalert2/sweetalert2.all.min.js",
+        "cdn": "https://cdn.jsdelivr.net/npm/sweetalert2@11.10.5/dist/sweetalert2.all.min.js",
+        "files": {
+            "vendor/sweetalert2/sweetalert2.all.min.js":
+                "https://cdn.jsdelivr.net/npm/sweetalert2@11.10.5/dist/sweetalert2.all.min.js",
+        },
+    },
+    "jsbarcode": {
+        "entry": "vendor/jsbarcode/JsBarcode.all.min.js",
+        "cdn": "https://cdn.jsdelivr.net/npm/jsbarcode@3.11.5/dist/JsBarcode.all.min.js",
+        "files": {
+            "vendor/jsbarcode/JsBarcode.all.min.js": "https://cdn.jsdelivr.net/npm/jsbarcode@3.11.5/dist/JsBarcode.all.min.js",
+        },
+    },
+}
+VENDOR_ENTRIES = {lib["entry"]: name for name, lib in VENDOR_LIBS.items()}
+
+_CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")]+?)\1\s*\)""")
+_CSS_URL_SUFFIX = re.compile(r"([^?#]*)([?#]?)(.*)")
+
+
+def _poppins_css():
+    return "".join(
+        "@font-face{font-family:'Poppins';font-style:normal;font-display:swap;"
+        f"font-weight:{w};src:url(./poppins-latin-{w}-normal.woff2) format('woff2')}}\n"
+        for w in POPPINS_WEIGHTS
+    ).encode("utf-8")
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def fetch_vendor(static_dir, force=False, timeout=30, log=print):
+    fetched, failed = [], []
+    for name, lib in VENDOR_LIBS.items():
+        for path, url in lib["files"].items():
+            target = os.path.join(static_dir, *path.split("/"))
+            if os.path.exists(target) and not force:
+                continue
+            try:
+                if url is None:
+                    data = _poppins_css()
+                else:
+                    with urllib.request.urlopen(url, timeout=timeout) as resp:
+                        data = resp.read()
+            except OSError as e:
+                failed.append((path, str(e)))
+                log(f"  {path}: {e}")
+                continue
+            _write_atomic(target, data)
+            fetched.append(path)
+            log(f"  {path} ({len(data) // 1024} KB)")
+    return fetched, failed
+
+
+def _hashed_name(name, data):
+    stem, ext = posixpath.splitext(name)
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:ASSET_HASH_LENGTH]}{ext}"
+
+
+def _rewrite_css_urls(name, data, manifest):
+    # Las referencias relativas (fuentes, imágenes) pasan a su nombre con hash
+    base = posixpath.dirname(name)
+
+    def replace(m):
+        quote, ref = m.groups()
+        if ref.startswith(("data:", "http:", "https:", "//", "/", "#")):
+            return m.group(0)
+        # fa-*.woff2?v=6 o fuente.eot?#iefix: el sufijo se conserva
+        path, sep, suffix = _CSS_URL_SUFFIX.match(ref).groups()
+        target = posixpath.normpath(posixpath.join(base, path))
+        entry = manifest.get(target)
+        if entry is None:
+            return m.group(0)
+        return f"url({quote}{posixpath.relpath(entry['path'], base)}{sep}{suffix}{quote})"
+
+    return _CSS_URL.sub(replace, data.decode("utf-8")).encode("utf-8")
+
+
+def _write_variants(out_dir, hashed, data):
+    target = os.path.join(out_dir, *hashed.split("/"))
+    # El nombre depende del contenido: si ya existe, es idéntico
+    if not os.path.exists(target):
+        _write_atomic(target, data)
+    entry = {"path": hashed, "size": len(data), "gzip": False, "br": False}
+    if not hashed.endswith(ASSET_COMPRESSIBLE) or len(data) < ASSET_MIN_COMPRESS_BYTES:
+        return entry
+    variants = [("gzip", ".gz", lambda d: gzip.compress(d, 9, mtime=0))]
+    if brotli is not None:
+        variants.append(("br", ".br", lambda d: brotli.compress(d, quality=11)))
+    for encoding, suffix, compress in variants:
+        if os.path.exists(target + suffix):
+            entry[encoding] = True
+            continue
+        packed = compress(data)
+        # Solo vale la pena si ahorra al menos un 10 %
+        if len(packed) < len(data) * 0.9:
+            _write_atomic(target + suffix, packed)
+            entry[encoding] = True
+    return entry
+
+
+def build_assets(static_dir, out_dir=None):
+    out_dir = out_dir or os.path.join(static_dir, ASSET_DIST)
+    sources = {}
+    for top in ASSET_SOURCES:
+        for dirpath, _, files in os.walk(os.path.join(static_dir, top)):
+            for f in files:
+                full = os.path.join(dirpath, f)
+                sources[os.path.relpath(full, static_dir).replace(os.sep, "/")] = full
+
+    manifest = {}
+    # Primero lo que no es CSS, para que las hojas de estilo apunten a los nombres con hash
+    for name in sorted(sources, key=lambda n: (n.endswith(".css"), n)):
+        with open(sources[name], "rb") as fh:
+            data = fh.read()
+        if name.endswith(".css"):
+            data = _rewrite_css_urls(name, data, manifest)
+        manifest[name] = _write_variants(out_dir, _hashed_name(name, data), data)
+
+    vendored = sorted(
+        lib for lib, spec in VENDOR_LIBS.items() if all(path in manifest for path in spec["files"])
+    )
+    _write_atomic(
+        os.path.join(out_dir, "manifest.json"),
+        json.dumps({"assets": manifest, "vendored": vendored}, indent=1, sort_keys=True).encode("utf-8")
+    )
+    return manifest, vendored
+
+
+class AssetManifest:
+    def __init__(self, out_dir):
+        self.out_dir = out_dir
+        self.path = os.path.join(out_dir, "manifest.json")
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._assets = {}
+        self._by_path = {}
+        self._vendored = frozenset()
+
+    def _refresh(self):
+        # Un build nuevo reemplaza manifest.json: se relee si cambió su mtime
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            data = {}
+            if mtime is not None:
+                with open(self.path, encoding="utf-8") as fh:
+                    data = json.load(fh)
+            self._assets = data.get("assets", {})
+            self._by_path = {e["path"]: e for e in self._assets.values()}
+            self._vendored = frozenset(data.get("vendored", ()))
+            self._mtime = mtime
+
+    @property
+    def built(self):
+        self._refresh()
+        return self._mtime is not None
+
+    def url_for(self, name):
+        # Ruta con hash bajo /assets/, URL de la CDN si la librería aún no se descargó,
+        # o None para que se sirva tal cual desde /static/.
+        self._refresh()
+        lib = VENDOR_ENTRIES.get(name)
+        if lib is not None and lib not in self._vendored:
+            return VENDOR_LIBS[lib]["cdn"]
+        entry = self._assets.get(name)
+        return entry["path"] if entry else None
+
+    def resolve(self, hashed):
+        self._refresh()
+        return self._by_path.get(hashed)
+
+    def stats(self):
+        self._refresh()
+        return {
+            "built": self._mtime is not None,
+            "assets": len(self._assets),
+            "vendored": sorted(self._vendored),
+            "missing_vendor": sorted(set(VENDOR_LIBS) - self._vendored),
+        }
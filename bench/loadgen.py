@@ -0,0 +1,231 @@
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# Generador de carga: N hilos ejecutan una mezcla configurable de operaciones
+# (login, escaneo, checkout, recibos, reportes, CRUD de inventario) contra un
+# servidor en marcha (--url) o contra la app en el mismo proceso con el test
+# client de Flask (--db). Al final reporta rendimiento y p50/p99 por operación.
+
+DEFAULT_MIX = "login=1,scan=10,checkout=5,receipts=3,reports=1,inventory=1"
+BENCH_USER = "bench0001"
+BENCH_PASSWORD = "bench"
+
+
+class HttpClient:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+        )
+
+    def request(self, method, path, json_body=None, form=None):
+        data = None
+        headers = {}
+        if json_body is not None:
+            data = json.dumps(json_body).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+        elif form is not None:
+            data = urllib.parse.urlencode(form).encode("utf-8")
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        req = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+        try:
+            with self.opener.open(req, timeout=30) as resp:
+                return resp.status, resp.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+
+class FlaskClient:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, json_body=None, form=None):
+        resp = self.client.open(path, method=method, json=json_body, data=form)
+        return resp.status_code, resp.get_data()
+
+
+class Workload:
+    def __init__(self, client, rng, products):
+        self.client = client
+        self.rng = rng
+        self.products = products
+        self.created = []
+
+    def login(self):
+        status, _ = self.client.request("POST", "/login", form={"username": BENCH_USER, "password": BENCH_PASSWORD})
+        return status in (200, 302)
+
+    def scan(self):
+        sku = self.rng.choice(self.products)["sku"]
+        status, _ = self.client.request("GET", "/api/inventory/by-sku/" + urllib.parse.quote(sku))
+        return status in (200, 404)
+
+    def checkout(self):
+        lines = self.rng.sample(self.products, k=min(len(self.products), self.rng.choice((1, 1, 2, 3))))
+        items = [{"id": p["id"], "qty": 1} for p in lines]
+        status, _ = self.client.request("POST", "/api/checkout", json_body={"items": items, "payment_method": "cash"})
+        # 400 = sin stock: es una respuesta válida de la app, no un error de carga
+        return status in (200, 400)
+
+    def receipts(self):
+        status, _ = self.client.request("GET", "/api/receipts?limit=25")
+        return status == 200
+
+    def reports(self):
+        days = self.rng.choice((7, 30, 90))
+        status, _ = self.client.request("GET", f"/reports?days={days}")
+        return status == 200
+
+    def inventory(self):
+        if self.created and self.rng.random() < 0.5:
+            pid = self.created.pop()
+            status, _ = self.client.request("DELETE", f"/api/inventory/{pid}")
+            return status == 200
+        n = self.rng.randrange(10 ** 9)
+        product = {
+            "name": f"Producto carga {n}", "sku": f"LOAD{n:09d}", "stock": 10,
+            "price": 9.5, "expiry": "2030-01-01", "category": "Carga",
+        }
+        status, body = self.client.request("POST", "/api/inventory", json_body=product)
+        if status != 200:
+            return False
+        pid = json.loads(body)["item"]["id"]
+        product["stock"] = 20
+        status, _ = self.client.request("PUT", f"/api/inventory/{pid}", json_body=product)
+        self.created.append(pid)
+        return status == 200
+
+
+OPERATIONS = ("login", "scan", "checkout", "receipts", "reports", "inventory")
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(f"Operación desconocida: {name} (válidas: {', '.join(OPERATIONS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(samples, p):
+    if not samples:
+        return None
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+def run_load(make_client, mix, threads=8, duration=10.0, seed=1):
+    setup = make_client()
+    Workload(setup, random.Random(seed), []).login()
+    status, body = setup.request("GET", "/api/inventory?limit=200")
+    if status != 200:
+        raise RuntimeError(f"/api/inventory devolvió {status}; ¿el usuario {BENCH_USER} existe?")
+    products = json.loads(body)["items"]
+
+    names = list(mix)
+    weights = [mix[n] for n in names]
+    samples = {n: [] for n in names}
+    errors = {n: 0 for n in names}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(n):
+        rng = random.Random(seed * 1000 + n)
+        work = Workload(make_client(), rng, products)
+        work.login()
+        local = {name: [] for name in names}
+        local_errors = {name: 0 for name in names}
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights=weights)[0]
+            started = time.perf_counter()
+            try:
+                ok = getattr(work, name)()
+            except Exception:
+                ok = False
+            local[name].append(time.perf_counter() - started)
+            if not ok:
+                local_errors[name] += 1
+        with lock:
+            for name in names:
+                samples[name].extend(local[name])
+                errors[name] += local_errors[name]
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    report = {"threads": threads, "seconds": round(elapsed, 2), "operations": {}}
+    total = 0
+    for name in names:
+        s = samples[name]
+        total += len(s)
+        report["operations"][name] = {
+            "count": len(s),
+            "errors": errors[name],
+            "per_second": round(len(s) / elapsed, 1),
+            "p50_ms": round(percentile(s, 50) * 1000, 2) if s else None,
+            "p99_ms": round(percentile(s, 99) * 1000, 2) if s else None,
+        }
+    report["total_per_second"] = round(total / elapsed, 1)
+    return report
+
+
+def print_report(report):
+    print(f"\n{report['threads']} hilos durante {report['seconds']}s: {report['total_per_second']} op/s")
+    print(f"{'operación':<12}{'total':>8}{'errores':>9}{'op/s':>9}{'p50 ms':>10}{'p99 ms':>10}")
+    for name, r in report["operations"].items():
+        print(
+            f"{name:<12}{r['count']:>8}{r['errors']:>9}{r['per_second']:>9}"
+            f"{r['p50_ms'] if r['p50_ms'] is not None else '-':>10}{r['p99_ms'] if r['p99_ms'] is not None else '-':>10}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generador de carga para FarmaSys")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--url", help="servidor en marcha, p. ej. http://127.0.0.1:5000")
+    target.add_argument("--db", help="base sintética (bench/synth_data.py) para correr la app en este proceso")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0, help="segundos")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"pesos por operación (por defecto {DEFAULT_MIX})")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", dest="json_path", help="guardar el reporte en este archivo")
+    args = parser.parse_args(argv)
+
+    if args.url:
+        def make_client():
+            return HttpClient(args.url)
+    else:
+        os.environ["FARMASYS_DB"] = os.path.abspath(args.db)
+        import app as farmasys
+
+        def make_client():
+            return FlaskClient(farmasys.app)
+
+    report = run_load(make_client, parse_mix(args.mix), args.threads, args.duration, args.seed)
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# Microbenchmarks de las rutas calientes sobre una base sintética. Cada caso se
+# repite N veces y se reporta la mediana y el p99; con --save los resultados
+# quedan como línea base en bench/baselines.json y las corridas siguientes se
+# comparan contra ella (exit 1 si alguna mediana empeora más que --tolerance).
+
+BASELINES_PATH = os.path.join(os.path.dirname(__file__), "baselines.json")
+
+
+def measure(fn, iterations, warmup=3):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    samples.sort()
+    return {
+        "iterations": iterations,
+        "median_ms": round(samples[len(samples) // 2] * 1000, 3),
+        "p99_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000, 3),
+    }
+
+
+def build_cases(farmasys, rng):
+    client = farmasys.app.test_client()
+    with client.session_transaction() as sess:
+        sess["user"] = {"username": "bench0001", "role": "admin"}
+
+    pool = farmasys.get_pool(readonly=True)
+    conn = pool.acquire()
+    try:
+        products = [dict(r) for r in conn.execute("SELECT id, stock FROM inventory WHERE stock > 0 LIMIT 500")]
+        _, next_cursor = farmasys.get_receipts_with_items(conn, limit=100)
+        cursor = farmasys.decode_cursor(next_cursor)
+    finally:
+        pool.release(conn)
+
+    def receipts_first_page():
+        conn = pool.acquire()
+        try:
+            farmasys.get_receipts_with_items(conn)
+        finally:
+            pool.release(conn)
+
+    def receipts_deep_page():
+        conn = pool.acquire()
+        try:
+            farmasys.get_receipts_with_items(conn, cursor=cursor)
+        finally:
+            pool.release(conn)
+
+    def reports(days):
+        def run():
+            rv = client.get(f"/reports?days={days}")
+            assert rv.status_code == 200, rv.status_code
+        return run
+
+    def checkout():
+        p = rng.choice(products)
+        rv = client.post("/api/checkout", json={"items": [{"id": p["id"], "qty": 1}]})
+        assert rv.status_code in (200, 400), rv.get_data(as_text=True)
+
+    return {
+        "get_receipts_with_items:first_page": receipts_first_page,
+        "get_receipts_with_items:after_100": receipts_deep_page,
+        "reports:7d": reports(7),
+        "reports:365d": reports(365),
+        "api_checkout": checkout,
+    }
+
+
+def compare(results, baselines, tolerance):
+    regressions = []
+    print(f"\n{'caso':<38}{'mediana ms':>12}{'p99 ms':>10}{'base ms':>10}{'cambio':>10}")
+    for name, r in results.items():
+        base = baselines.get(name)
+        change = ""
+        if base:
+            delta = (r["median_ms"] - base["median_ms"]) / base["median_ms"] if base["median_ms"] else 0
+            change = f"{delta:+.0%}"
+            if delta > tolerance:
+                regressions.append(name)
+                change += " !"
+        print(
+            f"{name:<38}{r['median_ms']:>12}{r['p99_ms']:>10}"
+            f"{base['median_ms'] if base else '-':>10}{change:>10}"
+        )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Microbenchmarks de FarmaSys")
+    parser.add_argument("--db", required=True, help="base sintética generada con bench/synth_data.py")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--only", help="ejecutar solo los casos que contengan este texto")
+    parser.add_argument("--save", action="store_true", help="guardar los resultados como línea base")
+    parser.add_argument("--baselines", default=BASELINES_PATH)
+    parser.add_argument("--tolerance", type=float, default=0.25, help="empeoramiento máximo aceptado (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    os.environ["FARMASYS_DB"] = os.path.abspath(args.db)
+    import app as farmasys
+
+    pool = farmasys.get_pool(readonly=True)
+    conn = pool.acquire()
+    try:
+        dataset = {
+            table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ("inventory", "receipts", "receipt_items")
+        }
+    finally:
+        pool.release(conn)
+
+    cases = build_cases(farmasys, random.Random(7))
+    results = {}
+    for name, fn in cases.items():
+        if args.only and args.only not in name:
+            continue
+        results[name] = measure(fn, args.iterations)
+
+    baselines = {}
+    if os.path.exists(args.baselines):
+        with open(args.baselines, encoding="utf-8") as fh:
+            baselines = json.load(fh).get("results", {})
+    regressions = compare(results, baselines, args.tolerance)
+
+    if args.save:
+        with open(args.baselines, "w", encoding="utf-8") as fh:
+            json.dump({
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "dataset": dataset,
+                "saved_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "results": {**baselines, **results},
+            }, fh, indent=2, ensure_ascii=False)
+        print(f"\nLínea base guardada en {args.baselines}")
+    elif regressions:
+        print(f"\nRegresiones de más del {args.tolerance:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
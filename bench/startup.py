@@ -0,0 +1,122 @@
+import argparse
+import os
+import re
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Reporte de arranque: desglose de imports al estilo `python -X importtime`
+# (tiempo acumulado de los imports directos de la app) y tiempo de pared desde
+# que se lanza el servidor hasta que responde la primera petición. Con --fresh
+# se mide además el arranque sobre una base nueva (migraciones + datos de ejemplo).
+
+_IMPORTTIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( +)(.+)")
+
+
+def _env(db_path):
+    env = dict(os.environ)
+    env["FARMASYS_DB"] = os.path.abspath(db_path)
+    env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    return env
+
+
+def import_breakdown(db_path, top=15):
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=ROOT, env=_env(db_path), capture_output=True, text=True, check=True
+    )
+    entries = []
+    for line in proc.stderr.splitlines():
+        m = _IMPORTTIME.match(line)
+        if m:
+            self_us, cumulative_us, indent, name = m.groups()
+            entries.append((name, (len(indent) - 1) // 2, int(self_us), int(cumulative_us)))
+    total = next((e for e in entries if e[0] == "app" and e[1] == 0), None)
+    # Los imports directos de app.py quedan con profundidad 1
+    direct = sorted((e for e in entries if e[1] == 1), key=lambda e: e[3], reverse=True)
+    return {
+        "total_ms": total[3] / 1000 if total else None,
+        "self_ms": total[2] / 1000 if total else None,
+        "modules": [(name, cumulative / 1000) for name, _, _, cumulative in direct[:top]],
+    }
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def first_request(db_path, path="/login", timeout=30.0):
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}{path}"
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "server.py", "--port", str(port)],
+        cwd=ROOT, env=_env(db_path), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while True:
+            if time.perf_counter() - started > timeout:
+                raise RuntimeError(f"El servidor no respondió en {timeout:.0f}s")
+            try:
+                with urllib.request.urlopen(url, timeout=timeout) as resp:
+                    status = resp.status
+                break
+            except urllib.error.HTTPError as e:
+                status = e.code
+                break
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.005)
+                continue
+        first = time.perf_counter() - started
+        second_started = time.perf_counter()
+        urllib.request.urlopen(url, timeout=timeout).read()
+        second = time.perf_counter() - second_started
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        proc.wait(timeout=timeout)
+    return {"status": status, "first_ms": first * 1000, "second_ms": second * 1000}
+
+
+def print_breakdown(breakdown):
+    print(f"import app: {breakdown['total_ms']:.1f} ms (propio de app.py: {breakdown['self_ms']:.1f} ms)")
+    for name, ms in breakdown["modules"]:
+        print(f"  {name:<40}{ms:>9.1f} ms")
+
+
+def print_request(label, request):
+    print(f"\n{label}:")
+    print(
+        f"  primera petición servida: {request['first_ms']:.0f} ms desde el lanzamiento "
+        f"(HTTP {request['status']}); la siguiente tardó {request['second_ms']:.1f} ms"
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reporte de tiempos de arranque de FarmaSys")
+    parser.add_argument("--db", required=True, help="base existente (se copia; el original no se toca)")
+    parser.add_argument("--fresh", action="store_true", help="medir también el arranque sobre una base nueva")
+    parser.add_argument("--top", type=int, default=15, help="imports a mostrar")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        copy = os.path.join(tmp, "startup.db")
+        shutil.copy(args.db, copy)
+        # Importar la app ya no abre la base: el desglose no depende de cuál sea
+        print_breakdown(import_breakdown(copy, args.top))
+        print_request(f"Base existente ({args.db})", first_request(copy))
+        if args.fresh:
+            print_request("Base nueva", first_request(os.path.join(tmp, "fresh.db")))
+
+
+if __name__ == "__main__":
+    main()
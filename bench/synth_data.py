@@ -0,0 +1,179 @@
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+import uuid
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from kpis import recount_kpis  # noqa: E402
+from migrations import migrate  # noqa: E402
+from rollups import rebuild_rollups  # noqa: E402
+
+# Generador determinista de datos sintéticos para benchmarks: con la misma
+# semilla y la misma fecha final produce exactamente la misma base. Escribe en
+# una base nueva (nunca sobre farmasys.db) usando el esquema de migrations.py.
+
+BENCH_PASSWORD = "bench"
+CATEGORIES = (
+    "Analgésico", "Antibiótico", "Antiácido", "Antihistamínico", "Antiinflamatorio",
+    "Vitaminas", "Dermatológico", "Cardiovascular", "Respiratorio", "Higiene",
+)
+DRUGS = (
+    "Paracetamol", "Ibuprofeno", "Amoxicilina", "Omeprazol", "Loratadina", "Naproxeno",
+    "Metformina", "Losartán", "Salbutamol", "Cetirizina", "Diclofenaco", "Ranitidina",
+    "Azitromicina", "Ciprofloxacino", "Vitamina C", "Complejo B", "Clotrimazol", "Aspirina",
+)
+FORMS = ("Tabletas", "Cápsulas", "Jarabe", "Suspensión", "Crema", "Gotas")
+DOSES = ("5mg", "10mg", "20mg", "50mg", "100mg", "250mg", "400mg", "500mg", "1g")
+PAYMENT_METHODS = ("cash", "cash", "cash", "card", "card", "transfer")
+CHUNK = 20000
+
+
+def _uuid(rng):
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def generate_products(rng, count):
+    products = []
+    for i in range(count):
+        name = f"{rng.choice(DRUGS)} {rng.choice(DOSES)} {rng.choice(FORMS)} #{i + 1}"
+        products.append({
+            "id": _uuid(rng),
+            "name": name,
+            "sku": f"75{i + 1:010d}",
+            "stock": rng.randint(0, 500),
+            "price": round(rng.uniform(5, 950), 2),
+            "expiry": (date(2026, 1, 1) + timedelta(days=rng.randint(0, 1500))).isoformat(),
+            "category": rng.choice(CATEGORIES),
+        })
+    return products
+
+
+def generate_users(rng, count):
+    roles = ("cajero", "cajero", "cajero", "inventario", "admin")
+    users = []
+    for i in range(count):
+        role = "admin" if i == 0 else rng.choice(roles)
+        users.append((
+            _uuid(rng), f"Usuario Bench {i + 1}", f"bench{i + 1:04d}", f"bench{i + 1:04d}@farmasys.test",
+            role, "active", BENCH_PASSWORD, None,
+            int(role == "admin"), int(role in ("admin", "inventario")), int(role == "admin"), int(role == "admin"),
+            "2025-01-01T00:00:00",
+        ))
+    return users
+
+
+def generate_receipts(rng, products, count, end_date, days):
+    # Horario de 8:00 a 22:00; los productos más baratos se venden más
+    weights = [1 / (1 + p["price"] / 50) for p in products]
+    start = datetime.combine(end_date - timedelta(days=days - 1), datetime.min.time())
+    span = days * 14 * 3600
+    offsets = sorted(rng.randrange(span) for _ in range(count))
+    for offset in offsets:
+        day, secs = divmod(offset, 14 * 3600)
+        dt = start + timedelta(days=day, seconds=8 * 3600 + secs)
+        lines = rng.choices(products, weights=weights, k=rng.choice((1, 1, 1, 2, 2, 3, 4)))
+        items = []
+        subtotal = 0.0
+        for p in {p["id"]: p for p in lines}.values():
+            qty = rng.choice((1, 1, 1, 2, 3))
+            line_total = round(p["price"] * qty, 2)
+            subtotal += line_total
+            items.append((p["id"], p["sku"], p["name"], qty, p["price"], line_total))
+        iva = round(subtotal * 0.16, 2)
+        yield (
+            _uuid(rng), dt.isoformat(), dt.date().isoformat(), "",
+            rng.choice(PAYMENT_METHODS), round(subtotal, 2), iva, round(subtotal + iva, 2)
+        ), items
+
+
+def build_database(path, products=2000, users=20, receipts=100000, days=365, seed=42, end_date=None, log=print):
+    if os.path.exists(path):
+        raise FileExistsError(f"{path} ya existe; los datos sintéticos solo se generan en una base nueva")
+    rng = random.Random(seed)
+    end_date = end_date or date.today()
+    started = time.perf_counter()
+
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")
+    migrate(conn)
+
+    catalog = generate_products(rng, products)
+    conn.execute("BEGIN")
+    conn.executemany(
+        "INSERT INTO inventory (id, name, sku, stock, price, expiry, category) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(p["id"], p["name"], p["sku"], p["stock"], p["price"], p["expiry"], p["category"]) for p in catalog]
+    )
+    conn.executemany(
+        """
+        INSERT INTO users (id, full_name, username, email, role, status, password, last_login,
+                           can_manage_users, can_manage_inventory, can_view_reports, can_export_data, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        generate_users(rng, users)
+    )
+    conn.commit()
+    log(f"{products} productos y {users} usuarios")
+
+    receipt_rows = []
+    item_rows = []
+    written = 0
+
+    def flush():
+        conn.execute("BEGIN")
+        conn.executemany(
+            """
+            INSERT INTO receipts (id, datetime, sale_date, customer, payment_method, subtotal, iva, total)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            receipt_rows
+        )
+        conn.executemany(
+            "INSERT INTO receipt_items (receipt_id, product_id, sku, name, qty, price, subtotal) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            item_rows
+        )
+        conn.commit()
+        receipt_rows.clear()
+        item_rows.clear()
+
+    for receipt, items in generate_receipts(rng, catalog, receipts, end_date, days):
+        receipt_rows.append(receipt)
+        item_rows.extend((receipt[0], *it) for it in items)
+        if len(receipt_rows) >= CHUNK:
+            flush()
+            written += CHUNK
+            log(f"  {written} recibos...")
+    if receipt_rows:
+        flush()
+    log(f"{receipts} recibos en {days} días")
+
+    rebuild_rollups(conn)
+    recount_kpis(conn)
+    conn.execute("PRAGMA optimize")
+    conn.close()
+    log(f"Base sintética lista en {path} ({time.perf_counter() - started:.1f}s)")
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera una base FarmaSys con datos sintéticos para benchmarks")
+    parser.add_argument("--db", required=True, help="ruta de la base nueva")
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--receipts", type=int, default=100000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--end-date", type=date.fromisoformat, default=None, help="AAAA-MM-DD (por defecto hoy)")
+    args = parser.parse_args(argv)
+    build_database(args.db, args.products, args.users, args.receipts, args.days, args.seed, args.end_date)
+
+
+if __name__ == "__main__":
+    main()
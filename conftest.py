@@ -0,0 +1,23 @@
+import pytest
+
+import app as farmasys
+from stock_ledger import StockSnapshotter
+
+
+@pytest.fixture
+def scratch_db(tmp_path, monkeypatch):
+    # Base nueva con el esquema y los datos de ejemplo; DB_PATH vuelve a su valor al terminar
+    farmasys.close_pools()
+    monkeypatch.setattr(farmasys, "DB_PATH", str(tmp_path / "farmasys.db"))
+    farmasys.sku_cache.invalidate_all()
+    farmasys.init_db()
+    # Como en warm_up(): la foto de stock se resuelve ahora y no en un hilo que
+    # podría seguir corriendo después de restaurar DB_PATH
+    snapshots = StockSnapshotter(lambda: farmasys.get_pool())
+    snapshots.maybe_take(wait=True)
+    monkeypatch.setattr(farmasys, "stock_snapshots", snapshots)
+    yield farmasys.DB_PATH
+    # Los recibos se pre-generan en segundo plano contra esta misma base
+    farmasys.receipt_renderer.submit(lambda: None).result()
+    farmasys.close_pools()
+    farmasys.sku_cache.invalidate_all()
@@ -0,0 +1,56 @@
+# Versión de datos por tabla (migración 8). Los triggers suben
+# data_versions.version con cada INSERT/UPDATE/DELETE y anotan en row_versions
+# la versión del último cambio de cada fila, así que las APIs de lectura pueden
+# responder 304 comparando un número y devolver solo las filas cambiadas o
+# borradas desde la versión que ya tiene el cliente.
+
+DATA_VERSIONED_TABLES = ("inventory", "users")
+
+
+def data_version(conn, table):
+    row = conn.execute("SELECT version FROM data_versions WHERE table_name = ?", (table,)).fetchone()
+    return row[0] if row else 0
+
+
+def parse_since(raw):
+    try:
+        since = int(raw)
+    except (TypeError, ValueError):
+        raise ValueError("since debe ser un número de versión")
+    if since < 0:
+        raise ValueError("since debe ser un número de versión")
+    return since
+
+
+def changes_since(conn, table, since):
+    # Quien llama lee data_version() antes que las filas: si entra un cambio entre
+    # ambas consultas, el cliente lo recibe ahora y otra vez en la próxima, nunca se pierde.
+    if table not in DATA_VERSIONED_TABLES:
+        raise ValueError(f"Tabla sin versión de datos: {table}")
+    rows = conn.execute(
+        f"""
+        SELECT rv.row_id AS _row_id, rv.deleted AS _deleted, t.*
+        FROM row_versions rv
+        LEFT JOIN {table} t ON t.id = rv.row_id
+        WHERE rv.table_name = ? AND rv.version > ?
+        ORDER BY rv.version
+        """,
+        (table, since)
+    ).fetchall()
+
+    changed, deleted = [], []
+    for row in rows:
+        item = dict(row)
+        row_id = item.pop("_row_id")
+        if item.pop("_deleted") or item["id"] is None:
+            deleted.append(row_id)
+        else:
+            changed.append(item)
+    return changed, deleted
+
+
+def versioned_etag(table, version, since=None, *extra):
+    parts = [table, str(version)]
+    if since is not None:
+        parts.append(f"s{since}")
+    return "-".join(parts + [str(p) for p in extra])
@@ -0,0 +1,148 @@
+import queue
+import sqlite3
+import threading
+import time
+
+# Pool de conexiones SQLite reutilizables entre peticiones. Todas las conexiones
+# trabajan en modo WAL (los lectores no bloquean al escritor ni al revés) con
+# synchronous=NORMAL y un busy_timeout, de modo que la contención entre cajas
+# espera unos milisegundos en lugar de fallar con "database is locked".
+
+
+class PoolTimeoutError(RuntimeError):
+    pass
+
+
+class _Slot:
+    def __init__(self, index, conn):
+        self.index = index
+        self.conn = conn
+        self.created_at = time.time()
+        self.uses = 0
+        self.in_use = False
+        self.acquired_at = None
+        self.last_used_at = None
+        self.busy_seconds = 0.0
+        self.max_hold_seconds = 0.0
+
+    def stats(self):
+        return {
+            "index": self.index,
+            "uses": self.uses,
+            "in_use": self.in_use,
+            "busy_seconds": round(self.busy_seconds, 6),
+            "max_hold_seconds": round(self.max_hold_seconds, 6),
+            "created_at": self.created_at,
+            "last_used_at": self.last_used_at,
+        }
+
+
+class ConnectionPool:
+    def __init__(self, path, size=4, readonly=False, busy_timeout_ms=5000, acquire_timeout=10.0,
+                 factory=sqlite3.Connection):
+        self.path = path
+        self.factory = factory
+        self.size = size
+        self.readonly = readonly
+        self.busy_timeout_ms = busy_timeout_ms
+        self.acquire_timeout = acquire_timeout
+        self._idle = queue.LifoQueue()
+        self._slots = {}
+        self._lock = threading.Lock()
+        self._created = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.timeouts = 0
+
+    def _connect(self):
+        if self.readonly:
+            conn = sqlite3.connect(
+                f"file:{self.path}?mode=ro", uri=True,
+                timeout=self.busy_timeout_ms / 1000, check_same_thread=False, factory=self.factory
+            )
+        else:
+            conn = sqlite3.connect(
+                self.path, timeout=self.busy_timeout_ms / 1000, check_same_thread=False, factory=self.factory
+            )
+            conn.execute("PRAGMA journal_mode = WAL")
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA foreign_keys = ON")
+        if self.readonly:
+            conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    def acquire(self):
+        slot = None
+        try:
+            slot = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                if self._created < self.size:
+                    slot = _Slot(self._created, None)
+                    self._created += 1
+            if slot is not None:
+                try:
+                    slot.conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+                self._slots[id(slot.conn)] = slot
+            else:
+                started = time.perf_counter()
+                try:
+                    slot = self._idle.get(timeout=self.acquire_timeout)
+                except queue.Empty:
+                    self.timeouts += 1
+                    raise PoolTimeoutError(
+                        f"No hay conexiones libres en el pool ({self.size}) tras {self.acquire_timeout}s"
+                    )
+                finally:
+                    self.waits += 1
+                    self.wait_seconds += time.perf_counter() - started
+
+        slot.in_use = True
+        slot.uses += 1
+        slot.acquired_at = time.perf_counter()
+        return slot.conn
+
+    def release(self, conn):
+        slot = self._slots.get(id(conn))
+        if slot is None:
+            conn.close()
+            return
+        if conn.in_transaction:
+            conn.rollback()
+        held = time.perf_counter() - slot.acquired_at
+        slot.busy_seconds += held
+        slot.max_hold_seconds = max(slot.max_hold_seconds, held)
+        slot.last_used_at = time.time()
+        slot.in_use = False
+        self._idle.put(slot)
+
+    def stats(self):
+        slots = sorted(self._slots.values(), key=lambda s: s.index)
+        return {
+            "path": self.path,
+            "mode": "ro" if self.readonly else "rw",
+            "size": self.size,
+            "open": len(slots),
+            "in_use": sum(1 for s in slots if s.in_use),
+            "waits": self.waits,
+            "wait_seconds": round(self.wait_seconds, 6),
+            "timeouts": self.timeouts,
+            "connections": [s.stats() for s in slots],
+        }
+
+    def close(self):
+        while True:
+            try:
+                slot = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._slots.pop(id(slot.conn), None)
+            slot.conn.close()
+        with self._lock:
+            self._created = len(self._slots)
@@ -0,0 +1,140 @@
+import json
+import threading
+import time
+from datetime import datetime
+
+# Buffer de escritura diferida para datos que no necesitan quedar en disco antes
+# de responder: el último acceso de cada usuario y el registro de auditoría.
+# login() y los endpoints de administración solo encolan en memoria; un hilo
+# escritor los guarda en una sola transacción cuando se juntan EVENT_BATCH_SIZE
+# eventos o pasan EVENT_FLUSH_INTERVAL segundos, y close_pools() vacía lo que
+# quede al apagar.
+
+EVENT_BATCH_SIZE = 200
+EVENT_FLUSH_INTERVAL = 1.0
+EVENT_MAX_PENDING = 50000
+
+
+class EventBuffer:
+    def __init__(self, get_pool, batch_size=EVENT_BATCH_SIZE, flush_interval=EVENT_FLUSH_INTERVAL,
+                 max_pending=EVENT_MAX_PENDING):
+        self.get_pool = get_pool
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._logins = {}
+        self._audit = []
+        self._thread = None
+        self.flushes = 0
+        self.written = 0
+        self.dropped = 0
+        self.failures = 0
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="event-writer", daemon=True)
+            self._thread.start()
+
+    def _pending(self):
+        return len(self._logins) + len(self._audit)
+
+    def record_login(self, user_id, when=None):
+        when = when or datetime.now().isoformat()
+        with self._lock:
+            # Solo importa el último acceso de cada usuario
+            if self._logins.get(user_id, "") < when:
+                self._logins[user_id] = when
+            full = self._pending() >= self.batch_size
+            self._ensure_thread()
+        if full:
+            self._wake.set()
+
+    def audit(self, action, actor=None, target_type=None, target_id=None, **details):
+        event = (
+            datetime.now().isoformat(), actor, action, target_type,
+            None if target_id is None else str(target_id),
+            json.dumps(details, ensure_ascii=False, default=str) if details else None,
+        )
+        with self._lock:
+            if len(self._audit) >= self.max_pending:
+                self.dropped += 1
+                return
+            self._audit.append(event)
+            full = self._pending() >= self.batch_size
+            self._ensure_thread()
+        if full:
+            self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                # Se reintenta en el próximo ciclo; los eventos volvieron a la cola
+                time.sleep(self.flush_interval)
+
+    def _requeue(self, logins, audit):
+        with self._lock:
+            for uid, when in logins.items():
+                if self._logins.get(uid, "") < when:
+                    self._logins[uid] = when
+            self._audit[:0] = audit[:max(0, self.max_pending - len(self._audit))]
+
+    def flush(self):
+        with self._flush_lock:
+            if not self._pending():
+                return 0
+
+            # La conexión se pide antes de sacar los eventos de la cola: si el
+            # pool está ocupado (PoolTimeoutError) o no se puede abrir, siguen pendientes
+            try:
+                pool = self.get_pool()
+                conn = pool.acquire()
+            except Exception:
+                self.failures += 1
+                raise
+            try:
+                with self._lock:
+                    logins, self._logins = self._logins, {}
+                    audit, self._audit = self._audit, []
+                if not logins and not audit:
+                    return 0
+                try:
+                    conn.execute("BEGIN IMMEDIATE")
+                    conn.executemany(
+                        "UPDATE users SET last_login = ? WHERE id = ? AND (last_login IS NULL OR last_login < ?)",
+                        [(when, uid, when) for uid, when in logins.items()]
+                    )
+                    conn.executemany(
+                        """
+                        INSERT INTO audit_log (ts, actor, action, target_type, target_id, details)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                        """,
+                        audit
+                    )
+                    conn.commit()
+                except BaseException:
+                    conn.rollback()
+                    self.failures += 1
+                    self._requeue(logins, audit)
+                    raise
+            finally:
+                pool.release(conn)
+
+            self.flushes += 1
+            self.written += len(logins) + len(audit)
+            return len(logins) + len(audit)
+
+    def stats(self):
+        return {
+            "pending": self._pending(),
+            "flushes": self.flushes,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failures": self.failures,
+        }
@@ -0,0 +1,123 @@
+import csv
+import io
+import json
+import zlib
+from datetime import date, timedelta
+
+# Exportación en streaming: las filas se leen en bloques y se van emitiendo
+# como CSV o NDJSON, así la memoria no crece con el tamaño del export. Cada
+# bloque pide una conexión al pool y la devuelve antes de emitirse; el
+# siguiente sigue desde la clave del último (paginación por clave, según
+# "order_by"), así una descarga lenta no retiene conexiones de lectura.
+# Los exports de recibos recorren también los archivos de recibos viejos (ver
+# receipt_archive.py), del más viejo al más nuevo y al final la base principal.
+
+EXPORT_CHUNK_ROWS = 1000
+EXPORT_FORMATS = ("csv", "ndjson")
+
+EXPORTS = {
+    "receipts": {
+        "columns": ["id", "datetime", "sale_date", "customer", "payment_method", "subtotal", "iva", "total"],
+        "sql": "SELECT {columns} FROM {schema}.receipts",
+        "date_column": "sale_date",
+        "archived": True,
+        "order_by": (("datetime", "datetime"), ("id", "id")),
+    },
+    "receipt_items": {
+        "columns": ["id", "receipt_id", "datetime", "product_id", "sku", "name", "qty", "price", "subtotal"],
+        "sql": (
+            "SELECT it.id, it.receipt_id, r.datetime, it.product_id, it.sku, it.name, it.qty, it.price, it.subtotal "
+            "FROM {schema}.receipt_items it JOIN {schema}.receipts r ON r.id = it.receipt_id"
+        ),
+        "date_column": "r.sale_date",
+        "archived": True,
+        "order_by": (("it.id", "id"),),
+    },
+    "inventory": {
+        "columns": ["id", "name", "sku", "stock", "price", "expiry", "category"],
+        "sql": "SELECT {columns} FROM inventory",
+        "date_column": None,
+        "order_by": (("name", "name"), ("id", "id")),
+    },
+}
+
+
+def build_export_query(name, date_from=None, date_to=None, schema="main", after=None, limit=None):
+    # order_by: (expresión SQL, columna exportada); after son los valores de la última fila leída
+    spec = EXPORTS[name]
+    keys = [expr for expr, _ in spec["order_by"]]
+    sql = spec["sql"].format(columns=", ".join(spec["columns"]), schema=schema)
+    where = []
+    params = []
+    if spec["date_column"]:
+        if date_from:
+            where.append(f"{spec['date_column']} >= ?")
+            params.append(date_from)
+        if date_to:
+            where.append(f"{spec['date_column']} <= ?")
+            params.append(date_to)
+    if after is not None:
+        where.append(f"({', '.join(keys)}) > ({', '.join('?' * len(keys))})")
+        params.extend(after)
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {', '.join(keys)}"
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+    return sql, params
+
+
+def _encode_rows(rows, columns, fmt):
+    buf = io.StringIO()
+    if fmt == "csv":
+        csv.writer(buf).writerows(tuple(r) for r in rows)
+    else:
+        for r in rows:
+            buf.write(json.dumps(dict(zip(columns, r)), ensure_ascii=False))
+            buf.write("\n")
+    return buf.getvalue().encode("utf-8")
+
+
+def _read_chunk(pool, name, date_from, date_to, archive, source, after):
+    conn = pool.acquire()
+    try:
+        # Se adjunta recién al llegar a cada archivo: no entran todos a la vez
+        schema = archive.attach(conn, source) if source is not None else "main"
+        sql, params = build_export_query(name, date_from, date_to, schema, after, EXPORT_CHUNK_ROWS)
+        return conn.execute(sql, params).fetchall()
+    finally:
+        pool.release(conn)
+
+
+def stream_export(pool, name, fmt="csv", date_from=None, date_to=None, compress=False, archive=None):
+    columns = EXPORTS[name]["columns"]
+    key_index = [columns.index(column) for _, column in EXPORTS[name]["order_by"]]
+    compressor = zlib.compressobj(wbits=31) if compress else None
+
+    def emit(data):
+        return compressor.compress(data) if compressor else data
+
+    archives = []
+    if archive is not None and EXPORTS[name].get("archived"):
+        upper = (date.fromisoformat(date_to) + timedelta(days=1)).isoformat() if date_to else None
+        conn = pool.acquire()
+        try:
+            archives = archive.archives_in_range(conn, date_from, upper)[::-1]
+        finally:
+            pool.release(conn)
+    if fmt == "csv":
+        buf = io.StringIO()
+        csv.writer(buf).writerow(columns)
+        yield emit(buf.getvalue().encode("utf-8"))
+    for source in [*archives, None]:
+        after = None
+        while True:
+            rows = _read_chunk(pool, name, date_from, date_to, archive, source, after)
+            data = emit(_encode_rows(rows, columns, fmt))
+            if data:
+                yield data
+            if len(rows) < EXPORT_CHUNK_ROWS:
+                break
+            after = tuple(rows[-1][i] for i in key_index)
+    if compressor:
+        yield compressor.flush()
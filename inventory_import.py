@@ -0,0 +1,138 @@
+import csv
+import uuid
+from datetime import date
+
+from stock_ledger import record_movements
+
+# Carga masiva de inventario desde CSV (catálogos de proveedor). Las filas se
+# validan una a una y se insertan o actualizan por SKU en lotes, con una
+# transacción por lote en lugar de una por producto.
+
+IMPORT_BATCH_SIZE = 500
+IMPORT_MAX_REPORTED_ERRORS = 1000
+IMPORT_COLUMNS = ("sku", "name", "stock", "price", "expiry", "category")
+IMPORT_REQUIRED = ("sku", "name")
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+def _validate_row(row, columns):
+    sku = (row.get("sku") or "").strip()
+    if len(sku) < 3:
+        raise ValueError("El SKU debe tener al menos 3 caracteres")
+    name = (row.get("name") or "").strip()
+    if len(name) < 2:
+        raise ValueError("El nombre debe tener al menos 2 caracteres")
+
+    item = {"sku": sku, "name": name}
+    if "stock" in columns:
+        try:
+            item["stock"] = int((row.get("stock") or "0").strip())
+        except ValueError:
+            raise ValueError("Stock inválido")
+        if item["stock"] < 0:
+            raise ValueError("El stock no puede ser negativo")
+    if "price" in columns:
+        try:
+            item["price"] = float((row.get("price") or "0").strip().replace(",", "."))
+        except ValueError:
+            raise ValueError("Precio inválido")
+        if item["price"] < 0:
+            raise ValueError("El precio no puede ser negativo")
+    if "expiry" in columns:
+        expiry = (row.get("expiry") or "").strip()
+        if expiry:
+            try:
+                date.fromisoformat(expiry)
+            except ValueError:
+                raise ValueError("Fecha de vencimiento inválida, use AAAA-MM-DD")
+        item["expiry"] = expiry
+    if "category" in columns:
+        item["category"] = (row.get("category") or "").strip()
+    return item
+
+
+def _upsert_sql(columns):
+    cols = ["id"] + list(columns)
+    updates = ", ".join(f"{c} = excluded.{c}" for c in columns if c != "sku")
+    return (
+        f"INSERT INTO inventory ({', '.join(cols)}) VALUES ({', '.join('?' for _ in cols)}) "
+        f"ON CONFLICT(sku) DO UPDATE SET {updates}"
+    )
+
+
+def _flush(conn, sql, columns, batch, report, actor=None):
+    skus = [it["sku"] for it in batch]
+    placeholders = ",".join("?" for _ in skus)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        existing = {
+            r["sku"]: r for r in conn.execute(
+                f"SELECT id, sku, stock FROM inventory WHERE sku IN ({placeholders})", skus
+            )
+        }
+        ids = {it["sku"]: str(uuid.uuid4()) for it in batch}
+        conn.executemany(
+            sql,
+            [(ids[it["sku"]], *(it.get(c) for c in columns)) for it in batch]
+        )
+        # Libro de stock: el alta entra como saldo inicial y, si el archivo trae
+        # stock, la diferencia con el vigente queda como ajuste
+        record_movements(
+            conn, [(ids[it["sku"]], it.get("stock", 0)) for it in batch if it["sku"] not in existing],
+            "initial", actor=actor, note="Importación CSV"
+        )
+        if "stock" in columns:
+            record_movements(
+                conn,
+                [(existing[it["sku"]]["id"], it["stock"] - existing[it["sku"]]["stock"])
+                 for it in batch if it["sku"] in existing],
+                "adjustment", actor=actor, note="Importación CSV"
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    report["updated"] += len(existing)
+    report["inserted"] += len(batch) - len(existing)
+
+
+def import_inventory_csv(conn, text_stream, batch_size=IMPORT_BATCH_SIZE, actor=None):
+    header_line = text_stream.readline()
+    delimiter = ";" if header_line.count(";") > header_line.count(",") else ","
+    header = [h.strip().lower() for h in next(csv.reader([header_line], delimiter=delimiter), [])]
+    missing = [c for c in IMPORT_REQUIRED if c not in header]
+    if missing:
+        raise ImportFormatError(f"Faltan columnas obligatorias: {', '.join(missing)}")
+    columns = [c for c in IMPORT_COLUMNS if c in header]
+    sql = _upsert_sql(columns)
+
+    report = {"rows": 0, "inserted": 0, "updated": 0, "failed": 0, "errors": []}
+    seen = set()
+    batch = []
+    reader = csv.DictReader(text_stream, fieldnames=header, delimiter=delimiter)
+    for line_no, row in enumerate(reader, start=2):
+        if not any((v or "").strip() for v in row.values() if isinstance(v, str)):
+            continue
+        report["rows"] += 1
+        try:
+            item = _validate_row(row, columns)
+            if item["sku"] in seen:
+                raise ValueError("SKU duplicado en el archivo")
+        except ValueError as e:
+            report["failed"] += 1
+            if len(report["errors"]) < IMPORT_MAX_REPORTED_ERRORS:
+                report["errors"].append({"row": line_no, "sku": (row.get("sku") or "").strip(), "error": str(e)})
+            continue
+        seen.add(item["sku"])
+        batch.append(item)
+        if len(batch) >= batch_size:
+            _flush(conn, sql, columns, batch, report, actor)
+            batch = []
+
+    if batch:
+        _flush(conn, sql, columns, batch, report, actor)
+    report["errors_truncated"] = report["failed"] > len(report["errors"])
+    return report
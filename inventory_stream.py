@@ -0,0 +1,229 @@
+import json
+import logging
+import threading
+import time
+from collections import deque
+
+from data_versions import data_version
+
+# Cambios de stock y precio en vivo para las cajas abiertas (/api/inventory/stream).
+# Un solo hilo vigía lee row_versions (migración 8) cuando un endpoint de
+# escritura llama a notify() después del commit, o cada STREAM_POLL_INTERVAL
+# segundos para ver lo que escriban otros procesos. Los deltas compactos
+# ({id, stock, price} o {id, deleted}) quedan en un buffer circular y los
+# suscriptores esperan sobre una única Condition: una conexión ociosa no gasta
+# CPU, solo el hilo de waitress que la atiende. El id de cada evento SSE es la
+# versión de datos del inventario, la misma que devuelve /api/inventory, así
+# que al reconectar (Last-Event-ID) se retoma desde ahí; si el cursor ya salió
+# del buffer, lo que falta se lee de la base.
+
+STREAM_POLL_INTERVAL = 1.0
+STREAM_BACKLOG = 5000
+STREAM_HEARTBEAT = 15.0
+STREAM_RETRY_MS = 3000
+
+_DELTAS_SQL = """
+    SELECT rv.row_id, rv.version, rv.deleted, i.stock, i.price
+    FROM row_versions rv
+    LEFT JOIN inventory i ON i.id = rv.row_id
+    WHERE rv.table_name = 'inventory' AND rv.version > ?
+    ORDER BY rv.version
+"""
+
+
+log = logging.getLogger("farmasys.inventory_stream")
+
+
+class StreamUnavailable(RuntimeError):
+    pass
+
+
+def _delta(row):
+    if row["deleted"] or row["stock"] is None:
+        return {"id": row["row_id"], "deleted": True}
+    return {"id": row["row_id"], "stock": row["stock"], "price": row["price"]}
+
+
+def _collapse(deltas):
+    # Si un producto cambió varias veces solo importa su último estado
+    latest = {}
+    for delta in deltas:
+        latest.pop(delta["id"], None)
+        latest[delta["id"]] = delta
+    return list(latest.values())
+
+
+def _event(name, version, data):
+    return f"id: {version}\nevent: {name}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode("utf-8")
+
+
+class _Subscription:
+    # El contador de suscriptores se libera en close(), que el servidor WSGI
+    # llama aunque el cliente se haya ido antes de recibir el primer byte.
+    def __init__(self, hub, cursor, heartbeat):
+        self.hub = hub
+        self._events = hub._events_for(cursor, heartbeat)
+        self._closed = False
+
+    def __iter__(self):
+        return self._events
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._events.close()
+        self.hub._unsubscribe()
+
+
+class InventoryHub:
+    def __init__(self, get_pool, max_subscribers, poll_interval=STREAM_POLL_INTERVAL,
+                 backlog=STREAM_BACKLOG):
+        self.get_pool = get_pool
+        self.max_subscribers = max_subscribers
+        self.poll_interval = poll_interval
+        self._changed = threading.Condition()
+        self._wake = threading.Event()
+        self._buffer = deque(maxlen=backlog)
+        # Los cambios con versión <= _floor ya no están en el buffer
+        self._floor = None
+        self.version = None
+        self.subscribers = 0
+        self.closed = False
+        self._thread = None
+        self.polls = 0
+        self.published = 0
+        self.replays = 0
+        self.rejected = 0
+        self.failures = 0
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="inventory-stream", daemon=True)
+            self._thread.start()
+
+    def notify(self):
+        # Sin suscriptores no hay a quién avisar; el próximo arranca desde la versión actual
+        if self._thread is not None:
+            self._wake.set()
+
+    def _run(self):
+        while not self.closed:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            try:
+                self.poll()
+            except Exception:
+                # Pool ocupado (PoolTimeoutError), base bloqueada o cualquier otro
+                # error: el vigía es uno solo para todos, así que reintenta y sigue
+                self.failures += 1
+                log.exception("Falló la lectura de cambios de inventario")
+                time.sleep(self.poll_interval)
+
+    def _read(self, since):
+        pool = self.get_pool()
+        conn = pool.acquire()
+        try:
+            if since is None:
+                return data_version(conn, "inventory"), []
+            return since, conn.execute(_DELTAS_SQL, (since,)).fetchall()
+        finally:
+            pool.release(conn)
+
+    def poll(self):
+        with self._changed:
+            since = self.version
+        version, rows = self._read(since)
+        with self._changed:
+            self.polls += 1
+            if self.version is None:
+                self.version = self._floor = version
+                self._changed.notify_all()
+                return
+            if self.version != since:
+                return
+            for row in rows:
+                if len(self._buffer) == self._buffer.maxlen:
+                    self._floor = self._buffer[0][0]
+                self._buffer.append((row["version"], _delta(row)))
+            if rows:
+                # Las filas salen de una sola lectura: nada anterior a la última puede faltar
+                self.version = rows[-1]["version"]
+                self.published += len(rows)
+                self._changed.notify_all()
+
+    def subscribe(self, cursor=None, heartbeat=STREAM_HEARTBEAT):
+        with self._changed:
+            if self.closed:
+                raise StreamUnavailable("El servidor se está apagando")
+            if self.subscribers >= self.max_subscribers:
+                self.rejected += 1
+                raise StreamUnavailable("Demasiadas conexiones en vivo abiertas")
+            self.subscribers += 1
+        try:
+            self._ensure_thread()
+            if self.version is None:
+                self.poll()
+        except BaseException:
+            self._unsubscribe()
+            raise
+        return _Subscription(self, cursor, heartbeat)
+
+    def _unsubscribe(self):
+        with self._changed:
+            self.subscribers -= 1
+
+    def _since(self, cursor):
+        # Cambios posteriores a cursor: del buffer si alcanza, si no de la base
+        with self._changed:
+            version = self.version
+            if cursor >= self._floor:
+                return version, _collapse(d for v, d in self._buffer if v > cursor)
+        self.replays += 1
+        _, rows = self._read(cursor)
+        rows = [row for row in rows if row["version"] <= version]
+        return version, _collapse(_delta(row) for row in rows)
+
+    def _events_for(self, cursor, heartbeat):
+        with self._changed:
+            version = self.version
+        yield f"retry: {STREAM_RETRY_MS}\n".encode("utf-8")
+        if cursor is None or cursor > version:
+            # Sin cursor, o de otra base (restaurada, recreada): el cliente recarga todo
+            if cursor is not None:
+                yield _event("reset", version, {"version": version})
+            cursor = version
+        yield _event("ready", cursor, {"version": cursor})
+        while True:
+            with self._changed:
+                self._changed.wait_for(lambda: self.closed or self.version > cursor, heartbeat)
+                if self.closed:
+                    return
+                pending = self.version > cursor
+            if not pending:
+                # Comentario SSE: mantiene viva la conexión y detecta clientes caídos
+                yield b": ping\n\n"
+                continue
+            version, deltas = self._since(cursor)
+            if deltas:
+                yield _event("stock", version, deltas)
+            cursor = version
+
+    def close(self):
+        with self._changed:
+            self.closed = True
+            self._changed.notify_all()
+        self._wake.set()
+
+    def stats(self):
+        return {
+            "subscribers": self.subscribers,
+            "max_subscribers": self.max_subscribers,
+            "version": self.version,
+            "buffered": len(self._buffer),
+            "polls": self.polls,
+            "published": self.published,
+            "replays": self.replays,
+            "rejected": self.rejected,
+            "failures": self.failures,
+        }
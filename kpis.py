@@ -0,0 +1,95 @@
+import threading
+from datetime import date
+
+# Indicadores del dashboard. La fila única de kpi_counters la mantienen los
+# triggers de inventory y receipts (migración 6); aquí solo se lee, con una
+# caché en proceso que se invalida cuando cambia kpi_counters.version.
+
+LOW_STOCK_MIN = 0
+LOW_STOCK_MAX = 100000
+
+
+class KpiCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, conn):
+        version = conn.execute("SELECT version FROM kpi_counters WHERE id = 1").fetchone()[0]
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None and snapshot["version"] == version:
+                self.hits += 1
+                return snapshot
+            self.misses += 1
+
+        snapshot = dict(conn.execute("SELECT * FROM kpi_counters WHERE id = 1").fetchone())
+        with self._lock:
+            if self._snapshot is None or snapshot["version"] >= self._snapshot["version"]:
+                self._snapshot = snapshot
+        return snapshot
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {
+            "version": snapshot["version"] if snapshot else None,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+def dashboard_kpis(kpis, today=None):
+    today = (today or date.today()).isoformat()
+    return {
+        "total_items": kpis["total_stock"],
+        "low_stock": kpis["low_stock"],
+        "low_stock_threshold": kpis["low_stock_threshold"],
+        "today_sales": kpis["sales_day_total"] if kpis["sales_day"] == today else 0,
+        "receipts_count": kpis["receipts_count"],
+    }
+
+
+def set_low_stock_threshold(conn, threshold):
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(
+            """
+            UPDATE kpi_counters SET
+                low_stock_threshold = ?,
+                low_stock = (SELECT COUNT(*) FROM inventory WHERE stock <= ?),
+                version = version + 1
+            WHERE id = 1
+            """,
+            (threshold, threshold)
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def recount_kpis(conn):
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(
+            """
+            UPDATE kpi_counters SET
+                total_stock = (SELECT COALESCE(SUM(stock), 0) FROM inventory),
+                low_stock = (SELECT COUNT(*) FROM inventory WHERE stock <= low_stock_threshold),
+                receipts_count = (SELECT COUNT(*) FROM receipts) + (SELECT COUNT(*) FROM receipt_archive_index),
+                sales_day = COALESCE((SELECT MAX(sale_date) FROM receipts), ''),
+                sales_day_total = COALESCE(
+                    (SELECT SUM(total) FROM receipts WHERE sale_date = (SELECT MAX(sale_date) FROM receipts)), 0
+                ),
+                version = version + 1
+            WHERE id = 1
+            """
+        )
+        row = conn.execute("SELECT * FROM kpi_counters WHERE id = 1").fetchone()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return dict(row)
@@ -0,0 +1,274 @@
+import hashlib
+import json
+import os
+import tempfile
+from types import SimpleNamespace
+from xml.sax.saxutils import escape
+
+mm = 72 / 25.4  # igual a reportlab.lib.units.mm
+
+# Etiquetas con código de barras generadas en el servidor. Cada etiqueta se
+# calcula una sola vez como geometría (barras + textos, en puntos) y se guarda
+# en disco bajo el hash de su contenido; las hojas SVG o PDF se arman a partir
+# de esa geometría, de modo que solo se vuelven a calcular las etiquetas cuyo
+# SKU, nombre o precio cambió.
+
+LABEL_RENDER_VERSION = 1
+LABEL_PARALLEL_THRESHOLD = 2000
+LABEL_FORMATS = ("pdf", "svg")
+
+# Medidas en mm: página, rejilla, tamaño de etiqueta, margen superior izquierdo y separación.
+LABEL_LAYOUTS = {
+    "a4-3x8": {"page": (210, 297), "cols": 3, "rows": 8, "label": (70, 37), "margin": (0, 0.5), "gap": (0, 0)},
+    "a4-4x10": {"page": (210, 297), "cols": 4, "rows": 10, "label": (52.5, 29.7), "margin": (0, 0), "gap": (0, 0)},
+    "roll-50x25": {"page": (50, 25), "cols": 1, "rows": 1, "label": (50, 25), "margin": (0, 0), "gap": (0, 0)},
+}
+
+
+class LabelRendererUnavailable(RuntimeError):
+    pass
+
+
+_reportlab = None
+
+
+def _rl():
+    # reportlab tarda ~90 ms en importarse: se carga con la primera etiqueta y no al arrancar
+    global _reportlab
+    if _reportlab is None:
+        try:
+            from reportlab.graphics.barcode.code128 import Code128
+            from reportlab.pdfbase.pdfmetrics import stringWidth
+            from reportlab.pdfgen import canvas
+        except ImportError:  # reportlab solo hace falta para generar etiquetas
+            raise LabelRendererUnavailable("reportlab no está instalado")
+        _reportlab = SimpleNamespace(Code128=Code128, stringWidth=stringWidth, canvas=canvas)
+    return _reportlab
+
+
+def _is_ean13(sku):
+    if not sku.isdigit() or len(sku) not in (12, 13):
+        return False
+    if len(sku) == 12:
+        return True
+    digits = [int(c) for c in sku]
+    check = (10 - sum(d * (3 if i % 2 else 1) for i, d in enumerate(digits[:12])) % 10) % 10
+    return check == digits[12]
+
+
+def label_key(layout, product):
+    raw = json.dumps(
+        [LABEL_RENDER_VERSION, LABEL_LAYOUTS[layout]["label"], product["sku"], product["name"], round(product["price"], 2)],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _fit_text(text, font, size, max_width):
+    stringWidth = _rl().stringWidth
+    if stringWidth(text, font, size) <= max_width:
+        return text
+    while text and stringWidth(text + "…", font, size) > max_width:
+        text = text[:-1]
+    return text + "…"
+
+
+_EAN_L = ("0001101", "0011001", "0010011", "0111101", "0100011",
+          "0110001", "0101111", "0111011", "0110111", "0001011")
+_EAN_G = ("0100111", "0110011", "0011011", "0100001", "0011101",
+          "0111001", "0000101", "0010001", "0001001", "0010111")
+_EAN_R = ("1110010", "1100110", "1101100", "1000010", "1011100",
+          "1001110", "1010000", "1000100", "1001000", "1110100")
+_EAN_PARITY = ("LLLLLL", "LLGLGG", "LLGGLG", "LLGGGL", "LGLLGG",
+               "LGGLLG", "LGGGLL", "LGLGLG", "LGLGGL", "LGGLGL")
+
+
+def _ean13_bars(sku):
+    digits = [int(c) for c in sku[:12]]
+    digits.append((10 - sum(d * (3 if i % 2 else 1) for i, d in enumerate(digits)) % 10) % 10)
+    parity = _EAN_PARITY[digits[0]]
+    bits = "101"
+    for p, d in zip(parity, digits[1:7]):
+        bits += (_EAN_L if p == "L" else _EAN_G)[d]
+    bits += "01010"
+    bits += "".join(_EAN_R[d] for d in digits[7:])
+    bits += "101"
+
+    bars = []
+    start = None
+    for i, bit in enumerate(bits + "0"):
+        if bit == "1" and start is None:
+            start = i
+        elif bit == "0" and start is not None:
+            bars.append((start, i - start))
+            start = None
+    return bars, len(bits)
+
+
+def _code128_bars(sku):
+    # Se usa el codificador de reportlab en unidades de módulo, recogiendo las
+    # barras en una lista en lugar de dibujarlas en un canvas.
+    bars = []
+    code = _rl().Code128(sku, barWidth=1, barHeight=1, quiet=0, humanReadable=0)
+    code.rect = lambda x, y, w, h: bars.append((x, w))
+    code.draw()
+    return bars, code.width
+
+
+def render_label_geometry(args):
+    layout, product = args
+    rl = _rl()
+
+    lw, lh = (v * mm for v in LABEL_LAYOUTS[layout]["label"])
+    pad = min(lw, lh) * 0.08
+    name_size = max(6, min(9, lh / 5))
+    small_size = max(5, name_size - 1.5)
+
+    sku = product["sku"]
+    bars, modules = _ean13_bars(sku) if _is_ean13(sku) else _code128_bars(sku)
+
+    module_w = min((lw - 2 * pad) / modules, 0.5 * mm)
+    bar_h = lh - 2 * pad - name_size * 1.2 - small_size * 1.3
+    ox = (lw - modules * module_w) / 2
+    oy = pad + small_size * 1.3
+    rects = [
+        [round(ox + x * module_w, 3), round(oy, 3), round(w * module_w, 3), round(bar_h, 3)]
+        for x, w in bars
+    ]
+
+    price = f"$ {product['price']:.2f}"
+    price_w = rl.stringWidth(price, "Helvetica-Bold", name_size)
+    name = _fit_text(product["name"], "Helvetica-Bold", name_size, lw - 3 * pad - price_w)
+    texts = [
+        [pad, lh - pad - name_size, name_size, "Helvetica-Bold", "start", name],
+        [lw - pad, lh - pad - name_size, name_size, "Helvetica-Bold", "end", price],
+        [lw / 2, pad, small_size, "Helvetica", "middle", sku],
+    ]
+    return {"w": round(lw, 3), "h": round(lh, 3), "rects": rects, "texts": texts}
+
+
+class LabelCache:
+    def __init__(self, directory):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def get(self, key):
+        try:
+            with open(self._path(key), encoding="utf-8") as fh:
+                geometry = json.load(fh)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return geometry
+
+    def put(self, key, geometry):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            json.dump(geometry, fh, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    def stats(self):
+        return {"directory": self.directory, "hits": self.hits, "misses": self.misses}
+
+
+def build_label_geometries(products, layout, cache, workers=None):
+    keys = [label_key(layout, p) for p in products]
+    geometries = {}
+    pending = []
+    for key, product in zip(keys, products):
+        if key in geometries:
+            continue
+        cached = cache.get(key)
+        if cached is not None:
+            geometries[key] = cached
+        else:
+            geometries[key] = None
+            pending.append((key, product))
+
+    if pending:
+        jobs = [(layout, {"sku": p["sku"], "name": p["name"], "price": p["price"]}) for _, p in pending]
+        if len(jobs) >= LABEL_PARALLEL_THRESHOLD:
+            from concurrent.futures import ProcessPoolExecutor  # multiprocessing solo para lotes grandes
+
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                rendered = list(pool.map(render_label_geometry, jobs, chunksize=64))
+        else:
+            rendered = [render_label_geometry(job) for job in jobs]
+        for (key, _), geometry in zip(pending, rendered):
+            cache.put(key, geometry)
+            geometries[key] = geometry
+
+    return [geometries[k] for k in keys]
+
+
+def _positions(layout, count):
+    spec = LABEL_LAYOUTS[layout]
+    page_w, page_h = (v * mm for v in spec["page"])
+    lw, lh = (v * mm for v in spec["label"])
+    mx, my = (v * mm for v in spec["margin"])
+    gx, gy = (v * mm for v in spec["gap"])
+    per_page = spec["cols"] * spec["rows"]
+    for i in range(count):
+        page, slot = divmod(i, per_page)
+        row, col = divmod(slot, spec["cols"])
+        x = mx + col * (lw + gx)
+        y_top = my + row * (lh + gy)
+        yield page, x, page_h - y_top - lh
+
+
+def render_sheet_pdf(layout, geometries, out):
+    rl = _rl()
+    spec = LABEL_LAYOUTS[layout]
+    page_size = tuple(v * mm for v in spec["page"])
+    c = rl.canvas.Canvas(out, pagesize=page_size)
+    current_page = 0
+    for (page, x, y), g in zip(_positions(layout, len(geometries)), geometries):
+        if page != current_page:
+            c.showPage()
+            current_page = page
+        for rx, ry, rw, rh in g["rects"]:
+            c.rect(x + rx, y + ry, rw, rh, stroke=0, fill=1)
+        for tx, ty, size, font, anchor, text in g["texts"]:
+            c.setFont(font, size)
+            if anchor == "middle":
+                c.drawCentredString(x + tx, y + ty, text)
+            elif anchor == "end":
+                c.drawRightString(x + tx, y + ty, text)
+            else:
+                c.drawString(x + tx, y + ty, text)
+    c.save()
+
+
+def render_sheet_svg(layout, geometries):
+    spec = LABEL_LAYOUTS[layout]
+    page_w, page_h = (v * mm for v in spec["page"])
+    per_page = spec["cols"] * spec["rows"]
+    pages = max(1, -(-len(geometries) // per_page))
+    total_h = page_h * pages
+
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{page_w:.2f}pt" height="{total_h:.2f}pt" '
+        f'viewBox="0 0 {page_w:.2f} {total_h:.2f}">'
+    ]
+    for (page, x, y), g in zip(_positions(layout, len(geometries)), geometries):
+        # El SVG crece hacia abajo: se invierte el eje y respecto del PDF
+        top = page * page_h + (page_h - y - g["h"])
+        parts.append(f'<g transform="translate({x:.2f},{top:.2f})">')
+        for rx, ry, rw, rh in g["rects"]:
+            parts.append(f'<rect x="{rx}" y="{g["h"] - ry - rh:.3f}" width="{rw}" height="{rh}"/>')
+        for tx, ty, size, font, anchor, text in g["texts"]:
+            weight = ' font-weight="bold"' if font.endswith("Bold") else ""
+            parts.append(
+                f'<text x="{tx:.2f}" y="{g["h"] - ty:.2f}" font-family="Helvetica, Arial, sans-serif" '
+                f'font-size="{size}"{weight} text-anchor="{anchor}">{escape(text)}</text>'
+            )
+        parts.append("</g>")
+    parts.append("</svg>")
+    return "".join(parts)
@@ -1,14 +1,31 @@
-
 import webview
-import threading
-from app import app
 
-def start_flask():
-    # Use a fixed port for the window URL
-    app.run(host='127.0.0.1', port=5000, debug=False)
+LOADING_HTML = """<!doctype html>
+<html><body style="font-family: sans-serif; display: flex; align-items: center; justify-content: center;
+height: 100vh; margin: 0; color: #555;"><p>Iniciando FarmaSys…</p></body></html>"""
+
+
+def start_server(window, state):
+    # Flask, la base y el servidor se cargan aquí, con la ventana ya visible
+    from app import app, inventory_hub, warm_up
+    from server import FarmasysServer
+
+    # Mismo servidor que "flask --app app serve"; puerto fijo para la URL de la
+    # ventana. Sin streams en vivo: la única pantalla es la de esta misma caja
+    state["server"] = FarmasysServer(
+        app, host='127.0.0.1', port=5000, stream_slots=0, stream_hub=inventory_hub, on_drain=inventory_hub.close
+    ).start()
+    warm_up()
+    window.load_url(state["server"].url)
+
 
 if __name__ == '__main__':
-    t = threading.Thread(target=start_flask, daemon=True)
-    t.start()
-    webview.create_window("FarmaSys - Desktop", "http://127.0.0.1:5000", width=1200, height=800, resizable=True)
-    webview.start()
+    state = {}
+    window = webview.create_window("FarmaSys - Desktop", html=LOADING_HTML, width=1200, height=800, resizable=True)
+    webview.start(start_server, (window, state))
+    if "server" in state:
+        from app import close_pools
+
+        # Al cerrar la ventana se espera a que terminen los checkouts en curso
+        state["server"].shutdown()
+        close_pools()
@@ -0,0 +1,254 @@
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+
+# Métricas por endpoint: latencia (histograma + percentiles de una ventana
+# reciente), cantidad de sentencias SQL y tiempo en SQL por petición. Las
+# conexiones del pool usan InstrumentedConnection, que cronometra cada
+# execute/fetch y lo suma a la petición en curso a través de current_sql; las
+# sentencias que superan el umbral van además al registro de consultas lentas.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250)
+PERCENTILE_WINDOW = 1024
+PERCENTILES = (50, 95, 99)
+
+POOL_METRICS = (
+    ("size", "gauge", "Conexiones máximas del pool"),
+    ("open", "gauge", "Conexiones abiertas"),
+    ("in_use", "gauge", "Conexiones prestadas en este momento"),
+    ("waits", "counter", "Veces que una petición esperó una conexión libre"),
+    ("wait_seconds", "counter", "Tiempo total esperando conexiones"),
+    ("timeouts", "counter", "Esperas que terminaron sin conexión"),
+)
+CACHE_METRICS = (
+    ("entries", "gauge", "Entradas guardadas en la caché"),
+    ("bytes", "gauge", "Tamaño de la caché en bytes"),
+    ("max_bytes", "gauge", "Tamaño máximo de la caché en bytes"),
+    ("version", "gauge", "Versión de datos con la que está al día la caché"),
+    ("hits", "counter", "Lecturas resueltas desde la caché"),
+    ("misses", "counter", "Lecturas que tuvieron que ir a la base o generar el contenido"),
+    ("invalidations", "counter", "Invalidaciones por escrituras del proceso"),
+    ("syncs", "counter", "Sincronizaciones por cambios de versión de datos"),
+    ("evictions", "counter", "Entradas descartadas por falta de espacio"),
+)
+
+current_sql = ContextVar("current_sql", default=None)
+
+
+class SqlTally:
+    __slots__ = ("statements", "seconds", "endpoint")
+
+    def __init__(self, endpoint=None):
+        self.statements = 0
+        self.seconds = 0.0
+        self.endpoint = endpoint
+
+
+_slow_query_log = None
+
+
+def set_slow_query_log(log):
+    global _slow_query_log
+    _slow_query_log = log
+
+
+def _timed(method):
+    def wrapper(self, *args, **kwargs):
+        tally = current_sql.get()
+        if tally is None:
+            return method(self, *args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            tally.seconds += time.perf_counter() - started
+    return wrapper
+
+
+def _observe(cursor, sql, parameters, seconds, many):
+    tally = current_sql.get()
+    if tally is not None:
+        tally.statements += 1
+        tally.seconds += seconds
+    log = _slow_query_log
+    if log is not None and seconds >= log.threshold:
+        log.record(cursor.connection, sql, parameters, seconds, many, tally.endpoint if tally else None)
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _observe(self, sql, parameters, time.perf_counter() - started, False)
+
+    def executemany(self, sql, seq_of_parameters):
+        if _slow_query_log is not None and not isinstance(seq_of_parameters, (list, tuple)):
+            seq_of_parameters = list(seq_of_parameters)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _observe(self, sql, seq_of_parameters, time.perf_counter() - started, True)
+
+    fetchone = _timed(sqlite3.Cursor.fetchone)
+    fetchmany = _timed(sqlite3.Cursor.fetchmany)
+    fetchall = _timed(sqlite3.Cursor.fetchall)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    # Connection.execute() de sqlite3 no pasa por Cursor.execute(); se
+    # redirige al cursor instrumentado para que cuente igual.
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    commit = _timed(sqlite3.Connection.commit)
+    rollback = _timed(sqlite3.Connection.rollback)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, n in zip(self.buckets + (float("inf"),), self.counts):
+            total += n
+            yield bound, total
+
+
+class EndpointStats:
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.sql_per_request = Histogram(SQL_COUNT_BUCKETS)
+        self.recent = deque(maxlen=PERCENTILE_WINDOW)
+        self.statuses = {}
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+
+    def percentiles(self):
+        samples = sorted(self.recent)
+        if not samples:
+            return {f"p{p}": None for p in PERCENTILES}
+        return {
+            f"p{p}": round(samples[min(len(samples) - 1, int(len(samples) * p / 100))], 6)
+            for p in PERCENTILES
+        }
+
+
+class RequestMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self.started_at = time.time()
+
+    def record(self, endpoint, method, status, seconds, tally):
+        with self._lock:
+            stats = self._endpoints.get((endpoint, method))
+            if stats is None:
+                stats = self._endpoints[(endpoint, method)] = EndpointStats()
+            stats.latency.observe(seconds)
+            stats.recent.append(seconds)
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+            if tally is not None:
+                stats.sql_per_request.observe(tally.statements)
+                stats.sql_statements += tally.statements
+                stats.sql_seconds += tally.seconds
+
+    def snapshot(self):
+        with self._lock:
+            endpoints = []
+            for (endpoint, method), s in sorted(self._endpoints.items()):
+                count = s.latency.count
+                endpoints.append({
+                    "endpoint": endpoint,
+                    "method": method,
+                    "requests": count,
+                    "statuses": dict(s.statuses),
+                    "latency_avg": round(s.latency.sum / count, 6) if count else None,
+                    **s.percentiles(),
+                    "sql_statements": s.sql_statements,
+                    "sql_per_request_avg": round(s.sql_statements / count, 2) if count else None,
+                    "sql_seconds": round(s.sql_seconds, 6),
+                    "sql_share": round(s.sql_seconds / s.latency.sum, 4) if s.latency.sum else None,
+                })
+        return {"uptime_seconds": round(time.time() - self.started_at, 1), "endpoints": endpoints}
+
+    def prometheus(self, pools=None, caches=None):
+        lines = []
+
+        def header(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        def histogram(name, label, hist):
+            for bound, total in hist.cumulative():
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{name}_bucket{{{label},le="{le}"}} {total}')
+            lines.append(f"{name}_sum{{{label}}} {hist.sum:.6f}")
+            lines.append(f"{name}_count{{{label}}} {hist.count}")
+
+        with self._lock:
+            items = sorted(self._endpoints.items())
+            labels = [(f'endpoint="{e}",method="{m}"', s) for (e, m), s in items]
+
+            header("farmasys_request_duration_seconds", "histogram", "Latencia de las peticiones por endpoint")
+            for label, s in labels:
+                histogram("farmasys_request_duration_seconds", label, s.latency)
+
+            header("farmasys_requests_total", "counter", "Peticiones por endpoint y código de estado")
+            for label, s in labels:
+                for status, n in sorted(s.statuses.items()):
+                    lines.append(f'farmasys_requests_total{{{label},status="{status}"}} {n}')
+
+            header("farmasys_sql_statements_per_request", "histogram", "Sentencias SQL por petición")
+            for label, s in labels:
+                histogram("farmasys_sql_statements_per_request", label, s.sql_per_request)
+
+            header("farmasys_sql_seconds_total", "counter", "Tiempo total en SQLite por endpoint")
+            for label, s in labels:
+                lines.append(f"farmasys_sql_seconds_total{{{label}}} {s.sql_seconds:.6f}")
+
+        for key, kind, help_text in POOL_METRICS:
+            name = f"farmasys_db_pool_{key}" + ("_total" if kind == "counter" else "")
+            header(name, kind, help_text)
+            for mode, stats in sorted((pools or {}).items()):
+                lines.append(f'{name}{{pool="{mode}"}} {stats[key]}')
+
+        # Una familia por métrica, con todas sus cachés juntas debajo del encabezado
+        for key, kind, help_text in CACHE_METRICS:
+            samples = [
+                (cache, stats[key]) for cache, stats in sorted((caches or {}).items())
+                if isinstance(stats.get(key), (int, float)) and not isinstance(stats.get(key), bool)
+            ]
+            if not samples:
+                continue
+            name = f"farmasys_cache_{key}" + ("_total" if kind == "counter" else "")
+            header(name, kind, help_text)
+            for cache, value in samples:
+                lines.append(f'{name}{{cache="{cache}"}} {value}')
+
+        return "\n".join(lines) + "\n"
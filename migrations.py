@@ -0,0 +1,560 @@
+from datetime import datetime
+
+# Cada migración se ejecuta una sola vez, en su propia transacción, y deja
+# PRAGMA user_version apuntando a su número. Nunca se editan las ya publicadas:
+# los cambios de esquema se agregan al final de MIGRATIONS.
+
+
+def column_exists(conn, table, column):
+    return any(row[1] == column for row in conn.execute(f"PRAGMA table_info({table})"))
+
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def _m001_base_schema(conn):
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id TEXT PRIMARY KEY,
+            full_name TEXT NOT NULL,
+            username TEXT NOT NULL UNIQUE,
+            email TEXT NOT NULL UNIQUE,
+            role TEXT NOT NULL,
+            status TEXT NOT NULL,
+            password TEXT NOT NULL,
+            last_login TEXT,
+            can_manage_users INTEGER NOT NULL DEFAULT 0,
+            can_manage_inventory INTEGER NOT NULL DEFAULT 0,
+            can_view_reports INTEGER NOT NULL DEFAULT 0,
+            can_export_data INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS inventory (
+            id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            sku TEXT NOT NULL UNIQUE,
+            stock INTEGER NOT NULL DEFAULT 0,
+            price REAL NOT NULL DEFAULT 0,
+            expiry TEXT,
+            category TEXT
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS receipts (
+            id TEXT PRIMARY KEY,
+            datetime TEXT NOT NULL,
+            customer TEXT,
+            payment_method TEXT,
+            subtotal REAL NOT NULL DEFAULT 0,
+            iva REAL NOT NULL DEFAULT 0,
+            total REAL NOT NULL DEFAULT 0
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS receipt_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            receipt_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            qty INTEGER NOT NULL,
+            price REAL NOT NULL,
+            subtotal REAL NOT NULL,
+            FOREIGN KEY (receipt_id) REFERENCES receipts(id) ON DELETE CASCADE
+        )
+        """
+    )
+
+
+def _m002_sale_date_and_indexes(conn):
+    if not column_exists(conn, "receipts", "sale_date"):
+        conn.execute("ALTER TABLE receipts ADD COLUMN sale_date TEXT")
+    conn.execute("UPDATE receipts SET sale_date = substr(datetime, 1, 10) WHERE sale_date IS NULL")
+
+    # (sale_date, total) cubre por completo las sumas por día del dashboard y reportes
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_receipts_sale_date ON receipts(sale_date, total)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_receipts_datetime_id ON receipts(datetime, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_receipt_items_receipt_id ON receipt_items(receipt_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_receipt_items_name ON receipt_items(name)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_inventory_stock ON inventory(stock)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_inventory_expiry ON inventory(expiry)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_inventory_category ON inventory(category)")
+
+
+def _m003_daily_rollups(conn):
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS daily_sales (
+            sale_date TEXT PRIMARY KEY,
+            receipts_count INTEGER NOT NULL DEFAULT 0,
+            subtotal REAL NOT NULL DEFAULT 0,
+            iva REAL NOT NULL DEFAULT 0,
+            total REAL NOT NULL DEFAULT 0
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS daily_product_sales (
+            sale_date TEXT NOT NULL,
+            name TEXT NOT NULL,
+            category TEXT NOT NULL DEFAULT '',
+            qty INTEGER NOT NULL DEFAULT 0,
+            revenue REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (sale_date, name)
+        )
+        """
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_daily_product_sales_category ON daily_product_sales(category, sale_date)"
+    )
+    conn.execute(
+        """
+        INSERT OR REPLACE INTO daily_sales (sale_date, receipts_count, subtotal, iva, total)
+        SELECT sale_date, COUNT(*), SUM(subtotal), SUM(iva), SUM(total)
+        FROM receipts
+        GROUP BY sale_date
+        """
+    )
+    conn.execute(
+        """
+        INSERT OR REPLACE INTO daily_product_sales (sale_date, name, category, qty, revenue)
+        SELECT r.sale_date, it.name,
+               COALESCE((SELECT category FROM inventory WHERE name = it.name LIMIT 1), ''),
+               SUM(it.qty), SUM(it.subtotal)
+        FROM receipt_items it
+        JOIN receipts r ON r.id = it.receipt_id
+        GROUP BY r.sale_date, it.name
+        """
+    )
+
+
+def _m004_checkout_idempotency(conn):
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS checkout_idempotency (
+            key TEXT PRIMARY KEY,
+            receipt_id TEXT NOT NULL,
+            total REAL NOT NULL,
+            created_at TEXT NOT NULL
+        )
+        """
+    )
+
+
+def _m005_inventory_search(conn):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_inventory_name ON inventory(name, id)")
+    # Índice de texto externo sobre inventory (por rowid), mantenido por triggers.
+    # Solo se reindexa cuando cambian name, sku o category, no en cada venta.
+    conn.execute(
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS inventory_fts USING fts5(
+            name, sku, category,
+            content='inventory', content_rowid='rowid',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS inventory_fts_ai AFTER INSERT ON inventory BEGIN
+            INSERT INTO inventory_fts(rowid, name, sku, category)
+            VALUES (new.rowid, new.name, new.sku, new.category);
+        END
+        """
+    )
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS inventory_fts_ad AFTER DELETE ON inventory BEGIN
+            INSERT INTO inventory_fts(inventory_fts, rowid, name, sku, category)
+            VALUES ('delete', old.rowid, old.name, old.sku, old.category);
+        END
+        """
+    )
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS inventory_fts_au AFTER UPDATE OF name, sku, category ON inventory BEGIN
+            INSERT INTO inventory_fts(inventory_fts, rowid, name, sku, category)
+            VALUES ('delete', old.rowid, old.name, old.sku, old.category);
+            INSERT INTO inventory_fts(rowid, name, sku, category)
+            VALUES (new.rowid, new.name, new.sku, new.category);
+        END
+        """
+    )
+    conn.execute("INSERT INTO inventory_fts(inventory_fts) VALUES ('rebuild')")
+
+
+def _m006_kpi_counters(conn):
+    # Una sola fila con los indicadores del dashboard, mantenida por triggers.
+    # "version" sube con cada cambio y sirve para validar la caché en proceso.
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS kpi_counters (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            total_stock INTEGER NOT NULL DEFAULT 0,
+            low_stock INTEGER NOT NULL DEFAULT 0,
+            low_stock_threshold INTEGER NOT NULL DEFAULT 10,
+            receipts_count INTEGER NOT NULL DEFAULT 0,
+            sales_day TEXT NOT NULL DEFAULT '',
+            sales_day_total REAL NOT NULL DEFAULT 0,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+        """
+    )
+    conn.execute("INSERT OR IGNORE INTO kpi_counters (id) VALUES (1)")
+    conn.execute(
+        """
+        UPDATE kpi_counters SET
+            total_stock = (SELECT COALESCE(SUM(stock), 0) FROM inventory),
+            low_stock = (SELECT COUNT(*) FROM inventory WHERE stock <= low_stock_threshold),
+            receipts_count = (SELECT COUNT(*) FROM receipts),
+            sales_day = COALESCE((SELECT MAX(sale_date) FROM receipts), ''),
+            sales_day_total = COALESCE(
+                (SELECT SUM(total) FROM receipts WHERE sale_date = (SELECT MAX(sale_date) FROM receipts)), 0
+            ),
+            version = version + 1
+        WHERE id = 1
+        """
+    )
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS kpi_inventory_ai AFTER INSERT ON inventory BEGIN
+            UPDATE kpi_counters SET
+                total_stock = total_stock + new.stock,
+                low_stock = low_stock + (new.stock <= low_stock_threshold),
+                version = version + 1
+            WHERE id = 1;
+        END
+        """
+    )
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS kpi_inventory_ad AFTER DELETE ON inventory BEGIN
+            UPDATE kpi_counters SET
+                total_stock = total_stock - old.stock,
+                low_stock = low_stock - (old.stock <= low_stock_threshold),
+                version = version + 1
+            WHERE id = 1;
+        END
+        """
+    )
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS kpi_inventory_au AFTER UPDATE OF stock ON inventory
+        WHEN new.stock IS NOT old.stock BEGIN
+            UPDATE kpi_counters SET
+                total_stock = total_stock + new.stock - old.stock,
+                low_stock = low_stock + (new.stock <= low_stock_threshold) - (old.stock <= low_stock_threshold),
+                version = version + 1
+            WHERE id = 1;
+        END
+        """
+    )
+    # sales_day guarda el día más reciente con ventas: si ya no es hoy, las
+    # ventas de hoy son 0. Las ventas sincronizadas de días anteriores no lo mueven.
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS kpi_receipts_ai AFTER INSERT ON receipts BEGIN
+            UPDATE kpi_counters SET
+                receipts_count = receipts_count + 1,
+                sales_day_total = CASE
+                    WHEN new.sale_date = sales_day THEN sales_day_total + new.total
+                    WHEN new.sale_date > sales_day THEN new.total
+                    ELSE sales_day_total
+                END,
+                sales_day = MAX(sales_day, new.sale_date),
+                version = version + 1
+            WHERE id = 1;
+        END
+        """
+    )
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS kpi_receipts_ad AFTER DELETE ON receipts BEGIN
+            UPDATE kpi_counters SET
+                receipts_count = receipts_count - 1,
+                sales_day_total = sales_day_total - (CASE WHEN old.sale_date = sales_day THEN old.total ELSE 0 END),
+                version = version + 1
+            WHERE id = 1;
+        END
+        """
+    )
+
+
+def _m007_audit_log(conn):
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS audit_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts TEXT NOT NULL,
+            actor TEXT,
+            action TEXT NOT NULL,
+            target_type TEXT,
+            target_id TEXT,
+            details TEXT
+        )
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_audit_log_target ON audit_log(target_type, target_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_audit_log_action ON audit_log(action, id)")
+
+
+def _m008_data_versions(conn):
+    # Un contador por tabla que sube con cada cambio y, por fila, la versión de
+    # su último cambio (o de su borrado). Las APIs de lectura lo usan como ETag
+    # y para devolver solo lo cambiado desde una versión (?since=).
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS data_versions (
+            table_name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS row_versions (
+            table_name TEXT NOT NULL,
+            row_id TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            deleted INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (table_name, row_id)
+        ) WITHOUT ROWID
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_row_versions_version ON row_versions(table_name, version)")
+
+    for table in ("inventory", "users"):
+        # Las filas existentes quedan en la versión 1: ?since=0 equivale a la lista completa
+        conn.execute("INSERT OR IGNORE INTO data_versions (table_name, version) VALUES (?, 1)", (table,))
+        conn.execute(
+            f"INSERT OR IGNORE INTO row_versions (table_name, row_id, version) SELECT '{table}', id, 1 FROM {table}"
+        )
+        for event, ref, deleted in (("INSERT", "new", 0), ("UPDATE", "new", 0), ("DELETE", "old", 1)):
+            conn.execute(
+                f"""
+                CREATE TRIGGER IF NOT EXISTS dv_{table}_{event.lower()} AFTER {event} ON {table} BEGIN
+                    UPDATE data_versions SET version = version + 1 WHERE table_name = '{table}';
+                    INSERT INTO row_versions (table_name, row_id, version, deleted)
+                    VALUES ('{table}', {ref}.id, (SELECT version FROM data_versions WHERE table_name = '{table}'), {deleted})
+                    ON CONFLICT (table_name, row_id) DO UPDATE SET
+                        version = excluded.version, deleted = excluded.deleted;
+                END
+                """
+            )
+
+
+def _m009_receipt_item_products(conn):
+    # Las líneas de venta guardan el producto (id y SKU) además del nombre, así
+    # los rankings siguen al producto aunque se renombre.
+    for column in ("product_id", "sku"):
+        if not column_exists(conn, "receipt_items", column):
+            conn.execute(f"ALTER TABLE receipt_items ADD COLUMN {column} TEXT")
+
+    # Historial: por nombre actual y, si el producto se renombró después de la
+    # venta, por el nombre anterior que quedó en la auditoría. Con nombres
+    # repetidos gana el producto más antiguo. Lo que no coincide (productos
+    # borrados) queda sin product_id.
+    conn.execute(
+        """
+        UPDATE receipt_items SET product_id = m.id, sku = m.sku
+        FROM (SELECT name, id, sku, MIN(rowid) FROM inventory GROUP BY name) AS m
+        WHERE receipt_items.product_id IS NULL AND receipt_items.name = m.name
+        """
+    )
+    conn.execute(
+        """
+        UPDATE receipt_items SET product_id = m.id, sku = i.sku
+        FROM (
+            SELECT json_extract(details, '$.changes.name[0]') AS old_name, target_id AS id, MAX(id)
+            FROM audit_log
+            WHERE action = 'product_updated' AND json_extract(details, '$.changes.name') IS NOT NULL
+            GROUP BY old_name
+        ) AS m
+        JOIN inventory i ON i.id = m.id
+        WHERE receipt_items.product_id IS NULL AND receipt_items.name = m.old_name
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_receipt_items_product ON receipt_items(product_id)")
+
+    # Clave entera por producto vendido para los resúmenes: agrupar por un
+    # entero es más barato que por el UUID o el nombre. Las líneas sin producto
+    # se agrupan por nombre con product_id 'name:<nombre>'. name y category son
+    # los de la última venta y solo se usan si el producto ya no existe.
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS product_keys (
+            key INTEGER PRIMARY KEY,
+            product_id TEXT NOT NULL UNIQUE,
+            name TEXT NOT NULL,
+            category TEXT NOT NULL DEFAULT ''
+        )
+        """
+    )
+    conn.execute(
+        """
+        INSERT OR IGNORE INTO product_keys (product_id, name, category)
+        SELECT product_id, name, category FROM (
+            SELECT COALESCE(it.product_id, 'name:' || it.name) AS product_id, it.name,
+                   COALESCE(i.category, '') AS category, MAX(it.id)
+            FROM receipt_items it
+            LEFT JOIN inventory i ON i.id = it.product_id
+            GROUP BY 1
+        )
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_product_keys_category ON product_keys(category)")
+    conn.execute("DROP TABLE IF EXISTS daily_product_sales")
+    conn.execute(
+        """
+        CREATE TABLE daily_product_sales (
+            sale_date TEXT NOT NULL,
+            product_key INTEGER NOT NULL,
+            qty INTEGER NOT NULL DEFAULT 0,
+            revenue REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (sale_date, product_key)
+        ) WITHOUT ROWID
+        """
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_daily_product_sales_product ON daily_product_sales(product_key, sale_date)"
+    )
+    conn.execute(
+        """
+        INSERT INTO daily_product_sales (sale_date, product_key, qty, revenue)
+        SELECT r.sale_date, k.key, SUM(it.qty), SUM(it.subtotal)
+        FROM receipt_items it
+        JOIN receipts r ON r.id = it.receipt_id
+        JOIN product_keys k ON k.product_id = COALESCE(it.product_id, 'name:' || it.name)
+        GROUP BY r.sale_date, k.key
+        """
+    )
+
+
+def _m010_stock_ledger(conn):
+    # Libro de movimientos de stock, de solo inserción, y fotos periódicas del
+    # stock de todos los productos (ver stock_ledger.py).
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS stock_movements (
+            id INTEGER PRIMARY KEY,
+            product_id TEXT NOT NULL,
+            ts TEXT NOT NULL,
+            kind TEXT NOT NULL CHECK (kind IN ('sale', 'receipt', 'adjustment', 'return', 'initial')),
+            qty INTEGER NOT NULL,
+            ref TEXT,
+            actor TEXT,
+            note TEXT
+        )
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_stock_movements_product ON stock_movements(product_id, id)")
+    for event in ("UPDATE", "DELETE"):
+        conn.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS stock_movements_no_{event.lower()} BEFORE {event} ON stock_movements BEGIN
+                SELECT RAISE(ABORT, 'stock_movements es de solo inserción');
+            END
+            """
+        )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS stock_snapshot_runs (
+            id INTEGER PRIMARY KEY,
+            taken_at TEXT NOT NULL,
+            last_movement_id INTEGER NOT NULL
+        )
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_stock_snapshot_runs_taken_at ON stock_snapshot_runs(taken_at)")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS stock_snapshots (
+            snapshot_id INTEGER NOT NULL,
+            product_id TEXT NOT NULL,
+            stock INTEGER NOT NULL,
+            PRIMARY KEY (snapshot_id, product_id)
+        ) WITHOUT ROWID
+        """
+    )
+    # El stock actual es el saldo inicial: antes de esta foto no hay historia
+    run = conn.execute(
+        "INSERT INTO stock_snapshot_runs (taken_at, last_movement_id) VALUES (?, 0)",
+        (datetime.now().isoformat(),)
+    ).lastrowid
+    conn.execute(
+        "INSERT INTO stock_snapshots (snapshot_id, product_id, stock) SELECT ?, id, stock FROM inventory",
+        (run,)
+    )
+
+
+def _m011_receipt_archives(conn):
+    # Recibos movidos a bases por período (ver receipt_archive.py). La principal
+    # guarda solo a qué archivo fue cada recibo y el rango de fechas de cada uno.
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS receipt_archives (
+            id INTEGER PRIMARY KEY,
+            period TEXT NOT NULL UNIQUE,
+            file TEXT NOT NULL,
+            receipts INTEGER NOT NULL DEFAULT 0,
+            first_datetime TEXT,
+            last_datetime TEXT,
+            archived_at TEXT
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS receipt_archive_index (
+            receipt_id TEXT PRIMARY KEY,
+            archive_id INTEGER NOT NULL
+        ) WITHOUT ROWID
+        """
+    )
+
+
+MIGRATIONS = [
+    _m001_base_schema,
+    _m002_sale_date_and_indexes,
+    _m003_daily_rollups,
+    _m004_checkout_idempotency,
+    _m005_inventory_search,
+    _m006_kpi_counters,
+    _m007_audit_log,
+    _m008_data_versions,
+    _m009_receipt_item_products,
+    _m010_stock_ledger,
+    _m011_receipt_archives,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def migrate(conn):
+    current = get_schema_version(conn)
+    if current > SCHEMA_VERSION:
+        raise RuntimeError(
+            f"La base de datos está en la versión {current}, más nueva que esta aplicación ({SCHEMA_VERSION})"
+        )
+
+    applied = []
+    for version in range(current + 1, SCHEMA_VERSION + 1):
+        try:
+            conn.execute("BEGIN")
+            MIGRATIONS[version - 1](conn)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
@@ -0,0 +1,309 @@
+import os
+from datetime import date, datetime, timedelta
+
+# Archivo de recibos viejos (migración 11). `archive-receipts` mueve los recibos
+# con más de N días a bases SQLite por año o por mes (archive/receipts-2024.db),
+# así la base principal, sus copias de seguridad y el VACUUM no cargan con años
+# de historial que casi nadie consulta. En la principal queda solo un índice
+# receipt_id -> archivo (receipt_archive_index) y el rango de fechas de cada
+# archivo (receipt_archives); el listado de recibos y la vista de un recibo
+# abren con ATTACH solo los archivos que pueden tener lo que se pide.
+
+ARCHIVE_AFTER_DAYS = 365
+ARCHIVE_PERIODS = ("year", "month")
+# SQLite admite 10 bases adjuntas por conexión; se dejan dos libres
+ARCHIVE_MAX_ATTACHED = 8
+
+ARCHIVED_TABLES = ("receipts", "receipt_items")
+_ARCHIVE_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS {s}.idx_receipts_datetime_id ON receipts(datetime, id)",
+    "CREATE INDEX IF NOT EXISTS {s}.idx_receipts_sale_date ON receipts(sale_date, total)",
+    "CREATE INDEX IF NOT EXISTS {s}.idx_receipt_items_receipt_id ON receipt_items(receipt_id)",
+)
+
+
+def table_columns(conn, schema, table):
+    return conn.execute(f"PRAGMA {schema}.table_info({table})").fetchall()
+
+
+def sync_archive_schema(conn, schema):
+    """Crea o completa las tablas del archivo con las columnas actuales de la principal.
+
+    Las columnas se toman de PRAGMA table_info, no de una lista fija: una
+    columna agregada a receipts (p. ej. cash_register_id) se copia igual y no
+    se pierde al borrar los recibos de la base principal. Devuelve
+    {tabla: [columnas]} con lo que hay que copiar.
+    """
+    columns = {}
+    for table in ARCHIVED_TABLES:
+        main_cols = table_columns(conn, "main", table)
+        if sum(1 for c in main_cols if c["pk"]) != 1:
+            raise ArchiveError(f"{table} debe tener una clave primaria de una sola columna para archivarse")
+        archived = {c["name"] for c in table_columns(conn, schema, table)}
+        if not archived:
+            defs = ", ".join(
+                f"{c['name']} {c['type']}" + (" PRIMARY KEY" if c["pk"] else "") for c in main_cols
+            )
+            conn.execute(f"CREATE TABLE {schema}.{table} ({defs})")
+        else:
+            for c in main_cols:
+                if c["name"] not in archived:
+                    conn.execute(f"ALTER TABLE {schema}.{table} ADD COLUMN {c['name']} {c['type']}")
+        columns[table] = [c["name"] for c in main_cols]
+    for sql in _ARCHIVE_INDEXES:
+        conn.execute(sql.format(s=schema))
+    return columns
+
+
+class ArchiveError(ValueError):
+    pass
+
+
+def period_bounds(period):
+    # "2024" o "2024-03" -> [primer día, primer día del período siguiente)
+    if len(period) == 4:
+        year = int(period)
+        return date(year, 1, 1).isoformat(), date(year + 1, 1, 1).isoformat()
+    year, month = int(period[:4]), int(period[5:7])
+    end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    return date(year, month, 1).isoformat(), end.isoformat()
+
+
+class ReceiptArchive:
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, archive):
+        return os.path.join(self.directory, archive["file"])
+
+    # ------------------ ATTACH ------------------
+    def attach(self, conn, archive, create=False):
+        schema = f"archive_{archive['id']}"
+        attached = [r["name"] for r in conn.execute("PRAGMA database_list")]
+        if schema in attached:
+            return schema
+        path = self.path(archive)
+        if not create and not os.path.exists(path):
+            raise ArchiveError(f"No se encuentra el archivo de recibos {path}")
+        others = [name for name in attached if name.startswith("archive_")]
+        if len(others) >= ARCHIVE_MAX_ATTACHED:
+            for name in others:
+                conn.execute(f"DETACH DATABASE {name}")
+        conn.execute(f"ATTACH DATABASE ? AS {schema}", (path,))
+        return schema
+
+    def archives_in_range(self, conn, lower=None, upper=None):
+        # Archivos con recibos en [lower, upper]; cualquiera de los dos puede faltar
+        sql = "SELECT * FROM receipt_archives WHERE receipts > 0"
+        params = []
+        if lower:
+            sql += " AND last_datetime >= ?"
+            params.append(lower)
+        if upper:
+            sql += " AND first_datetime <= ?"
+            params.append(upper)
+        return conn.execute(sql + " ORDER BY last_datetime DESC", params).fetchall()
+
+    def load_receipt(self, conn, rid):
+        archive = conn.execute(
+            """
+            SELECT a.* FROM receipt_archive_index ix
+            JOIN receipt_archives a ON a.id = ix.archive_id
+            WHERE ix.receipt_id = ?
+            """,
+            (rid,)
+        ).fetchone()
+        if archive is None:
+            return None
+        schema = self.attach(conn, archive)
+        receipt = conn.execute(f"SELECT * FROM {schema}.receipts WHERE id = ?", (rid,)).fetchone()
+        if receipt is None:
+            return None
+        items = conn.execute(
+            f"SELECT name, qty, price, subtotal FROM {schema}.receipt_items WHERE receipt_id = ? ORDER BY id",
+            (rid,)
+        ).fetchall()
+        receipt_dict = dict(receipt)
+        receipt_dict["items"] = [dict(it) for it in items]
+        return receipt_dict
+
+    # ------------------ Archivado ------------------
+    def _archive_row(self, conn, period):
+        conn.execute(
+            "INSERT OR IGNORE INTO receipt_archives (period, file) VALUES (?, ?)",
+            (period, f"receipts-{period}.db")
+        )
+        conn.commit()
+        return conn.execute("SELECT * FROM receipt_archives WHERE period = ?", (period,)).fetchone()
+
+    def archive(self, conn, older_than_days=ARCHIVE_AFTER_DAYS, period="year", today=None):
+        """Mueve los recibos con sale_date anterior a hoy - older_than_days.
+
+        Cada período se copia primero a su archivo y después, en una sola
+        transacción de la base principal, se indexa y se borra lo copiado: en
+        modo WAL una transacción sobre varias bases no es atómica entre ellas,
+        así que este orden nunca pierde recibos y repetir el comando completa
+        un archivado cortado a mitad.
+        """
+        if period not in ARCHIVE_PERIODS:
+            raise ArchiveError(f"El período debe ser uno de: {', '.join(ARCHIVE_PERIODS)}")
+        if older_than_days < 1:
+            raise ArchiveError("La antigüedad mínima es de 1 día")
+        cutoff = ((today or date.today()) - timedelta(days=older_than_days)).isoformat()
+        width = 4 if period == "year" else 7
+        periods = [
+            r[0] for r in conn.execute(
+                "SELECT DISTINCT substr(sale_date, 1, ?) FROM receipts WHERE sale_date < ? ORDER BY 1",
+                (width, cutoff)
+            )
+        ]
+        os.makedirs(self.directory, exist_ok=True)
+        return [self._archive_period(conn, p, cutoff) for p in periods]
+
+    def _archive_period(self, conn, period, cutoff):
+        start, end = period_bounds(period)
+        end = min(end, cutoff)
+        archive = self._archive_row(conn, period)
+        schema = self.attach(conn, archive, create=True)
+        columns = sync_archive_schema(conn, schema)
+        receipt_cols = ", ".join(columns["receipts"])
+        item_cols = ", ".join(columns["receipt_items"])
+        # 1) Copia: solo escribe en el archivo, las cajas siguen vendiendo
+        conn.execute("BEGIN")
+        try:
+            conn.execute(
+                f"""
+                INSERT OR REPLACE INTO {schema}.receipts ({receipt_cols})
+                SELECT {receipt_cols} FROM main.receipts WHERE sale_date >= ? AND sale_date < ?
+                """,
+                (start, end)
+            )
+            conn.execute(
+                f"""
+                INSERT OR REPLACE INTO {schema}.receipt_items ({item_cols})
+                SELECT {', '.join('it.' + c for c in columns["receipt_items"])}
+                FROM main.receipts r
+                JOIN main.receipt_items it ON it.receipt_id = r.id
+                WHERE r.sale_date >= ? AND r.sale_date < ?
+                """,
+                (start, end)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        # 2) Traslado: índice y borrado de lo que ya está en el archivo
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS archiving (id TEXT PRIMARY KEY) WITHOUT ROWID")
+            conn.execute("DELETE FROM temp.archiving")
+            moved = conn.execute(
+                f"""
+                INSERT INTO temp.archiving (id)
+                SELECT id FROM main.receipts
+                WHERE sale_date >= ? AND sale_date < ? AND id IN (SELECT id FROM {schema}.receipts)
+                """,
+                (start, end)
+            ).rowcount
+            conn.execute(
+                "INSERT INTO receipt_archive_index (receipt_id, archive_id) SELECT id, ? FROM temp.archiving",
+                (archive["id"],)
+            )
+            # Los triggers de kpi_counters descuentan cada recibo borrado; un
+            # recibo archivado sigue siendo una venta, así que se restauran
+            kpis = conn.execute("SELECT receipts_count, sales_day_total FROM kpi_counters WHERE id = 1").fetchone()
+            conn.execute("DELETE FROM receipt_items WHERE receipt_id IN (SELECT id FROM temp.archiving)")
+            conn.execute("DELETE FROM receipts WHERE id IN (SELECT id FROM temp.archiving)")
+            if kpis is not None:
+                conn.execute(
+                    "UPDATE kpi_counters SET receipts_count = ?, sales_day_total = ? WHERE id = 1",
+                    (kpis["receipts_count"], kpis["sales_day_total"])
+                )
+            conn.execute(
+                f"""
+                UPDATE receipt_archives SET
+                    receipts = (SELECT COUNT(*) FROM {schema}.receipts),
+                    first_datetime = (SELECT MIN(datetime) FROM {schema}.receipts),
+                    last_datetime = (SELECT MAX(datetime) FROM {schema}.receipts),
+                    archived_at = ?
+                WHERE id = ?
+                """,
+                (datetime.now().isoformat(), archive["id"])
+            )
+            conn.execute("DELETE FROM temp.archiving")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return {"period": period, "file": archive["file"], "receipts": moved}
+
+    # ------------------ Resúmenes ------------------
+    def stage_rollups(self, conn):
+        """Deja en tablas temporales los totales diarios de los recibos archivados.
+
+        rebuild_rollups(conn, archived=True) los suma a los de la base
+        principal; se preparan antes porque no se puede hacer ATTACH dentro de
+        su transacción. Devuelve la cantidad de archivos leídos.
+        """
+        conn.execute(
+            """
+            CREATE TEMP TABLE IF NOT EXISTS archived_daily_sales (
+                sale_date TEXT PRIMARY KEY, receipts_count INTEGER, subtotal REAL, iva REAL, total REAL
+            )
+            """
+        )
+        conn.execute(
+            """
+            CREATE TEMP TABLE IF NOT EXISTS archived_product_sales (
+                sale_date TEXT, product_id TEXT, qty INTEGER, revenue REAL,
+                PRIMARY KEY (sale_date, product_id)
+            )
+            """
+        )
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS archived_product_names (product_id TEXT PRIMARY KEY, name TEXT)")
+        for table in ("archived_daily_sales", "archived_product_sales", "archived_product_names"):
+            conn.execute(f"DELETE FROM temp.{table}")
+        # Las tablas temporales se escriben fuera de transacción: ATTACH no se
+        # puede hacer con una abierta
+        conn.commit()
+
+        archives = conn.execute("SELECT * FROM receipt_archives WHERE receipts > 0 ORDER BY last_datetime").fetchall()
+        for archive in archives:
+            schema = self.attach(conn, archive)
+            conn.execute(
+                f"""
+                INSERT INTO temp.archived_daily_sales
+                SELECT sale_date, COUNT(*), SUM(subtotal), SUM(iva), SUM(total)
+                FROM {schema}.receipts GROUP BY sale_date
+                ON CONFLICT(sale_date) DO UPDATE SET
+                    receipts_count = receipts_count + excluded.receipts_count,
+                    subtotal = subtotal + excluded.subtotal,
+                    iva = iva + excluded.iva,
+                    total = total + excluded.total
+                """
+            )
+            conn.execute(
+                f"""
+                INSERT INTO temp.archived_product_sales
+                SELECT r.sale_date, COALESCE(it.product_id, 'name:' || it.name), SUM(it.qty), SUM(it.subtotal)
+                FROM {schema}.receipt_items it
+                JOIN {schema}.receipts r ON r.id = it.receipt_id
+                GROUP BY 1, 2
+                ON CONFLICT(sale_date, product_id) DO UPDATE SET
+                    qty = qty + excluded.qty, revenue = revenue + excluded.revenue
+                """
+            )
+            # Los archivos van del más viejo al más nuevo: queda el último nombre
+            conn.execute(
+                f"""
+                INSERT INTO temp.archived_product_names
+                SELECT product_id, name FROM (
+                    SELECT COALESCE(product_id, 'name:' || name) AS product_id, name, MAX(id)
+                    FROM {schema}.receipt_items GROUP BY 1
+                ) WHERE true
+                ON CONFLICT(product_id) DO UPDATE SET name = excluded.name
+                """
+            )
+            conn.commit()
+        return len(archives)
@@ -0,0 +1,261 @@
+import hashlib
+import io
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+mm = 72 / 25.4  # igual a reportlab.lib.units.mm
+
+# Un recibo no cambia después de que api_checkout() lo confirma, así que cada
+# formato se genera una sola vez (en segundo plano, justo después de la venta) y
+# se guarda en una caché en disco acotada por tamaño. Las reimpresiones salen de
+# la caché sin tocar la base de datos.
+
+RECEIPT_RENDER_VERSION = 1
+RECEIPT_FORMATS = {
+    "pdf": "application/pdf",
+    "escpos": "application/octet-stream",
+}
+RECEIPT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+RECEIPT_PAPER_WIDTH_MM = 80
+RECEIPT_ESCPOS_COLUMNS = 48
+
+PAYMENT_LABELS = {"cash": "Efectivo", "card": "Tarjeta"}
+
+# Comandos ESC/POS
+ESC_INIT = b"\x1b@"
+ESC_CODEPAGE_PC850 = b"\x1bt\x02"
+ESC_ALIGN_LEFT = b"\x1ba\x00"
+ESC_ALIGN_CENTER = b"\x1ba\x01"
+ESC_BOLD_ON = b"\x1bE\x01"
+ESC_BOLD_OFF = b"\x1bE\x00"
+GS_SIZE_DOUBLE = b"\x1d!\x11"
+GS_SIZE_NORMAL = b"\x1d!\x00"
+GS_FEED_AND_CUT = b"\x1dVB\x00"
+
+
+class ReceiptRendererUnavailable(RuntimeError):
+    pass
+
+
+def receipt_etag(rid, fmt):
+    return hashlib.sha256(f"{RECEIPT_RENDER_VERSION}:{rid}:{fmt}".encode("utf-8")).hexdigest()[:32]
+
+
+def _payment_label(method):
+    return PAYMENT_LABELS.get(method, (method or "N/A").upper())
+
+
+def _columns(left, right, width):
+    left = left[:max(0, width - len(right) - 1)]
+    return left + " " * (width - len(left) - len(right)) + right
+
+
+def render_receipt_escpos(receipt, columns=RECEIPT_ESCPOS_COLUMNS):
+    def line(text=""):
+        out.write(text.encode("cp850", errors="replace") + b"\n")
+
+    out = io.BytesIO()
+    out.write(ESC_INIT + ESC_CODEPAGE_PC850 + ESC_ALIGN_CENTER)
+    out.write(ESC_BOLD_ON + GS_SIZE_DOUBLE)
+    line("FarmaSys")
+    out.write(GS_SIZE_NORMAL + ESC_BOLD_OFF)
+    line("Recibo de Venta")
+    line()
+
+    out.write(ESC_ALIGN_LEFT)
+    line(_columns("Fecha:", receipt["datetime"].replace("T", " ")[:19], columns))
+    line(_columns("Folio:", receipt["id"][:8], columns))
+    if receipt.get("customer"):
+        line(_columns("Cliente:", receipt["customer"], columns))
+    line(_columns("Método de Pago:", _payment_label(receipt.get("payment_method")), columns))
+    line("-" * columns)
+
+    for it in receipt["items"]:
+        line(it["name"][:columns])
+        line(_columns(f"  {it['qty']} x $ {it['price']:.2f}", f"$ {it['subtotal']:.2f}", columns))
+    line("-" * columns)
+
+    line(_columns("Subtotal", f"$ {receipt['subtotal']:.2f}", columns))
+    line(_columns("IVA", f"$ {receipt['iva']:.2f}", columns))
+    out.write(ESC_BOLD_ON)
+    line(_columns("TOTAL", f"$ {receipt['total']:.2f}", columns))
+    out.write(ESC_BOLD_OFF)
+    line()
+
+    out.write(ESC_ALIGN_CENTER)
+    line("¡Gracias por su compra!")
+    line("FarmaSys - Su farmacia de confianza")
+    out.write(b"\n\n\n" + GS_FEED_AND_CUT)
+    return out.getvalue()
+
+
+def render_receipt_pdf(receipt):
+    try:
+        # Import diferido: reportlab no se carga en el arranque sino con el primer PDF
+        from reportlab.pdfgen import canvas
+    except ImportError:  # sin reportlab solo se pueden generar recibos ESC/POS
+        raise ReceiptRendererUnavailable("reportlab no está instalado")
+
+    width = RECEIPT_PAPER_WIDTH_MM * mm
+    pad = 4 * mm
+    leading = 11
+    info_lines = 4 if receipt.get("customer") else 3
+    height = pad * 2 + leading * (6 + info_lines + 2 * len(receipt["items"]) + 6)
+
+    out = io.BytesIO()
+    c = canvas.Canvas(out, pagesize=(width, height))
+    c.setTitle(f"Recibo {receipt['id'][:8]}")
+    y = height - pad - 14
+
+    def row(left, right, font="Helvetica", size=8):
+        nonlocal y
+        c.setFont(font, size)
+        c.drawString(pad, y, left)
+        if right:
+            c.drawRightString(width - pad, y, right)
+        y -= leading
+
+    def rule():
+        nonlocal y
+        c.setDash(2, 2)
+        c.line(pad, y + leading / 2, width - pad, y + leading / 2)
+        c.setDash()
+        y -= leading / 2
+
+    c.setFont("Helvetica-Bold", 14)
+    c.drawCentredString(width / 2, y, "FarmaSys")
+    y -= leading * 1.4
+    c.setFont("Helvetica", 8)
+    c.drawCentredString(width / 2, y, "Recibo de Venta")
+    y -= leading * 1.5
+
+    row("Fecha:", receipt["datetime"].replace("T", " ")[:19])
+    row("Folio:", receipt["id"][:8])
+    if receipt.get("customer"):
+        row("Cliente:", receipt["customer"])
+    row("Método de Pago:", _payment_label(receipt.get("payment_method")))
+    rule()
+
+    for it in receipt["items"]:
+        row(it["name"], None)
+        row(f"   {it['qty']} x $ {it['price']:.2f}", f"$ {it['subtotal']:.2f}")
+    rule()
+
+    row("Subtotal", f"$ {receipt['subtotal']:.2f}")
+    row("IVA", f"$ {receipt['iva']:.2f}")
+    row("Total", f"$ {receipt['total']:.2f}", "Helvetica-Bold", 10)
+    y -= leading / 2
+
+    c.setFont("Helvetica", 7)
+    c.drawCentredString(width / 2, y, "¡Gracias por su compra!")
+    c.drawCentredString(width / 2, y - leading, "FarmaSys - Su farmacia de confianza")
+    c.showPage()
+    c.save()
+    return out.getvalue()
+
+
+RENDERERS = {
+    "pdf": render_receipt_pdf,
+    "escpos": render_receipt_escpos,
+}
+
+
+class ReceiptCache:
+    # LRU en disco: el orden de uso vive en memoria y se reconstruye desde el
+    # mtime de los archivos al arrancar; cada acierto vuelve a tocar el archivo.
+
+    def __init__(self, directory, max_bytes=RECEIPT_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._loaded = False
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _load(self):
+        if self._loaded:
+            return
+        files = []
+        if os.path.isdir(self.directory):
+            for entry in os.scandir(self.directory):
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    st = entry.stat()
+                    files.append((st.st_mtime, entry.name, st.st_size))
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self._size += size
+        self._loaded = True
+        self._evict()
+
+    def _evict(self):
+        while self._size > self.max_bytes and self._entries:
+            name, size = self._entries.popitem(last=False)
+            self._size -= size
+            self.evictions += 1
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+    def get(self, rid, fmt):
+        name = receipt_etag(rid, fmt) + "." + fmt
+        with self._lock:
+            self._load()
+            if name not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(name)
+            self.hits += 1
+        path = os.path.join(self.directory, name)
+        try:
+            with open(path, "rb") as fh:
+                data = fh.read()
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self._size -= self._entries.pop(name, 0)
+            return None
+        return data
+
+    def put(self, rid, fmt, data):
+        name = receipt_etag(rid, fmt) + "." + fmt
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(data)
+        os.replace(tmp, os.path.join(self.directory, name))
+        with self._lock:
+            self._load()
+            self._size += len(data) - self._entries.pop(name, 0)
+            self._entries[name] = len(data)
+            self._evict()
+
+    def stats(self):
+        with self._lock:
+            self._load()
+        return {
+            "directory": self.directory,
+            "entries": len(self._entries),
+            "bytes": self._size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+def render_receipt(receipt, fmt):
+    return RENDERERS[fmt](receipt)
+
+
+def prerender_receipt(cache, receipt):
+    for fmt in RECEIPT_FORMATS:
+        try:
+            cache.put(receipt["id"], fmt, render_receipt(receipt, fmt))
+        except ReceiptRendererUnavailable:
+            continue
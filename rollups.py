@@ -0,0 +1,214 @@
+from datetime import date, timedelta
+
+# Tablas resumen por día. api_checkout() las actualiza en la misma transacción
+# que inserta el recibo, así los reportes leen una fila por día (y por producto)
+# en lugar de recorrer todo el historial de receipts / receipt_items.
+# daily_product_sales va por product_key, la clave entera de product_keys
+# (migración 9); nombre y categoría se toman de inventory al consultar, así un
+# producto renombrado o recategorizado sigue siendo uno solo en los rankings.
+
+REPORT_RANGES = (7, 30, 90, 365)
+
+# Productos de una categoría: la actual en inventory, o la de su última venta
+# si ya no existe. Recibe la categoría dos veces; ambas ramas usan índices.
+_CATEGORY_KEYS = """
+    SELECT k.key FROM inventory i JOIN product_keys k ON k.product_id = i.id WHERE i.category = ?
+    UNION ALL
+    SELECT k.key FROM product_keys k
+    WHERE k.category = ? AND NOT EXISTS (SELECT 1 FROM inventory i WHERE i.id = k.product_id)
+"""
+
+
+def record_sales(conn, sales):
+    days = {}
+    products = {}
+    names = {}
+    for sale in sales:
+        day = days.setdefault(sale["sale_date"], [0, 0.0, 0.0, 0.0])
+        day[0] += 1
+        day[1] += sale["subtotal"]
+        day[2] += sale["iva"]
+        day[3] += sale["total"]
+        for it in sale["items"]:
+            names[it["product_id"]] = (it["name"], it.get("category") or "")
+            prod = products.setdefault((sale["sale_date"], it["product_id"]), [0, 0.0])
+            prod[0] += it["qty"]
+            prod[1] += it["subtotal"]
+
+    conn.executemany(
+        """
+        INSERT INTO daily_sales (sale_date, receipts_count, subtotal, iva, total)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(sale_date) DO UPDATE SET
+            receipts_count = receipts_count + excluded.receipts_count,
+            subtotal = subtotal + excluded.subtotal,
+            iva = iva + excluded.iva,
+            total = total + excluded.total
+        """,
+        [(d, *vals) for d, vals in days.items()]
+    )
+    # Solo se reescribe la fila de product_keys si cambió el nombre o la categoría
+    conn.executemany(
+        """
+        INSERT INTO product_keys (product_id, name, category)
+        VALUES (?, ?, ?)
+        ON CONFLICT(product_id) DO UPDATE SET
+            name = excluded.name,
+            category = excluded.category
+        WHERE name IS NOT excluded.name OR category IS NOT excluded.category
+        """,
+        [(pid, *vals) for pid, vals in names.items()]
+    )
+    conn.executemany(
+        """
+        INSERT INTO daily_product_sales (sale_date, product_key, qty, revenue)
+        VALUES (?, (SELECT key FROM product_keys WHERE product_id = ?), ?, ?)
+        ON CONFLICT(sale_date, product_key) DO UPDATE SET
+            qty = qty + excluded.qty,
+            revenue = revenue + excluded.revenue
+        """,
+        [(d, pid, *vals) for (d, pid), vals in products.items()]
+    )
+
+
+def rebuild_rollups(conn, archived=False):
+    # archived=True suma además los recibos archivados, que ReceiptArchive.stage_rollups
+    # deja antes en tablas temporales
+    try:
+        conn.execute("BEGIN")
+        conn.execute("DELETE FROM daily_sales")
+        conn.execute("DELETE FROM daily_product_sales")
+        conn.execute(
+            """
+            INSERT INTO daily_sales (sale_date, receipts_count, subtotal, iva, total)
+            SELECT sale_date, COUNT(*), SUM(subtotal), SUM(iva), SUM(total)
+            FROM receipts
+            GROUP BY sale_date
+            """
+        )
+        # Las claves existentes se conservan; las líneas sin producto van por nombre
+        conn.execute(
+            """
+            INSERT INTO product_keys (product_id, name, category)
+            SELECT product_id, name, category FROM (
+                SELECT COALESCE(it.product_id, 'name:' || it.name) AS product_id, it.name,
+                       COALESCE(i.category, '') AS category, MAX(it.id)
+                FROM receipt_items it
+                LEFT JOIN inventory i ON i.id = it.product_id
+                GROUP BY 1
+            ) WHERE true
+            ON CONFLICT(product_id) DO UPDATE SET name = excluded.name, category = excluded.category
+            """
+        )
+        conn.execute(
+            """
+            INSERT INTO daily_product_sales (sale_date, product_key, qty, revenue)
+            SELECT r.sale_date, k.key, SUM(it.qty), SUM(it.subtotal)
+            FROM receipt_items it
+            JOIN receipts r ON r.id = it.receipt_id
+            JOIN product_keys k ON k.product_id = COALESCE(it.product_id, 'name:' || it.name)
+            GROUP BY r.sale_date, k.key
+            """
+        )
+        if archived:
+            _add_archived_rollups(conn)
+        days = conn.execute("SELECT COUNT(*) FROM daily_sales").fetchone()[0]
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return days
+
+
+def _add_archived_rollups(conn):
+    conn.execute(
+        """
+        INSERT INTO daily_sales (sale_date, receipts_count, subtotal, iva, total)
+        SELECT sale_date, receipts_count, subtotal, iva, total FROM temp.archived_daily_sales WHERE true
+        ON CONFLICT(sale_date) DO UPDATE SET
+            receipts_count = receipts_count + excluded.receipts_count,
+            subtotal = subtotal + excluded.subtotal,
+            iva = iva + excluded.iva,
+            total = total + excluded.total
+        """
+    )
+    # Los nombres de la base principal son más recientes y no se pisan
+    conn.execute(
+        """
+        INSERT INTO product_keys (product_id, name, category)
+        SELECT a.product_id, a.name, COALESCE(i.category, '')
+        FROM temp.archived_product_names a
+        LEFT JOIN inventory i ON i.id = a.product_id
+        WHERE true
+        ON CONFLICT(product_id) DO NOTHING
+        """
+    )
+    conn.execute(
+        """
+        INSERT INTO daily_product_sales (sale_date, product_key, qty, revenue)
+        SELECT a.sale_date, k.key, a.qty, a.revenue
+        FROM temp.archived_product_sales a
+        JOIN product_keys k ON k.product_id = a.product_id
+        WHERE true
+        ON CONFLICT(sale_date, product_key) DO UPDATE SET
+            qty = qty + excluded.qty, revenue = revenue + excluded.revenue
+        """
+    )
+
+
+def sales_series(conn, days, category=None, today=None):
+    today = today or date.today()
+    start = today - timedelta(days=days - 1)
+    series = {(start + timedelta(days=i)).isoformat(): 0 for i in range(days)}
+
+    if category:
+        rows = conn.execute(
+            f"""
+            SELECT sale_date, SUM(revenue) AS total
+            FROM daily_product_sales
+            WHERE sale_date >= ? AND product_key IN ({_CATEGORY_KEYS})
+            GROUP BY sale_date
+            """,
+            (start.isoformat(), category, category)
+        ).fetchall()
+    else:
+        rows = conn.execute(
+            "SELECT sale_date, total FROM daily_sales WHERE sale_date >= ?",
+            (start.isoformat(),)
+        ).fetchall()
+
+    for row in rows:
+        if row["sale_date"] in series:
+            series[row["sale_date"]] = round(row["total"] or 0, 2)
+
+    labels = list(series.keys())
+    return labels, [series[d] for d in labels]
+
+
+def top_products(conn, days, category=None, limit=5, today=None):
+    today = today or date.today()
+    start = (today - timedelta(days=days - 1)).isoformat()
+    sql = """
+        SELECT product_key, SUM(qty) AS qty
+        FROM daily_product_sales
+        WHERE sale_date >= ?
+    """
+    params = [start]
+    if category:
+        sql += f" AND product_key IN ({_CATEGORY_KEYS})"
+        params += [category, category]
+    # "+": agrupa sobre el rango de fechas de la clave primaria en lugar de
+    # recorrer todo el índice por producto (mucho más lento en rangos cortos)
+    sql += " GROUP BY +product_key ORDER BY qty DESC LIMIT ?"
+    params.append(limit)
+    # Solo los primeros `limit` buscan su nombre actual
+    return conn.execute(
+        f"""
+        SELECT k.product_id, COALESCE(i.name, k.name) AS name, t.qty
+        FROM ({sql}) t
+        JOIN product_keys k ON k.key = t.product_key
+        LEFT JOIN inventory i ON i.id = k.product_id
+        ORDER BY t.qty DESC
+        """,
+        params
+    ).fetchall()
@@ -0,0 +1,245 @@
+import argparse
+import os
+import signal
+import threading
+import time
+
+# Modo producción: la app corre bajo waitress (WSGI puro Python, multihilo) en
+# lugar del servidor de desarrollo de Flask. Se usan hilos y no procesos porque
+# SQLite admite un solo escritor y las cachés (SKU, KPIs, buffer de eventos)
+# viven en memoria del proceso. Al apagar se deja de aceptar conexiones, las
+# peticiones nuevas reciben 503 y se espera a que terminen las que ya están en
+# curso (checkouts incluidos) antes de cerrar los hilos y los pools.
+
+SERVER_HOST = os.environ.get("FARMASYS_HOST", "127.0.0.1")
+SERVER_PORT = int(os.environ.get("FARMASYS_PORT", "5000"))
+SERVER_THREADS = int(os.environ.get("FARMASYS_THREADS", "8"))
+SERVER_CONNECTION_LIMIT = int(os.environ.get("FARMASYS_CONNECTION_LIMIT", "100"))
+# Segundos sin actividad tras los que se cierra una conexión: cubre keep-alive
+# ocioso y clientes que no terminan de enviar la petición o de leer la respuesta
+SERVER_CHANNEL_TIMEOUT = int(os.environ.get("FARMASYS_CHANNEL_TIMEOUT", "60"))
+SERVER_BACKLOG = int(os.environ.get("FARMASYS_BACKLOG", "1024"))
+SERVER_SHUTDOWN_TIMEOUT = float(os.environ.get("FARMASYS_SHUTDOWN_TIMEOUT", "30"))
+# Hilos y conexiones extra para los streams en vivo (/api/inventory/stream):
+# cada pantalla abierta ocupa un hilo de waitress bloqueado mientras dure la
+# conexión, así que se suman a "threads" en lugar de quitarle hilos a las
+# peticiones normales. waitress arranca todos sus hilos al iniciar, por eso el
+# número es chico y se sube solo si hay más cajas; 0 desactiva los streams (la
+# app responde 503 y las pantallas siguen andando sin cambios en vivo). La app
+# limita los suscriptores a este mismo número.
+SERVER_STREAM_SLOTS = int(os.environ.get("FARMASYS_STREAM_SLOTS", "16"))
+
+
+class ServerUnavailable(RuntimeError):
+    pass
+
+
+class _ClosingIterator:
+    def __init__(self, result, on_close):
+        self._result = result
+        self._on_close = on_close
+
+    def __iter__(self):
+        return iter(self._result)
+
+    def close(self):
+        try:
+            if hasattr(self._result, "close"):
+                self._result.close()
+        finally:
+            self._on_close()
+
+
+class DrainingApp:
+    """Middleware WSGI que cuenta las peticiones en curso y rechaza las nuevas al apagar."""
+
+    def __init__(self, app):
+        self.app = app
+        self._idle = threading.Condition()
+        self.active = 0
+        self.served = 0
+        self.rejected = 0
+        self.draining = False
+
+    def __call__(self, environ, start_response):
+        with self._idle:
+            if self.draining:
+                self.rejected += 1
+                reject = True
+            else:
+                self.active += 1
+                reject = False
+        if reject:
+            start_response("503 Service Unavailable", [
+                ("Content-Type", "application/json; charset=utf-8"),
+                ("Retry-After", "5"),
+            ])
+            return ['{"ok": false, "error": "El servidor se está apagando"}'.encode("utf-8")]
+        try:
+            result = self.app(environ, start_response)
+        except BaseException:
+            self._finished()
+            raise
+        # waitress llama a close() después de enviar el último byte del cuerpo
+        return _ClosingIterator(result, self._finished)
+
+    def _finished(self):
+        with self._idle:
+            self.active -= 1
+            self.served += 1
+            if self.active == 0:
+                self._idle.notify_all()
+
+    def drain(self, deadline):
+        with self._idle:
+            self.draining = True
+            while self.active:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def stats(self):
+        return {"active": self.active, "served": self.served, "rejected": self.rejected, "draining": self.draining}
+
+
+class FarmasysServer:
+    def __init__(self, app, host=SERVER_HOST, port=SERVER_PORT, threads=SERVER_THREADS,
+                 connection_limit=SERVER_CONNECTION_LIMIT, channel_timeout=SERVER_CHANNEL_TIMEOUT,
+                 backlog=SERVER_BACKLOG, shutdown_timeout=SERVER_SHUTDOWN_TIMEOUT,
+                 stream_slots=SERVER_STREAM_SLOTS, stream_hub=None, on_drain=None):
+        try:
+            # app.py importa este módulo por la CLI; waitress se carga solo al servir
+            from waitress.server import create_server
+        except ImportError:  # waitress solo hace falta para el modo producción
+            raise ServerUnavailable("waitress no está instalado (pip install waitress)")
+        self.app = DrainingApp(app)
+        self.threads = threads
+        self.stream_slots = stream_slots
+        if stream_hub is not None:
+            # Un suscriptor por hilo reservado: los que sobran reciben 503
+            stream_hub.max_subscribers = stream_slots
+        self.shutdown_timeout = shutdown_timeout
+        # Corta las respuestas que no terminan solas (streams) antes de esperar a las demás
+        self.on_drain = on_drain
+        self.server = create_server(
+            self.app, host=host, port=port, threads=threads + stream_slots,
+            connection_limit=connection_limit + stream_slots, channel_timeout=channel_timeout,
+            cleanup_interval=max(1, min(30, channel_timeout)), backlog=backlog,
+            ident="FarmaSys",
+        )
+        self._thread = None
+        self._stopped = threading.Event()
+
+    @property
+    def url(self):
+        return f"http://{self.server.effective_host}:{self.server.effective_port}"
+
+    def run(self):
+        # Bucle de red de waitress; vuelve cuando shutdown() cerró todos los canales
+        try:
+            self.server.run()
+        finally:
+            self._stopped.set()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name="waitress", daemon=True)
+        self._thread.start()
+        return self
+
+    def _stop_accepting(self):
+        from waitress import wasyncore
+        if self.server.accepting:
+            wasyncore.dispatcher.close(self.server)
+
+    def _close_channels(self):
+        for channel in list(self.server._map.values()):
+            if channel is not self.server.trigger:
+                channel.handle_close()
+        self.server.trigger.close()
+
+    def shutdown(self, timeout=None):
+        deadline = time.monotonic() + (self.shutdown_timeout if timeout is None else timeout)
+        # Los cambios al mapa de canales se hacen en el hilo de red, a través del trigger
+        self.server.trigger.pull_trigger(self._stop_accepting)
+        if self.on_drain:
+            self.on_drain()
+        drained = self.app.drain(deadline)
+        # Las respuestas ya generadas pueden seguir en los buffers de salida
+        while time.monotonic() < deadline and any(
+            getattr(channel, "total_outbufs_len", 0) for channel in list(self.server.active_channels.values())
+        ):
+            time.sleep(0.05)
+        self.server.task_dispatcher.shutdown(cancel_pending=True, timeout=max(0.1, deadline - time.monotonic()))
+        self.server.trigger.pull_trigger(self._close_channels)
+        self._stopped.wait(5)
+        return drained
+
+
+def serve(app, on_start=None, on_drain=None, on_shutdown=None, log=print, **options):
+    server = FarmasysServer(app, on_drain=on_drain, **options)
+    result = {}
+    if on_start:
+        # El socket ya escucha; la preparación corre mientras llegan las primeras conexiones
+        threading.Thread(target=on_start, name="warm-up", daemon=True).start()
+
+    def stop(signum, frame):
+        if "thread" in result:
+            return
+        log("Apagando: esperando a que terminen las peticiones en curso...")
+        # shutdown() espera, así que no puede correr en el hilo del bucle de red
+        result["thread"] = threading.Thread(
+            target=lambda: result.update(drained=server.shutdown()), name="shutdown"
+        )
+        result["thread"].start()
+
+    previous = {sig: signal.signal(sig, stop) for sig in (signal.SIGINT, signal.SIGTERM)}
+    log(f"FarmaSys en {server.url} ({server.threads} hilos + {server.stream_slots} para streams)")
+    try:
+        server.run()
+    finally:
+        for sig, handler in previous.items():
+            signal.signal(sig, handler)
+    if "thread" in result:
+        result["thread"].join()
+        if not result.get("drained", True):
+            log(f"Se cortaron {server.app.active} peticiones que no terminaron a tiempo")
+    if on_shutdown:
+        on_shutdown()
+    log(f"Servidor detenido ({server.app.served} peticiones atendidas)")
+    return server
+
+
+def add_arguments(parser):
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--threads", type=int, default=SERVER_THREADS)
+    parser.add_argument("--connection-limit", type=int, default=SERVER_CONNECTION_LIMIT)
+    parser.add_argument("--channel-timeout", type=int, default=SERVER_CHANNEL_TIMEOUT,
+                        help="segundos sin actividad antes de cerrar una conexión (incluye keep-alive)")
+    parser.add_argument("--backlog", type=int, default=SERVER_BACKLOG)
+    parser.add_argument("--shutdown-timeout", type=float, default=SERVER_SHUTDOWN_TIMEOUT,
+                        help="segundos de espera para las peticiones en curso al apagar")
+    parser.add_argument("--stream-slots", type=int, default=SERVER_STREAM_SLOTS,
+                        help="hilos extra para los streams en vivo; cada pantalla abierta ocupa uno (0 los desactiva)")
+
+
+def main(argv=None, wsgi_app=None, on_start=None, on_drain=None, on_shutdown=None, stream_hub=None):
+    parser = argparse.ArgumentParser(description="Servidor de producción de FarmaSys (waitress)")
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    if wsgi_app is None:
+        from app import app as wsgi_app, close_pools as on_shutdown, warm_up as on_start
+        from app import inventory_hub as stream_hub
+        on_drain = stream_hub.close
+    try:
+        serve(wsgi_app, on_start=on_start, on_drain=on_drain, on_shutdown=on_shutdown, stream_hub=stream_hub,
+              **vars(args))
+    except ServerUnavailable as e:
+        parser.exit(1, f"{e}\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,4 @@
 import requests
-import re
-import json
-import time
-
-BASE = 'http://127.0.0.1:5000'
-
-import requests
-import re
-import json
 import time
 
 BASE = 'http://127.0.0.1:5000'
@@ -36,22 +27,15 @@ if r.status_code not in (200, 302):
     print(r.text[:800])
     exit(1)
 
-# Get sales page to extract INIT_PRODUCTS
-print('Fetching /sales to extract products...')
-r = get_with_retries(BASE + '/sales')
+# Get products from the inventory search API
+print('Fetching /api/inventory to pick a product...')
+r = get_with_retries(BASE + '/api/inventory?limit=20')
 if r.status_code != 200:
-    print('/sales returned', r.status_code)
+    print('/api/inventory returned', r.status_code)
     print(r.text[:800])
     exit(1)
 
-m = re.search(r'window\.INIT_PRODUCTS\s*=\s*(\[.*?\]);', r.text, re.S)
-if not m:
-    print('Could not find window.INIT_PRODUCTS in /sales HTML. Showing snippet:')
-    print(r.text[:1200])
-    exit(1)
-
-products_json = m.group(1)
-products = json.loads(products_json)
+products = [p for p in r.json()['items'] if p['stock'] > 0]
 print('Found', len(products), 'products')
 if not products:
     print('No products to use for checkout')
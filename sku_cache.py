@@ -0,0 +1,144 @@
+import threading
+from collections import OrderedDict
+
+from data_versions import data_version
+
+# Caché en proceso de productos por SKU para el escáner de ventas. Las escrituras
+# de inventario y el checkout invalidan las entradas afectadas; el contador de
+# generación evita que una lectura lenta vuelva a guardar un valor ya invalidado.
+# Lo que escriben otros procesos (CLI, otra instancia) se detecta con la versión
+# de datos del inventario (migración 8): si se movió, se descartan las entradas
+# de las filas cambiadas desde la versión conocida.
+
+SKU_CACHE_MAX_ENTRIES = 50000
+SKU_FIELDS = ("id", "name", "sku", "price", "stock", "category")
+# Con más filas cambiadas que esto (una importación) se vacía la caché entera
+SKU_SYNC_MAX_CHANGES = 1000
+
+
+class SkuCache:
+    def __init__(self, max_entries=SKU_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._by_sku = OrderedDict()
+        self._sku_by_id = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.syncs = 0
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def get(self, sku):
+        with self._lock:
+            item = self._by_sku.get(sku)
+            if item is None:
+                self.misses += 1
+                return None
+            self._by_sku.move_to_end(sku)
+            self.hits += 1
+            return item
+
+    def put(self, item, generation):
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._by_sku[item["sku"]] = item
+            self._by_sku.move_to_end(item["sku"])
+            self._sku_by_id[item["id"]] = item["sku"]
+            while len(self._by_sku) > self.max_entries:
+                _, old = self._by_sku.popitem(last=False)
+                self._sku_by_id.pop(old["id"], None)
+
+    def invalidate_ids(self, ids):
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            for pid in ids:
+                sku = self._sku_by_id.pop(pid, None)
+                if sku is not None:
+                    self._by_sku.pop(sku, None)
+
+    def sync(self, conn):
+        version = data_version(conn, "inventory")
+        known = self._version
+        if version == known:
+            return
+        changed = None
+        if known is not None and version > known:
+            rows = conn.execute(
+                "SELECT row_id FROM row_versions WHERE table_name = 'inventory' AND version > ? LIMIT ?",
+                (known, SKU_SYNC_MAX_CHANGES + 1)
+            ).fetchall()
+            if len(rows) <= SKU_SYNC_MAX_CHANGES:
+                changed = [r[0] for r in rows]
+        with self._lock:
+            retry = self._version != known
+            if not retry:
+                self._apply_sync(version, changed)
+        if retry:
+            # Otro hilo sincronizó mientras tanto: se compara contra su versión
+            self.sync(conn)
+
+    def _apply_sync(self, version, changed):
+        # Se llama con _lock tomado
+        self._generation += 1
+        self.syncs += 1
+        if changed is None:
+            # Primera lectura, demasiados cambios o base restaurada (versión menor)
+            self._by_sku.clear()
+            self._sku_by_id.clear()
+        else:
+            for pid in changed:
+                sku = self._sku_by_id.pop(pid, None)
+                if sku is not None:
+                    self._by_sku.pop(sku, None)
+        self._version = version
+
+    def invalidate_all(self):
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            self._by_sku.clear()
+            self._sku_by_id.clear()
+
+    def stats(self):
+        return {
+            "entries": len(self._by_sku),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "syncs": self.syncs,
+            "version": self._version,
+        }
+
+
+def lookup_skus(get_conn, cache, skus):
+    conn = get_conn()
+    cache.sync(conn)
+    found = {}
+    missing = []
+    for sku in skus:
+        item = cache.get(sku)
+        if item is None:
+            missing.append(sku)
+        else:
+            found[sku] = item
+
+    if missing:
+        generation = cache.generation
+        placeholders = ",".join("?" for _ in missing)
+        rows = conn.execute(
+            f"SELECT {', '.join(SKU_FIELDS)} FROM inventory WHERE sku IN ({placeholders})",
+            missing
+        ).fetchall()
+        for row in rows:
+            item = dict(row)
+            cache.put(item, generation)
+            found[item["sku"]] = item
+
+    return found
@@ -0,0 +1,146 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from logging.handlers import RotatingFileHandler
+
+# Registro de consultas lentas. InstrumentedCursor (metrics.py) llama a record()
+# cuando una sentencia supera el umbral; se guarda la forma de los parámetros
+# (nunca sus valores), la duración, la ruta y el EXPLAIN QUERY PLAN, marcando
+# los recorridos completos de tabla. Cada evento va a un log rotativo en JSON y
+# a un resumen en memoria agrupado por sentencia normalizada.
+
+SLOW_QUERY_LOG_MAX_BYTES = 5 * 1024 * 1024
+SLOW_QUERY_LOG_BACKUPS = 5
+SLOW_QUERY_MAX_STATEMENTS = 500
+SLOW_QUERY_PLAN_CACHE = 256
+EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+
+_WHITESPACE = re.compile(r"\s+")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+
+def normalize_sql(sql):
+    # Las listas IN (?, ?, ...) de distinto largo cuentan como la misma consulta
+    return _IN_LIST.sub("(?, …)", _WHITESPACE.sub(" ", sql).strip())
+
+
+def parameters_shape(parameters, many=False):
+    if many:
+        rows = parameters if isinstance(parameters, (list, tuple)) else []
+        first = parameters_shape(rows[0]) if rows else "()"
+        return f"{len(rows)} × {first}"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{k}: {type(v).__name__}" for k, v in parameters.items()) + "}"
+    parts = []
+    for value in parameters:
+        name = type(value).__name__
+        if parts and parts[-1][0] == name:
+            parts[-1][1] += 1
+        else:
+            parts.append([name, 1])
+    return "(" + ", ".join(n if c == 1 else f"{n} × {c}" for n, c in parts) + ")"
+
+
+def is_full_scan(detail):
+    return detail.startswith("SCAN") and "USING" not in detail and "VIRTUAL TABLE" not in detail \
+        and "CONSTANT ROW" not in detail
+
+
+class SlowQueryLog:
+    def __init__(self, path, threshold_ms, max_bytes=SLOW_QUERY_LOG_MAX_BYTES, backups=SLOW_QUERY_LOG_BACKUPS):
+        self.path = path
+        self.threshold = threshold_ms / 1000
+        self._lock = threading.Lock()
+        self._plans = OrderedDict()
+        self._summary = {}
+        self.logged = 0
+
+        self.logger = logging.getLogger("farmasys.slow_queries")
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        if path and not self.logger.handlers:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self.logger.addHandler(handler)
+
+    def _plan(self, conn, sql, parameters, many):
+        key = normalize_sql(sql)
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is not None:
+                self._plans.move_to_end(key)
+                return plan
+        if not sql.lstrip().upper().startswith(EXPLAINABLE):
+            return []
+        if many:
+            parameters = parameters[0] if isinstance(parameters, (list, tuple)) and parameters else None
+            if parameters is None:
+                return []
+        try:
+            # Connection.execute de la clase base: no vuelve a pasar por el cursor instrumentado
+            rows = sqlite3.Connection.execute(conn, "EXPLAIN QUERY PLAN " + sql, parameters).fetchall()
+        except sqlite3.Error as e:
+            return [f"(sin plan: {e})"]
+        plan = [r[3] for r in rows]
+        with self._lock:
+            self._plans[key] = plan
+            while len(self._plans) > SLOW_QUERY_PLAN_CACHE:
+                self._plans.popitem(last=False)
+        return plan
+
+    def record(self, conn, sql, parameters, seconds, many=False, endpoint=None):
+        plan = self._plan(conn, sql, parameters, many)
+        full_scans = [d for d in plan if is_full_scan(d)]
+        key = normalize_sql(sql)
+        event = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "ms": round(seconds * 1000, 3),
+            "endpoint": endpoint or "-",
+            "sql": key,
+            "params": parameters_shape(parameters, many),
+            "plan": plan,
+            "full_scan": bool(full_scans),
+        }
+        self.logger.info(json.dumps(event, ensure_ascii=False))
+
+        with self._lock:
+            self.logged += 1
+            entry = self._summary.get(key)
+            if entry is None:
+                if len(self._summary) >= SLOW_QUERY_MAX_STATEMENTS:
+                    return
+                entry = self._summary[key] = {
+                    "sql": key, "count": 0, "total_ms": 0.0, "max_ms": 0.0, "endpoints": {},
+                }
+            entry["count"] += 1
+            entry["total_ms"] += event["ms"]
+            entry["max_ms"] = max(entry["max_ms"], event["ms"])
+            entry["endpoints"][event["endpoint"]] = entry["endpoints"].get(event["endpoint"], 0) + 1
+            entry["last_params"] = event["params"]
+            entry["last_seen"] = event["ts"]
+            entry["plan"] = plan
+            entry["full_scan"] = event["full_scan"]
+
+    def top(self, n=20, order="total_ms"):
+        with self._lock:
+            entries = [
+                {**e, "avg_ms": round(e["total_ms"] / e["count"], 3), "total_ms": round(e["total_ms"], 3),
+                 "endpoints": dict(e["endpoints"])}
+                for e in self._summary.values()
+            ]
+        entries.sort(key=lambda e: e[order], reverse=True)
+        return entries[:n]
+
+    def stats(self):
+        return {
+            "threshold_ms": round(self.threshold * 1000, 3),
+            "logged": self.logged,
+            "statements": len(self._summary),
+            "path": self.path,
+        }
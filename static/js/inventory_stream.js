@@ -0,0 +1,25 @@
+// Cambios de stock y precio en vivo (/api/inventory/stream). El cursor inicial
+// es la "version" que devolvió /api/inventory; al reconectar, EventSource
+// manda el último id recibido y el servidor sigue desde ahí.
+function openInventoryStream({ cursor, onChanges, onReset }) {
+  const url = '/api/inventory/stream' + (cursor != null ? '?cursor=' + cursor : '');
+  const source = new EventSource(url);
+  source.addEventListener('stock', e => onChanges(JSON.parse(e.data), Number(e.lastEventId)));
+  // La base cambió por completo (restaurada o recreada): hay que recargar la lista
+  source.addEventListener('reset', () => onReset && onReset());
+  return source;
+}
+
+// Aplica los deltas sobre los productos ya cargados y devuelve la lista sin los
+// borrados; los ids que no están en la lista se ignoran.
+function applyInventoryChanges(products, changes) {
+  const byId = new Map(changes.map(c => [c.id, c]));
+  products.forEach(p => {
+    const c = byId.get(p.id);
+    if (c && !c.deleted) {
+      p.stock = c.stock;
+      p.price = c.price;
+    }
+  });
+  return products.filter(p => !(byId.get(p.id) || {}).deleted);
+}
@@ -10,19 +10,11 @@ function salesPage() {
     lastReceiptId: null,
 
     init() {
-        // Load products from an injected global or try a fallback API
-        if (window.INIT_PRODUCTS) {
-          this.products = window.INIT_PRODUCTS;
-        } else {
-          try {
-            fetch('/api/products')
-              .then(r => r.json())
-              .then(data => { this.products = data; })
-              .catch(() => { this.products = []; });
-          } catch (e) {
-            this.products = [];
-          }
-        }
+        // Load the first page of products from the inventory search API
+        fetch('/api/inventory?limit=30')
+          .then(r => r.json())
+          .then(data => { this.products = data.items; })
+          .catch(() => { this.products = []; });
     },
 
     filtered() {
@@ -0,0 +1,230 @@
+import threading
+from datetime import datetime, timedelta
+
+# Libro de movimientos de stock (migración 10). Cada cambio de inventory.stock
+# agrega en la misma transacción una fila a stock_movements con la cantidad con
+# signo: ventas, ingresos de mercadería, ajustes y devoluciones. La tabla es de
+# solo inserción. Cada día se guarda una foto del stock de todos los productos
+# junto con el id del último movimiento que incluye; el stock en una fecha es
+# la foto anterior más los movimientos posteriores a ella, no todo el historial.
+# Las fotos diarias se guardan STOCK_SNAPSHOT_KEEP_DAYS días; después queda solo
+# la primera de cada mes, así una consulta vieja suma a lo sumo un mes de movimientos.
+
+MOVEMENT_KINDS = ("sale", "receipt", "adjustment", "return", "initial")
+# Los que se cargan a mano desde el inventario; "sale" e "initial" los pone la app
+MANUAL_MOVEMENT_KINDS = ("receipt", "adjustment", "return")
+MOVEMENTS_PAGE_SIZE = 50
+STOCK_SNAPSHOT_INTERVAL = timedelta(hours=24)
+STOCK_SNAPSHOT_KEEP_DAYS = 35
+
+
+class StockError(ValueError):
+    pass
+
+
+def record_movements(conn, deltas, kind, ref=None, actor=None, note=None):
+    # Se llama dentro de la transacción que cambia el stock: la hora sale del
+    # mismo bloqueo de escritura, así que crece con el id
+    ts = datetime.now().isoformat()
+    conn.executemany(
+        """
+        INSERT INTO stock_movements (product_id, ts, kind, qty, ref, actor, note)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+        [(pid, ts, kind, qty, ref, actor, note) for pid, qty in deltas if qty]
+    )
+
+
+def apply_movement(conn, pid, qty, kind, actor=None, note=None):
+    if kind not in MANUAL_MOVEMENT_KINDS:
+        raise StockError(f"Tipo de movimiento inválido: {kind}")
+    if not qty:
+        raise StockError("La cantidad no puede ser 0")
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute("SELECT stock FROM inventory WHERE id = ?", (pid,)).fetchone()
+        if row is None:
+            conn.rollback()
+            return None
+        if row["stock"] + qty < 0:
+            raise StockError(f"El stock no puede quedar negativo. Disponible: {row['stock']}")
+        conn.execute("UPDATE inventory SET stock = stock + ? WHERE id = ?", (qty, pid))
+        record_movements(conn, [(pid, qty)], kind, actor=actor, note=note)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return row["stock"] + qty
+
+
+def list_movements(conn, pid, before=None, limit=MOVEMENTS_PAGE_SIZE):
+    sql = "SELECT * FROM stock_movements WHERE product_id = ?"
+    params = [pid]
+    if before:
+        sql += " AND id < ?"
+        params.append(before)
+    sql += " ORDER BY id DESC LIMIT ?"
+    params.append(limit)
+    return [dict(r) for r in conn.execute(sql, params).fetchall()]
+
+
+def prune_snapshots(conn, keep_days=STOCK_SNAPSHOT_KEEP_DAYS, now=None):
+    # Se llama dentro de la transacción de take_snapshot
+    cutoff = ((now or datetime.now()) - timedelta(days=keep_days)).isoformat()
+    ids = [
+        r[0] for r in conn.execute(
+            """
+            SELECT id FROM stock_snapshot_runs
+            WHERE taken_at < ?
+              AND id NOT IN (SELECT MIN(id) FROM stock_snapshot_runs GROUP BY substr(taken_at, 1, 7))
+            """,
+            (cutoff,)
+        )
+    ]
+    for i in range(0, len(ids), 500):
+        chunk = ids[i:i + 500]
+        placeholders = ",".join("?" for _ in chunk)
+        conn.execute(f"DELETE FROM stock_snapshots WHERE snapshot_id IN ({placeholders})", chunk)
+        conn.execute(f"DELETE FROM stock_snapshot_runs WHERE id IN ({placeholders})", chunk)
+    return len(ids)
+
+
+def take_snapshot(conn, keep_days=STOCK_SNAPSHOT_KEEP_DAYS):
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        taken_at = datetime.now().isoformat()
+        last = conn.execute("SELECT COALESCE(MAX(id), 0) FROM stock_movements").fetchone()[0]
+        snapshot_id = conn.execute(
+            "INSERT INTO stock_snapshot_runs (taken_at, last_movement_id) VALUES (?, ?)",
+            (taken_at, last)
+        ).lastrowid
+        products = conn.execute(
+            "INSERT INTO stock_snapshots (snapshot_id, product_id, stock) SELECT ?, id, stock FROM inventory",
+            (snapshot_id,)
+        ).rowcount
+        pruned = prune_snapshots(conn, keep_days)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return {
+        "id": snapshot_id, "taken_at": taken_at, "last_movement_id": last, "products": products, "pruned": pruned
+    }
+
+
+def latest_snapshot(conn, at=None):
+    sql = "SELECT * FROM stock_snapshot_runs"
+    params = []
+    if at is not None:
+        sql += " WHERE taken_at <= ?"
+        params.append(at)
+    return conn.execute(sql + " ORDER BY taken_at DESC LIMIT 1", params).fetchone()
+
+
+def parse_stock_at(raw):
+    # Una fecha sola (AAAA-MM-DD) es el cierre de ese día
+    raw = (raw or "").strip()
+    try:
+        if len(raw) == 10:
+            return datetime.combine(datetime.fromisoformat(raw).date(), datetime.max.time()).isoformat()
+        return datetime.fromisoformat(raw).isoformat()
+    except ValueError:
+        raise StockError("Fecha inválida, use AAAA-MM-DD o AAAA-MM-DDTHH:MM")
+
+
+def stock_at(conn, at=None, product_ids=None):
+    """Stock por producto en la fecha `at` (ISO), o según el libro si es None.
+
+    Devuelve (foto usada, {product_id: stock}); la foto es None si `at` es
+    anterior a la primera, cuando todavía no había libro de movimientos.
+    """
+    snapshot = latest_snapshot(conn, at)
+    if snapshot is None:
+        return None, {}
+    product_filter, product_params = "", []
+    if product_ids is not None:
+        product_filter = f" AND product_id IN ({','.join('?' for _ in product_ids)})"
+        product_params = list(product_ids)
+    time_filter, time_params = "", []
+    if at is not None:
+        time_filter, time_params = " AND ts <= ?", [at]
+    rows = conn.execute(
+        f"""
+        SELECT product_id, SUM(stock) AS stock FROM (
+            SELECT product_id, stock FROM stock_snapshots WHERE snapshot_id = ?{product_filter}
+            UNION ALL
+            SELECT product_id, SUM(qty) FROM stock_movements
+            WHERE id > ?{product_filter}{time_filter}
+            GROUP BY product_id
+        )
+        GROUP BY product_id
+        """,
+        [snapshot["id"], *product_params, snapshot["last_movement_id"], *product_params, *time_params]
+    ).fetchall()
+    return snapshot, {r["product_id"]: r["stock"] for r in rows}
+
+
+def reconcile_stock(conn):
+    # Diferencias entre inventory.stock y lo que dice el libro (foto + movimientos)
+    snapshot, ledger = stock_at(conn)
+    if snapshot is None:
+        return None, []
+    mismatches = []
+    for row in conn.execute("SELECT id, name, stock FROM inventory ORDER BY name, id"):
+        expected = ledger.pop(row["id"], 0)
+        if expected != row["stock"]:
+            mismatches.append({"id": row["id"], "name": row["name"], "stock": row["stock"], "ledger": expected})
+    # Productos borrados cuyo saldo en el libro no quedó en 0
+    mismatches.extend(
+        {"id": pid, "name": None, "stock": 0, "ledger": qty} for pid, qty in ledger.items() if qty
+    )
+    return snapshot, mismatches
+
+
+class StockSnapshotter:
+    """Toma la foto diaria en segundo plano la primera vez que se la pide después de vencida."""
+
+    def __init__(self, get_pool, interval=STOCK_SNAPSHOT_INTERVAL):
+        self.get_pool = get_pool
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._next_due = None
+        self._running = False
+        self.taken = 0
+        self.failures = 0
+
+    def maybe_take(self, wait=False):
+        with self._lock:
+            if self._running or (self._next_due is not None and datetime.now() < self._next_due):
+                return
+            self._running = True
+        if wait:
+            self._run()
+        else:
+            threading.Thread(target=self._run, name="stock-snapshot", daemon=True).start()
+
+    def _run(self):
+        pool = self.get_pool()
+        conn = pool.acquire()
+        try:
+            # Otro proceso pudo haberla tomado: se mira la última en la base
+            last = latest_snapshot(conn)
+            if last is None or datetime.fromisoformat(last["taken_at"]) + self.interval <= datetime.now():
+                last = take_snapshot(conn)
+                self.taken += 1
+            next_due = datetime.fromisoformat(last["taken_at"]) + self.interval
+        except Exception:
+            self.failures += 1
+            next_due = datetime.now() + timedelta(minutes=5)
+        finally:
+            pool.release(conn)
+        with self._lock:
+            self._next_due = next_due
+            self._running = False
+
+    def stats(self):
+        return {
+            "next_due": self._next_due.isoformat() if self._next_due else None,
+            "taken": self.taken,
+            "failures": self.failures,
+        }
@@ -1,40 +1,44 @@
-from app import app, INVENTORY, RECEIPTS
-with app.test_client() as c:
+import pytest
+
+import app as farmasys
+
+
+def test_checkout_creates_receipts(scratch_db):
+    c = farmasys.app.test_client()
     # Simular sesión autenticada
     with c.session_transaction() as sess:
-        sess['user'] = {'username': 'admin'}
-
-    # Elegir un producto válido del inventario
-    if not INVENTORY:
-        print('No hay productos en INVENTORY')
-    else:
-        p = INVENTORY[0]
-        items = [{'id': p['id'], 'name': p['name'], 'price': p['price'], 'qty': 1}]
-
-        # Crear primera venta
-        rv1 = c.post('/api/checkout', json={'items': items})
-        print('Checkout1 Status:', rv1.status_code)
-        print('Checkout1 Response:', rv1.get_data(as_text=True))
-
-        # Crear segunda venta
-        rv2 = c.post('/api/checkout', json={'items': items})
-        print('Checkout2 Status:', rv2.status_code)
-        print('Checkout2 Response:', rv2.get_data(as_text=True))
-
-        print('Receipts count:', len(RECEIPTS))
-        # List receipts page
-        rlist = c.get('/receipts')
-        print('/receipts status:', rlist.status_code)
-        html = rlist.get_data(as_text=True)
-        print('/receipts snippet:')
-        print(html[:800])
-
-        if RECEIPTS:
-            rid = RECEIPTS[0]['id']
-            print('Last receipt id:', rid)
-            # Now request the receipt page for last receipt
-            r2 = c.get(f'/receipt/{rid}')
-            print('/receipt status:', r2.status_code)
-            data = r2.get_data(as_text=True)
-            print('/receipt snippet:')
-            print(data[:1000])
+        sess['user'] = {'username': 'admin', 'role': 'admin'}
+
+    # Elegir un producto con stock del inventario
+    products = [p for p in c.get('/api/inventory?limit=20').get_json()['items'] if p['stock'] > 0]
+    assert products, 'No hay productos en el inventario'
+    p = products[0]
+    items = [{'id': p['id'], 'qty': 1}]
+
+    # Crear dos ventas
+    rv1 = c.post('/api/checkout', json={'items': items})
+    print('Checkout1:', rv1.status_code, rv1.get_data(as_text=True))
+    assert rv1.status_code == 200
+    rv2 = c.post('/api/checkout', json={'items': items})
+    print('Checkout2:', rv2.status_code, rv2.get_data(as_text=True))
+    assert rv2.status_code == 200
+
+    after = c.get(f"/api/inventory/by-sku/{p['sku']}").get_json()
+    assert after['item']['stock'] == p['stock'] - 2
+
+    # El listado de recibos trae primero la venta más reciente
+    receipts = c.get('/api/receipts').get_json()['receipts']
+    print('Receipts count:', len(receipts))
+    assert [r['id'] for r in receipts[:2]] == [rv2.get_json()['receipt_id'], rv1.get_json()['receipt_id']]
+    assert c.get('/receipts').status_code == 200
+
+    # Página del último recibo
+    rid = receipts[0]['id']
+    r2 = c.get(f'/receipt/{rid}')
+    print('/receipt status:', r2.status_code)
+    assert r2.status_code == 200
+    assert p['name'] in r2.get_data(as_text=True)
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-s"]))
@@ -0,0 +1,104 @@
+import os
+import threading
+import time
+
+import pytest
+
+import app as farmasys
+
+THREADS = int(os.environ.get("STRESS_THREADS", 8))
+CHECKOUTS_PER_THREAD = int(os.environ.get("STRESS_CHECKOUTS", 25))
+INITIAL_STOCK = 200
+# SQLite admite un solo escritor y el GIL serializa el resto: más hilos no
+# multiplican las ventas por segundo, pero el total no puede desplomarse
+MIN_THROUGHPUT_RATIO = float(os.environ.get("STRESS_MIN_RATIO", 0.7))
+
+
+def set_stock(stock):
+    conn = farmasys.get_pool().acquire()
+    try:
+        conn.execute("UPDATE inventory SET stock = ?", (stock,))
+        conn.commit()
+    finally:
+        farmasys.get_pool().release(conn)
+
+
+def run_stress(threads):
+    results = {"ok": 0, "rejected": 0, "errors": []}
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+
+    def worker(n):
+        client = farmasys.app.test_client()
+        with client.session_transaction() as sess:
+            sess["user"] = {"username": "admin", "role": "admin"}
+        barrier.wait()
+        for i in range(CHECKOUTS_PER_THREAD):
+            # Todos compiten por los mismos dos productos para forzar contención
+            items = [{"id": "1", "qty": 1 + (n + i) % 3}, {"id": "5", "qty": 1}]
+            rv = client.post("/api/checkout", json={"items": items})
+            with lock:
+                if rv.status_code == 200:
+                    results["ok"] += 1
+                elif rv.status_code == 400 and "Stock insuficiente" in rv.get_json()["error"]:
+                    results["rejected"] += 1
+                else:
+                    results["errors"].append((rv.status_code, rv.get_data(as_text=True)))
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    results["seconds"] = time.perf_counter() - started
+    return results
+
+
+def test_concurrent_checkout_never_oversells(scratch_db):
+    set_stock(INITIAL_STOCK)
+    results = run_stress(THREADS)
+    assert not results["errors"], results["errors"][:3]
+    assert results["ok"] + results["rejected"] == THREADS * CHECKOUTS_PER_THREAD
+    assert results["rejected"] > 0
+
+    conn = farmasys.get_pool().acquire()
+    try:
+        stock = {r["id"]: r["stock"] for r in conn.execute("SELECT id, stock FROM inventory")}
+        sold = {
+            r["product_id"]: r["qty"] for r in conn.execute(
+                "SELECT product_id, SUM(qty) AS qty FROM receipt_items GROUP BY product_id"
+            )
+        }
+        receipts = conn.execute("SELECT COUNT(*) FROM receipts").fetchone()[0]
+    finally:
+        farmasys.get_pool().release(conn)
+
+    assert min(stock.values()) >= 0
+    assert stock["1"] == INITIAL_STOCK - sold["1"]
+    assert stock["5"] == INITIAL_STOCK - sold["5"]
+    assert receipts == results["ok"]
+
+    print(
+        f"\n{THREADS} hilos x {CHECKOUTS_PER_THREAD} ventas: {results['ok']} ok, "
+        f"{results['rejected']} sin stock, "
+        f"{THREADS * CHECKOUTS_PER_THREAD / results['seconds']:.0f} ventas/s"
+    )
+
+
+def test_checkout_throughput_by_threads(scratch_db):
+    # Stock de sobra: todas las ventas se completan y se mide solo el checkout
+    set_stock(10 ** 6)
+    run_stress(1)
+    throughput = {}
+    for threads in (1, THREADS):
+        results = run_stress(threads)
+        assert not results["errors"], results["errors"][:3]
+        assert results["ok"] == threads * CHECKOUTS_PER_THREAD
+        throughput[threads] = results["ok"] / results["seconds"]
+        print(f"\n{threads} hilo(s): {throughput[threads]:.0f} ventas/s")
+    assert throughput[THREADS] >= throughput[1] * MIN_THROUGHPUT_RATIO, throughput
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-s"]))
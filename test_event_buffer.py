@@ -0,0 +1,56 @@
+import pytest
+
+import app as farmasys
+from db_pool import PoolTimeoutError
+from event_buffer import EventBuffer
+
+
+class BusyPool:
+    def acquire(self):
+        raise PoolTimeoutError("No hay conexiones libres en el pool")
+
+    def release(self, conn):
+        raise AssertionError("No se entregó ninguna conexión")
+
+
+def test_flush_keeps_events_when_pool_is_busy():
+    buffer = EventBuffer(lambda: BusyPool())
+    buffer._ensure_thread = lambda: None
+    buffer.record_login(1, "2026-01-01T10:00:00")
+    buffer.audit("product_deleted", "admin", "product", "p1")
+    assert buffer.stats()["pending"] == 2
+
+    with pytest.raises(PoolTimeoutError):
+        buffer.flush()
+    assert buffer.stats()["pending"] == 2
+    assert buffer.stats()["failures"] == 1
+
+
+def test_flush_keeps_events_when_pool_cannot_open():
+    def broken_pool():
+        raise RuntimeError("sin base")
+
+    buffer = EventBuffer(broken_pool)
+    buffer._ensure_thread = lambda: None
+    buffer.audit("user_created", "admin", "user", 7)
+    with pytest.raises(RuntimeError):
+        buffer.flush()
+    assert buffer.stats()["pending"] == 1
+
+
+def test_flush_writes_after_pool_recovers(scratch_db):
+    busy = [True]
+    buffer = EventBuffer(lambda: BusyPool() if busy[0] else farmasys.get_pool())
+    buffer._ensure_thread = lambda: None
+    buffer.audit("product_deleted", "admin", "product", "p1")
+    with pytest.raises(PoolTimeoutError):
+        buffer.flush()
+
+    busy[0] = False
+    assert buffer.flush() == 1
+    conn = farmasys.get_pool().acquire()
+    try:
+        row = conn.execute("SELECT actor, action, target_id FROM audit_log WHERE action = 'product_deleted'").fetchone()
+    finally:
+        farmasys.get_pool().release(conn)
+    assert tuple(row) == ("admin", "product_deleted", "p1")
@@ -0,0 +1,32 @@
+import json
+
+import app as farmasys
+import exports
+
+
+def test_export_pages_by_key_and_releases_connection(scratch_db, monkeypatch):
+    c = farmasys.app.test_client()
+    with c.session_transaction() as sess:
+        sess['user'] = {'username': 'admin', 'role': 'admin'}
+    p = [p for p in c.get('/api/inventory?limit=20').get_json()['items'] if p['stock'] > 0][0]
+    for _ in range(5):
+        assert c.post('/api/checkout', json={'items': [{'id': p['id'], 'qty': 1}]}).status_code == 200
+
+    pool = farmasys.get_pool(readonly=True)
+    conn = pool.acquire()
+    try:
+        expected = [r["id"] for r in conn.execute("SELECT id FROM receipts ORDER BY datetime, id")]
+        products = conn.execute("SELECT COUNT(*) FROM inventory").fetchone()[0]
+    finally:
+        pool.release(conn)
+
+    monkeypatch.setattr(exports, "EXPORT_CHUNK_ROWS", 2)
+    ids = []
+    for chunk in exports.stream_export(pool, "receipts", "ndjson"):
+        # Mientras el cliente lee un bloque la conexión ya volvió al pool
+        assert pool.stats()["in_use"] == 0
+        ids += [json.loads(line)["id"] for line in chunk.decode("utf-8").splitlines()]
+    assert ids == expected
+
+    lines = b"".join(exports.stream_export(pool, "inventory", "csv")).decode("utf-8").splitlines()
+    assert len(lines) == products + 1
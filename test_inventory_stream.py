@@ -0,0 +1,58 @@
+import sqlite3
+
+import pytest
+
+import app as farmasys
+from db_pool import PoolTimeoutError
+from inventory_stream import InventoryHub, StreamUnavailable
+from server import FarmasysServer
+
+
+def test_watcher_survives_read_errors(scratch_db):
+    hub = InventoryHub(lambda: farmasys.get_pool(readonly=True), 4, poll_interval=0.05)
+    events = hub.subscribe(heartbeat=5)
+    stream = iter(events)
+    try:
+        assert next(stream).startswith(b"retry:")
+        assert b"event: ready" in next(stream)
+
+        # La próxima lectura del vigía falla como si el pool estuviera ocupado
+        read = hub._read
+        calls = []
+
+        def flaky_read(since):
+            calls.append(since)
+            if len(calls) == 1:
+                raise PoolTimeoutError("No hay conexiones libres en el pool")
+            return read(since)
+
+        hub._read = flaky_read
+        other = sqlite3.connect(scratch_db)
+        other.execute("UPDATE inventory SET stock = 77 WHERE id = (SELECT MIN(id) FROM inventory)")
+        other.commit()
+        other.close()
+        hub.notify()
+
+        event = next(stream)
+        assert b"event: stock" in event
+        assert b'"stock":77' in event
+        assert hub.stats()["failures"] == 1
+        assert hub._thread.is_alive()
+    finally:
+        events.close()
+        hub.close()
+
+
+def test_stream_slots_bound_threads_and_subscribers(scratch_db):
+    pytest.importorskip("waitress")
+    hub = InventoryHub(lambda: farmasys.get_pool(readonly=True), 256)
+    server = FarmasysServer(farmasys.app, port=0, threads=2, stream_slots=1, stream_hub=hub).start()
+    try:
+        assert len(server.server.task_dispatcher.threads) == 3
+        events = hub.subscribe()
+        with pytest.raises(StreamUnavailable):
+            hub.subscribe()
+        events.close()
+    finally:
+        server.shutdown(1)
+        hub.close()
@@ -0,0 +1,67 @@
+import json
+
+import app as farmasys
+from receipt_archive import ReceiptArchive
+
+
+def all_receipts(c, limit=2):
+    receipts, cursor = [], None
+    while True:
+        page = c.get(f"/api/receipts?limit={limit}" + (f"&cursor={cursor}" if cursor else "")).get_json()
+        receipts += page["receipts"]
+        cursor = page["next_cursor"]
+        if not cursor:
+            return receipts
+
+
+def exported(c):
+    lines = c.get("/api/export/receipts?format=ndjson").get_data(as_text=True).splitlines()
+    return sorted(json.loads(line)["id"] for line in lines)
+
+
+def test_archive_round_trip(scratch_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(farmasys, "receipt_archive", ReceiptArchive(str(tmp_path / "archive")))
+    c = farmasys.app.test_client()
+    with c.session_transaction() as sess:
+        sess['user'] = {'username': 'admin', 'role': 'admin'}
+    p = [p for p in c.get('/api/inventory?limit=20').get_json()['items'] if p['stock'] > 0][0]
+    ids = [c.post('/api/checkout', json={'items': [{'id': p['id'], 'qty': 1}]}).get_json()['receipt_id']
+           for _ in range(4)]
+
+    # Dos recibos viejos, en años distintos, y una columna que no está en el esquema base
+    pool = farmasys.get_pool()
+    conn = pool.acquire()
+    try:
+        conn.execute("ALTER TABLE receipts ADD COLUMN cash_register_id TEXT")
+        for rid, day in ((ids[0], "2023-06-01"), (ids[1], "2024-03-10")):
+            conn.execute(
+                "UPDATE receipts SET datetime = ?, sale_date = ?, cash_register_id = 'caja-2' WHERE id = ?",
+                (day + "T10:00:00", day, rid)
+            )
+        conn.commit()
+    finally:
+        pool.release(conn)
+
+    before = all_receipts(c)
+    before_export = exported(c)
+    kpis = c.get('/api/kpis').get_json()
+
+    conn = pool.acquire()
+    try:
+        moved = farmasys.receipt_archive.archive(conn, 30, "year")
+        assert [(m["period"], m["receipts"]) for m in moved] == [("2023", 1), ("2024", 1)]
+        assert conn.execute("SELECT COUNT(*) FROM receipts").fetchone()[0] == 2
+        # Repetir no mueve nada más
+        assert farmasys.receipt_archive.archive(conn, 30, "year") == []
+        archived = farmasys.receipt_archive.load_receipt(conn, ids[1])
+    finally:
+        pool.release(conn)
+    assert archived["cash_register_id"] == "caja-2"
+    assert archived["items"][0]["name"] == p["name"]
+
+    assert all_receipts(c) == before
+    assert exported(c) == before_export
+    assert c.get('/api/kpis').get_json() == kpis
+    r = c.get(f"/receipt/{ids[0]}")
+    assert r.status_code == 200
+    assert p["name"] in r.get_data(as_text=True)
@@ -0,0 +1,28 @@
+import app as farmasys
+from receipt_render import receipt_etag
+
+
+def test_receipt_caching_headers(scratch_db):
+    c = farmasys.app.test_client()
+    with c.session_transaction() as sess:
+        sess['user'] = {'username': 'admin', 'role': 'admin'}
+    p = [p for p in c.get('/api/inventory?limit=20').get_json()['items'] if p['stock'] > 0][0]
+    rid = c.post('/api/checkout', json={'items': [{'id': p['id'], 'qty': 1}]}).get_json()['receipt_id']
+
+    # La página HTML se revalida siempre: un cambio de plantilla cambia su ETag
+    html = c.get(f"/receipt/{rid}")
+    assert html.status_code == 200
+    assert "immutable" not in html.headers["Cache-Control"]
+    assert "no-cache" in html.headers["Cache-Control"]
+    assert c.get(f"/receipt/{rid}", headers={"If-None-Match": html.headers["ETag"]}).status_code == 304
+
+    escpos = c.get(f"/receipt/{rid}/escpos")
+    assert escpos.status_code == 200
+    assert "immutable" in escpos.headers["Cache-Control"]
+    assert c.get(f"/receipt/{rid}/escpos", headers={"If-None-Match": escpos.headers["ETag"]}).status_code == 304
+
+    # Un ID inexistente es 404 aunque el ETag coincida con el que tendría
+    missing = "no-existe"
+    etag = f'"{receipt_etag(missing, "escpos")}"'
+    assert c.get(f"/receipt/{missing}/escpos", headers={"If-None-Match": etag}).status_code == 404
+    assert c.get(f"/receipt/{missing}", headers={"If-None-Match": "*"}).status_code == 404
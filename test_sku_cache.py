@@ -0,0 +1,27 @@
+import sqlite3
+
+import app as farmasys
+from sku_cache import SkuCache, lookup_skus
+
+
+def test_external_writes_invalidate_cached_skus(scratch_db):
+    pool = farmasys.get_pool(readonly=True)
+    conn = pool.acquire()
+    try:
+        cache = SkuCache()
+        first, second = [dict(r) for r in conn.execute("SELECT sku, price FROM inventory ORDER BY sku LIMIT 2")]
+        lookup_skus(lambda: conn, cache, [first["sku"], second["sku"]])
+
+        # Otro proceso (p. ej. flask import-inventory) cambia un precio
+        other = sqlite3.connect(scratch_db)
+        other.execute("UPDATE inventory SET price = price + 10 WHERE sku = ?", (first["sku"],))
+        other.commit()
+        other.close()
+
+        found = lookup_skus(lambda: conn, cache, [first["sku"], second["sku"]])
+        assert found[first["sku"]]["price"] == first["price"] + 10
+        assert found[second["sku"]]["price"] == second["price"]
+        # Solo se descartó la fila cambiada
+        assert cache.stats()["hits"] == 1
+    finally:
+        pool.release(conn)
@@ -0,0 +1,115 @@
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import app as farmasys
+from stock_ledger import StockError, apply_movement, reconcile_stock, stock_at, take_snapshot
+
+
+@pytest.fixture
+def conn(scratch_db):
+    pool = farmasys.get_pool()
+    conn = pool.acquire()
+    try:
+        yield conn
+    finally:
+        pool.release(conn)
+
+
+def first_product(conn):
+    return dict(conn.execute("SELECT id, stock FROM inventory ORDER BY id LIMIT 1").fetchone())
+
+
+def mark():
+    # Separa las marcas de tiempo de los movimientos que las rodean
+    time.sleep(0.01)
+    at = datetime.now().isoformat()
+    time.sleep(0.01)
+    return at
+
+
+def test_movements_are_append_only(conn):
+    p = first_product(conn)
+    apply_movement(conn, p["id"], 5, "receipt", actor="admin")
+    count = conn.execute("SELECT COUNT(*) FROM stock_movements").fetchone()[0]
+    with pytest.raises(sqlite3.DatabaseError):
+        conn.execute("UPDATE stock_movements SET qty = 1")
+    conn.rollback()
+    with pytest.raises(sqlite3.DatabaseError):
+        conn.execute("DELETE FROM stock_movements")
+    conn.rollback()
+    assert conn.execute("SELECT COUNT(*) FROM stock_movements").fetchone()[0] == count
+
+
+def test_apply_movement_validates(conn):
+    p = first_product(conn)
+    assert apply_movement(conn, p["id"], 3, "return") == p["stock"] + 3
+    assert apply_movement(conn, "no-existe", 3, "receipt") is None
+    with pytest.raises(StockError):
+        apply_movement(conn, p["id"], -(p["stock"] + 4), "adjustment")
+    with pytest.raises(StockError):
+        apply_movement(conn, p["id"], 1, "sale")
+    stock = conn.execute("SELECT stock FROM inventory WHERE id = ?", (p["id"],)).fetchone()[0]
+    assert stock == p["stock"] + 3
+
+
+def test_stock_at_across_snapshot_boundary(conn):
+    p = first_product(conn)
+    before = mark()
+    apply_movement(conn, p["id"], 5, "receipt")
+    after_receipt = mark()
+    take_snapshot(conn)
+    after_snapshot = mark()
+    apply_movement(conn, p["id"], -2, "adjustment")
+
+    def at(when):
+        return stock_at(conn, when, [p["id"]])[1][p["id"]]
+
+    assert at(before) == p["stock"]
+    assert at(after_receipt) == p["stock"] + 5
+    # Desde la foto nueva: el ingreso ya está incluido y no se suma dos veces
+    assert at(after_snapshot) == p["stock"] + 5
+    assert at(None) == p["stock"] + 3
+
+
+def test_reconcile_finds_drift(conn):
+    p = first_product(conn)
+    apply_movement(conn, p["id"], 2, "receipt")
+    assert reconcile_stock(conn)[1] == []
+
+    conn.execute("UPDATE inventory SET stock = stock + 7 WHERE id = ?", (p["id"],))
+    conn.commit()
+    _, mismatches = reconcile_stock(conn)
+    assert [(m["id"], m["stock"] - m["ledger"]) for m in mismatches] == [(p["id"], 7)]
+
+
+def test_old_daily_snapshots_are_pruned_to_monthly(conn):
+    opening = conn.execute("SELECT id FROM stock_snapshot_runs").fetchone()[0]
+    conn.execute("DELETE FROM stock_snapshot_runs WHERE id = ?", (opening,))
+    conn.execute("DELETE FROM stock_snapshots WHERE snapshot_id = ?", (opening,))
+    start = datetime.now() - timedelta(days=120)
+    for day in range(120):
+        run = conn.execute(
+            "INSERT INTO stock_snapshot_runs (taken_at, last_movement_id) VALUES (?, 0)",
+            ((start + timedelta(days=day)).isoformat(),)
+        ).lastrowid
+        conn.execute("INSERT INTO stock_snapshots (snapshot_id, product_id, stock) SELECT ?, id, stock FROM inventory",
+                     (run,))
+    conn.commit()
+
+    snapshot = take_snapshot(conn, keep_days=35)
+    runs = [r[0] for r in conn.execute("SELECT taken_at FROM stock_snapshot_runs ORDER BY id")]
+    cutoff = (datetime.now() - timedelta(days=35)).isoformat()
+    old = [t for t in runs if t < cutoff]
+    # Antes del corte, una foto por mes; después, todas las diarias
+    assert len(old) == len({t[:7] for t in old})
+    assert len(runs) - len(old) >= 35
+    assert snapshot["pruned"] == 121 - len(runs)
+    orphans = conn.execute(
+        "SELECT COUNT(*) FROM stock_snapshots WHERE snapshot_id NOT IN (SELECT id FROM stock_snapshot_runs)"
+    ).fetchone()[0]
+    assert orphans == 0
+    # Una fecha vieja sigue resolviéndose con la foto mensual anterior
+    assert stock_at(conn, (start + timedelta(days=20, hours=1)).isoformat())[0] is not None